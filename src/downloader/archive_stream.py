@@ -0,0 +1,302 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+import hashlib
+import lzma
+import os
+import struct
+import tarfile
+import time
+import zlib
+from typing import Any, Callable, Dict, List, Optional, Set
+
+stream_chunk_size = 64 * 1024
+downloader_extracting_postfix = '._downloader_extracting'
+streamable_archive_formats = {'.zip': 'zip', '.tar.gz': 'tar.gz', '.tgz': 'tar.gz', '.tar.xz': 'tar.xz', '.txz': 'tar.xz'}
+
+_local_file_header = struct.Struct('<IHHHHHIIIHH')
+_local_file_header_signature = 0x04034b50
+_data_descriptor_signature = 0x08074b50
+_flag_encrypted = 0x1
+_flag_data_descriptor = 0x8
+_method_stored = 0
+_method_deflated = 8
+_zip64_extra_id = 0x0001
+
+
+class ArchiveStreamError(Exception): pass
+class UnsupportedArchiveStreamError(ArchiveStreamError): pass
+class ArchiveStreamHashError(ArchiveStreamError): pass
+
+
+def archive_format(url: str) -> Optional[str]:
+    path = url.split('?', 1)[0].split('#', 1)[0].lower()
+    for suffix, archive_format_name in streamable_archive_formats.items():
+        if path.endswith(suffix):
+            return archive_format_name
+    return None
+
+
+class ArchiveStreamReader:
+    """Reads an incoming stream once, hashing every byte, and lets the parsers push back what they read too far."""
+
+    def __init__(self, in_stream: Any, on_read: Optional[Callable[[int], None]] = None):
+        self._in_stream = in_stream
+        self._on_read = on_read
+        self._pending = b''
+        self.md5 = hashlib.md5()
+        self.size = 0
+        self.read_seconds = 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        if self._pending:
+            if size < 0 or size >= len(self._pending):
+                data, self._pending = self._pending, b''
+                return data + (self.read(size - len(data)) if size > len(data) else b'')
+            data, self._pending = self._pending[:size], self._pending[size:]
+            return data
+
+        start = time.monotonic()
+        data = self._in_stream.read(stream_chunk_size if size < 0 else size)
+        self.read_seconds += time.monotonic() - start
+        if data:
+            self.md5.update(data)
+            self.size += len(data)
+            if self._on_read is not None:
+                self._on_read(self.size)
+        return data
+
+    def read_exactly(self, size: int) -> bytes:
+        chunks = []
+        while size > 0:
+            data = self.read(size)
+            if not data:
+                raise ArchiveStreamError('Unexpected end of archive')
+            chunks.append(data)
+            size -= len(data)
+        return b''.join(chunks)
+
+    def unread(self, data: bytes) -> None:
+        self._pending = data + self._pending
+
+    def drain(self) -> None:
+        self._pending = b''
+        while self.read(stream_chunk_size):
+            pass
+
+
+def extract_archive_stream(reader: ArchiveStreamReader, archive_format_name: str, targets: Dict[str, str], is_unchanged: Callable[[str, int, int], bool], expected_md5: Optional[str] = None) -> Set[str]:
+    """Writes the archive members found in targets (member name -> target path) while the archive arrives.
+    Every member is written next to its target, and none replaces its target until the whole archive
+    has been read and, when expected_md5 is given, its hash matches. Otherwise all of them are discarded.
+    Zip members for which is_unchanged(target, size, crc) holds are not written at all.
+    Returns the member names that were written or were already up-to-date."""
+    if archive_format_name not in ('zip', 'tar.gz', 'tar.xz'):
+        raise UnsupportedArchiveStreamError(f'Archive format "{archive_format_name}" can not be streamed')
+
+    staged = []
+    try:
+        if archive_format_name == 'zip':
+            found = _extract_zip_stream(reader, targets, is_unchanged, staged)
+        else:
+            found = _extract_tar_stream(reader, archive_format_name, targets, staged)
+
+        reader.drain()
+        md5 = reader.md5.hexdigest()
+        if expected_md5 is not None and md5 != expected_md5:
+            raise ArchiveStreamHashError(f'Bad archive hash ({expected_md5} != {md5})')
+    except BaseException as e:
+        for writer in staged:
+            writer.abort()
+        raise e
+
+    for writer in staged:
+        writer.install()
+    return found
+
+
+def _extract_zip_stream(reader: ArchiveStreamReader, targets: Dict[str, str], is_unchanged: Callable[[str, int, int], bool], staged: List['_MemberWriter']) -> Set[str]:
+    found = set()
+    while True:
+        header = reader.read_exactly(4)
+        if struct.unpack('<I', header)[0] != _local_file_header_signature:
+            return found  # Central directory reached, everything else is metadata.
+
+        _, _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = _local_file_header.unpack(header + reader.read_exactly(_local_file_header.size - 4))
+        name = reader.read_exactly(name_length).decode('utf-8' if flags & 0x800 else 'cp437')
+        extra = reader.read_exactly(extra_length)
+        if flags & _flag_encrypted:
+            raise UnsupportedArchiveStreamError(f'Encrypted member {name}')
+        if method not in (_method_stored, _method_deflated):
+            raise UnsupportedArchiveStreamError(f'Compression method {method} of member {name}')
+
+        has_descriptor = bool(flags & _flag_data_descriptor)
+        zip64 = compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF
+        if zip64:
+            size, compressed_size = _zip64_sizes(extra, size, compressed_size)
+        if has_descriptor and method == _method_stored:
+            raise UnsupportedArchiveStreamError(f'Stored member {name} has no size in its local header')
+
+        target = targets.get(name, None)
+        if not has_descriptor and (target is None or is_unchanged(target, size, crc)):
+            _skip(reader, compressed_size)
+            if target is not None:
+                found.add(name)
+            continue
+
+        writer = _DiscardingWriter() if target is None else _MemberWriter(target)
+        try:
+            if method == _method_stored:
+                _copy_stored(reader, compressed_size, writer)
+            else:
+                _inflate(reader, None if has_descriptor else compressed_size, writer)
+
+            if has_descriptor:
+                crc, size = _read_data_descriptor(reader, zip64)
+
+            writer.finish(crc, size)
+        except BaseException as e:
+            writer.abort()
+            raise e
+
+        if target is not None:
+            staged.append(writer)
+            found.add(name)
+
+
+def _zip64_sizes(extra: bytes, size: int, compressed_size: int):
+    position = 0
+    while position + 4 <= len(extra):
+        header_id, data_size = struct.unpack('<HH', extra[position:position + 4])
+        data = extra[position + 4:position + 4 + data_size]
+        if header_id == _zip64_extra_id:
+            values = list(struct.unpack('<%dQ' % (len(data) // 8), data[:len(data) // 8 * 8]))
+            if size == 0xFFFFFFFF and values:
+                size = values.pop(0)
+            if compressed_size == 0xFFFFFFFF and values:
+                compressed_size = values.pop(0)
+            return size, compressed_size
+        position += 4 + data_size
+    raise ArchiveStreamError('Missing zip64 sizes')
+
+
+def _read_data_descriptor(reader: ArchiveStreamReader, zip64: bool):
+    data = reader.read_exactly(4)
+    if struct.unpack('<I', data)[0] != _data_descriptor_signature:
+        reader.unread(data)
+    if zip64:
+        crc, _, size = struct.unpack('<IQQ', reader.read_exactly(20))
+    else:
+        crc, _, size = struct.unpack('<III', reader.read_exactly(12))
+    return crc, size
+
+
+def _skip(reader: ArchiveStreamReader, size: int) -> None:
+    while size > 0:
+        data = reader.read(min(size, stream_chunk_size))
+        if not data:
+            raise ArchiveStreamError('Unexpected end of archive')
+        size -= len(data)
+
+
+def _copy_stored(reader: ArchiveStreamReader, size: int, writer: '_MemberWriter') -> None:
+    while size > 0:
+        data = reader.read(min(size, stream_chunk_size))
+        if not data:
+            raise ArchiveStreamError('Unexpected end of archive')
+        writer.write(data)
+        size -= len(data)
+
+
+def _inflate(reader: ArchiveStreamReader, compressed_size: Optional[int], writer: '_MemberWriter') -> None:
+    decompressor = zlib.decompressobj(-15)
+    remaining = compressed_size
+    while not decompressor.eof:
+        data = reader.read(stream_chunk_size if remaining is None else min(remaining, stream_chunk_size))
+        if not data:
+            raise ArchiveStreamError('Unexpected end of archive')
+        if remaining is not None:
+            remaining -= len(data)
+        writer.write(decompressor.decompress(data))
+    writer.write(decompressor.flush())
+    if decompressor.unused_data:
+        reader.unread(decompressor.unused_data)
+
+
+class _MemberWriter:
+    def __init__(self, target: str):
+        self._target = target
+        self._stage = target + downloader_extracting_postfix
+        self._crc = 0
+        self._size = 0
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        self._file = open(self._stage, 'wb')
+
+    def write(self, data: bytes) -> None:
+        if not data:
+            return
+        self._crc = zlib.crc32(data, self._crc)
+        self._size += len(data)
+        self._file.write(data)
+
+    def finish(self, crc: Optional[int], size: int) -> None:
+        self._file.close()
+        if (crc is not None and self._crc != crc) or self._size != size:
+            raise ArchiveStreamError(f'Bad CRC on {self._target}')
+
+    def install(self) -> None:
+        os.replace(self._stage, self._target)
+
+    def abort(self) -> None:
+        self._file.close()
+        try:
+            os.unlink(self._stage)
+        except FileNotFoundError:
+            pass
+
+
+class _DiscardingWriter:
+    def write(self, data: bytes) -> None: pass
+    def finish(self, crc: Optional[int], size: int) -> None: pass
+    def abort(self) -> None: pass
+
+
+def _extract_tar_stream(reader: ArchiveStreamReader, archive_format_name: str, targets: Dict[str, str], staged: List['_MemberWriter']) -> Set[str]:
+    found = set()
+    try:
+        with tarfile.open(fileobj=reader, mode='r|gz' if archive_format_name == 'tar.gz' else 'r|xz') as tar:
+            for member in tar:
+                name = member.name[2:] if member.name.startswith('./') else member.name
+                if name not in targets or not member.isfile():
+                    continue
+
+                writer = _MemberWriter(targets[name])
+                try:
+                    source = tar.extractfile(member)
+                    data = source.read(stream_chunk_size)
+                    while data:
+                        writer.write(data)
+                        data = source.read(stream_chunk_size)
+                    writer.finish(None, member.size)
+                except BaseException as e:
+                    writer.abort()
+                    raise e
+                staged.append(writer)
+                found.add(name)
+    except (tarfile.TarError, EOFError, zlib.error, lzma.LZMAError) as e:
+        raise ArchiveStreamError(str(e)) from e
+    return found
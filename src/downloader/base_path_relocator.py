@@ -92,9 +92,10 @@ class BasePathRelocatorPackage:
         self._logger.print()
 
         old_files = []
+        source_hashes = self._from_file_system.hash_many([file for file, _ in files_to_relocate])
         for (file, description) in files_to_relocate:
             source_path = self._from_file_system.download_target_path(file)
-            source_hash = self._from_file_system.hash(file)
+            source_hash = source_hashes[file]
 
             self._logger.print('Relocated: %s ' % file, end='', flush=True)
 
@@ -0,0 +1,85 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+import ssl
+
+import json
+import os
+import threading
+from typing import List, Dict, Any
+
+from downloader.job_system import JobTracer, TraceEvent
+from downloader.logger import Logger
+
+
+_phases = {'started': 'B', 'finished': 'E'}
+
+
+class ChromeTraceRecorder(JobTracer):
+    """Keeps the job events in memory and exports them in the Chrome trace-event format (chrome://tracing, Perfetto)."""
+
+    def __init__(self, logger: Logger):
+        self._logger = logger
+        self._lock = threading.Lock()
+        self._events: List[TraceEvent] = []
+
+    def record(self, event: TraceEvent) -> None:
+        with self._lock:
+            self._events.append(event)
+
+    def trace_events(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            events = list(self._events)
+
+        if len(events) == 0:
+            return []
+
+        origin = events[0].timestamp
+        pid = os.getpid()
+        return [self._trace_event(event, origin, pid) for event in events]
+
+    def export(self, path: str) -> None:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                json.dump({'traceEvents': self.trace_events(), 'displayTimeUnit': 'ms'}, f)
+            self._logger.debug(f'Job trace written to {path}')
+        except OSError as e:
+            self._logger.debug(e)
+
+    @staticmethod
+    def _trace_event(event: TraceEvent, origin: float, pid: int) -> Dict[str, Any]:
+        result = {
+            'name': event.event if event.event not in _phases else event.job_type,
+            'cat': event.lane,
+            'ph': _phases.get(event.event, 'i'),
+            'ts': round((event.timestamp - origin) * 1_000_000),
+            'pid': pid,
+            'tid': event.thread_id,
+        }
+        if result['ph'] == 'i':
+            result['s'] = 't'
+
+        args = {}
+        if event.path is not None:
+            args['path'] = event.path
+        if result['ph'] == 'i':
+            args['job'] = event.job_type
+        if event.size > 0:
+            args['bytes'] = event.size
+        if len(args) > 0:
+            result['args'] = args
+        return result
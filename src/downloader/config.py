@@ -33,7 +33,7 @@ from downloader.constants import FILE_downloader_ini, K_BASE_PATH, K_BASE_SYSTEM
     K_START_TIME, KENV_LOGFILE, K_LOGFILE, K_DOWNLOADER_THREADS_LIMIT, \
     KENV_PC_LAUNCHER, K_IS_PC_LAUNCHER, DEFAULT_UPDATE_LINUX_ENV, STORAGE_PRIORITY_PREFER_SD, \
     STORAGE_PRIORITY_PREFER_EXTERNAL, STORAGE_PRIORITY_OFF, KENV_FORCED_BASE_PATH, K_MINIMUM_SYSTEM_FREE_SPACE_MB, K_MINIMUM_EXTERNAL_FREE_SPACE_MB, DEFAULT_MINIMUM_SYSTEM_FREE_SPACE_MB, \
-    DEFAULT_MINIMUM_EXTERNAL_FREE_SPACE_MB
+    DEFAULT_MINIMUM_EXTERNAL_FREE_SPACE_MB, K_RAM_STAGING_BUDGET_MB, DEFAULT_RAM_STAGING_BUDGET_MB
 from downloader.db_options import DbOptionsKind, DbOptions, DbOptionsValidationException
 from downloader.ini_parser import IniParser
 
@@ -84,7 +84,8 @@ def default_config():
         K_COMMIT: 'unknown',
         K_FAIL_ON_FILE_ERROR: False,
         K_MINIMUM_SYSTEM_FREE_SPACE_MB: DEFAULT_MINIMUM_SYSTEM_FREE_SPACE_MB,
-        K_MINIMUM_EXTERNAL_FREE_SPACE_MB: DEFAULT_MINIMUM_EXTERNAL_FREE_SPACE_MB
+        K_MINIMUM_EXTERNAL_FREE_SPACE_MB: DEFAULT_MINIMUM_EXTERNAL_FREE_SPACE_MB,
+        K_RAM_STAGING_BUDGET_MB: DEFAULT_RAM_STAGING_BUDGET_MB
     }
 
 
@@ -295,6 +296,7 @@ class ConfigReader:
         mister[K_FILTER] = parser.get_string(K_FILTER, result[K_FILTER])
         mister[K_MINIMUM_SYSTEM_FREE_SPACE_MB] = parser.get_int(K_MINIMUM_SYSTEM_FREE_SPACE_MB, result[K_MINIMUM_SYSTEM_FREE_SPACE_MB])
         mister[K_MINIMUM_EXTERNAL_FREE_SPACE_MB] = parser.get_int(K_MINIMUM_EXTERNAL_FREE_SPACE_MB, result[K_MINIMUM_EXTERNAL_FREE_SPACE_MB])
+        mister[K_RAM_STAGING_BUDGET_MB] = parser.get_int(K_RAM_STAGING_BUDGET_MB, result[K_RAM_STAGING_BUDGET_MB])
 
         user_defined = []
         for key in mister:
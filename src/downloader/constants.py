@@ -24,6 +24,7 @@ DEFAULT_CURL_SSL_OPTIONS = '--cacert %s' % DEFAULT_CACERT_FILE
 DEFAULT_UPDATE_LINUX_ENV = 'undefined'
 DEFAULT_MINIMUM_SYSTEM_FREE_SPACE_MB = 512
 DEFAULT_MINIMUM_EXTERNAL_FREE_SPACE_MB = 128
+DEFAULT_RAM_STAGING_BUDGET_MB = 32
 
 # Pre-selected database
 DISTRIBUTION_MISTER_DB_URL = 'https://raw.githubusercontent.com/MiSTer-devel/Distribution_MiSTer/main/db.json.zip'
@@ -61,6 +62,10 @@ FILE_downloader_storage_json = 'Scripts/.config/downloader/downloader.json'
 FILE_downloader_external_storage = '.downloader_db.json'
 FILE_downloader_last_successful_run = 'Scripts/.config/downloader/%s.last_successful_run'
 FILE_downloader_log = 'Scripts/.config/downloader/%s.log'
+FILE_downloader_journal = 'Scripts/.config/downloader/downloader.journal'
+FILE_downloader_trace = 'Scripts/.config/downloader/downloader.trace.json'
+FILE_downloader_hash_cache = 'Scripts/.config/downloader/downloader.hashes.json'
+FILE_downloader_directory_snapshot = 'Scripts/.config/downloader/downloader.dirs.json'
 FILE_downloader_ini = '/media/fat/downloader.ini'
 FILE_downloader_launcher_script = 'Scripts/downloader.sh'
 
@@ -144,6 +149,7 @@ K_START_TIME = 'start_time'
 K_IS_PC_LAUNCHER = 'is_pc_launcher'
 K_MINIMUM_SYSTEM_FREE_SPACE_MB = 'minimum_system_free_space_mb'
 K_MINIMUM_EXTERNAL_FREE_SPACE_MB = 'minimum_external_free_space_mb'
+K_RAM_STAGING_BUDGET_MB = 'ram_staging_budget_mb'
 
 # Env
 KENV_DOWNLOADER_LAUNCHER_PATH = 'DOWNLOADER_LAUNCHER_PATH'
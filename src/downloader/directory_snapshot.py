@@ -0,0 +1,61 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+import os
+from abc import ABC, abstractmethod
+from typing import List, Optional, Tuple
+
+from downloader.logger import Logger
+from downloader.stat_store import StatStore
+
+
+class DirectorySnapshot(ABC):
+    @abstractmethod
+    def get(self, path: str, stat: os.stat_result) -> Optional[Tuple[List[str], List[str]]]:
+        """Files and folders listed in the directory on a previous run, only if its mtime didn't change.
+
+        Windows doesn't always update directory mtimes on FAT and exFAT, so names missing from the listing still have
+        to be checked on disk."""
+
+    @abstractmethod
+    def put(self, path: str, stat: os.stat_result, files: List[str], folders: List[str]) -> None:
+        """interface"""
+
+    @abstractmethod
+    def save(self) -> None:
+        """interface"""
+
+
+class NoDirectorySnapshot(DirectorySnapshot):
+    def get(self, path: str, stat: os.stat_result) -> Optional[Tuple[List[str], List[str]]]: return None
+    def put(self, path: str, stat: os.stat_result, files: List[str], folders: List[str]) -> None: pass
+    def save(self) -> None: pass
+
+
+class FileDirectorySnapshot(DirectorySnapshot):
+    def __init__(self, path: str, logger: Logger):
+        self._store = StatStore(path, logger, 'directory snapshot')
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[Tuple[List[str], List[str]]]:
+        entry = self._store.get(path, lambda entry: len(entry) == 3 and entry[0] == stat.st_mtime_ns)
+        return None if entry is None else (entry[1], entry[2])
+
+    def put(self, path: str, stat: os.stat_result, files: List[str], folders: List[str]) -> None:
+        self._store.put(path, stat, [stat.st_mtime_ns, files, folders])
+
+    def save(self) -> None:
+        self._store.save()
@@ -20,30 +20,36 @@ import sys
 import ssl
 from typing import Dict, Any
 
-from downloader.constants import FILE_MiSTer_new, FILE_MiSTer, FILE_MiSTer_old
+from downloader.constants import FILE_MiSTer_new, FILE_MiSTer, FILE_MiSTer_old, FILE_menu_rbf
 from downloader.file_system import FolderCreationError
 from downloader.http_gateway import HttpGateway
+from downloader.job_journal import JobJournal, NoJobJournal
 from downloader.job_system import JobSystem
 from downloader.jobs.db_header_job import DbHeaderJob
 from downloader.jobs.fetch_file_job import FetchFileJob
+from downloader.jobs.priorities import boot_critical_fetch_priority
+from downloader.jobs.scheduling import SchedulingPolicy, RoundRobinByDatabasePolicy
 from downloader.jobs.workers_factory import DownloaderWorkersFactory
 from downloader.logger import DebugOnlyLoggerDecorator
-from downloader.target_path_repository import TargetPathRepository
+from downloader.target_path_repository import TargetPathRepository, RamStagingBudget, ram_staging_budget
 
 
 class FileDownloaderFactory:
-    def __init__(self, file_system_factory, waiter, logger, job_system, file_download_reporter, http_gateway):
+    def __init__(self, file_system_factory, waiter, logger, job_system, file_download_reporter, http_gateway, job_journal=None, scheduling_policy=None, ram_staging_budget=ram_staging_budget):
         self._file_system_factory = file_system_factory
         self._waiter = waiter
         self._logger = logger
         self._job_system = job_system
         self._file_download_reporter = file_download_reporter
         self._http_gateway = http_gateway
+        self._job_journal = job_journal or NoJobJournal()
+        self._scheduling_policy = scheduling_policy or RoundRobinByDatabasePolicy()
+        self._ram_staging_budget = RamStagingBudget(ram_staging_budget)
 
     def create(self, config, parallel_update, silent=False, hash_check=True):
         logger = DebugOnlyLoggerDecorator(self._logger) if silent else self._logger
         file_system = self._file_system_factory.create_for_config(config)
-        target_path_repository = TargetPathRepository(config, file_system)
+        target_path_repository = TargetPathRepository(config, file_system, self._ram_staging_budget)
         return FileDownloader(
             parallel_update,
             hash_check,
@@ -51,16 +57,18 @@ class FileDownloaderFactory:
             file_system,
             target_path_repository,
             logger,
-            DownloaderWorkersFactory(config, self._waiter, logger, file_system, target_path_repository, self._file_download_reporter, self._job_system, self._http_gateway),
+            DownloaderWorkersFactory(config, self._waiter, logger, file_system, target_path_repository, self._file_download_reporter, self._job_system, self._http_gateway, self._job_journal),
             self._file_download_reporter,
             self._http_gateway,
-            self._job_system
+            self._job_system,
+            self._job_journal,
+            self._scheduling_policy
         )
 
 
 class FileDownloader:
 
-    def __init__(self, parallel_update, hash_check, config, file_system, target_path_repository, logger, workers_factory: 'DownloaderWorkersFactory', file_reporter: 'FileDownloadProgressReporter', http_gateway: HttpGateway, job_system: JobSystem):
+    def __init__(self, parallel_update, hash_check, config, file_system, target_path_repository, logger, workers_factory: 'DownloaderWorkersFactory', file_reporter: 'FileDownloadProgressReporter', http_gateway: HttpGateway, job_system: JobSystem, job_journal: JobJournal, scheduling_policy: SchedulingPolicy):
         self._parallel_update = parallel_update
         self._hash_check = hash_check
         self._file_system = file_system
@@ -68,6 +76,8 @@ class FileDownloader:
         self._config = config
         self._logger = logger
         self._queued_files = {}
+        self._extractions = {}
+        self._after_validations = {}
         self._unpacked_zips = {}
         self._correct_files = []
         self._failed_folders = []
@@ -76,12 +86,18 @@ class FileDownloader:
         self._workers_factory = workers_factory
         self._http_gateway = http_gateway
         self._job_system = job_system
+        self._job_journal = job_journal
+        self._scheduling_policy = scheduling_policy
 
     def failed_folders(self):
         return self._failed_folders
 
-    def queue_file(self, file_description, file_path):
+    def queue_file(self, file_description, file_path, extraction=None, after_validation=None):
         self._queued_files[file_path] = file_description
+        if extraction is not None:
+            self._extractions[file_path] = extraction
+        if after_validation is not None:
+            self._after_validations[file_path] = after_validation
 
     def mark_unpacked_zip(self, zip_id, base_zips_url):
         self._unpacked_zips[zip_id] = base_zips_url
@@ -109,49 +125,79 @@ class FileDownloader:
     def _download(self):
         files_to_download = []
         skip_files = []
+        hashes = self._hash_present_files()
         for file_path, file_description in self._queued_files.items():
             if 'db' in file_description:
                 files_to_download.append(file_path)
                 continue
 
             try:
-                will_download = self._do_we_have_to_download_the_file(file_path, file_description)
+                will_download = self._do_we_have_to_download_the_file(file_path, file_description, hashes)
             except FolderCreationError as folder_path:
                 self._logger.print('ERROR: Folder for file "%s" could not be created, skipping.' % file_path)
                 self._logger.debug(folder_path)
                 self._failed_folders.append(folder_path)
                 continue
 
-            if will_download:
-                files_to_download.append(file_path)
-            else:
+            if not will_download:
                 skip_files.append(file_path)
+            elif 'url' not in file_description:
+                self._no_url_files.append(file_path)
+            else:
+                files_to_download.append(file_path)
 
         self._check_downloaded_files(skip_files)
         self._workers_factory.prepare_workers()
+        files_to_download = [path for path, _ in self._scheduling_policy.order([(path, self._queued_files[path]) for path in files_to_download])]
+        files_to_download.sort(key=lambda path: not is_boot_critical(path, self._queued_files[path]))
+        self._job_system.push_job_source(self._download_jobs(path for path in files_to_download if path not in self._after_validations), _fetch_priority)
+        self._push_jobs_with_followups(path for path in files_to_download if path in self._after_validations)
+        self._file_reporter.start_session()
+        self._job_system.accomplish_pending_jobs()
+        self._job_journal.flush()
+
+        failed_files = set(self._file_reporter.failed_files())
+        self._check_downloaded_files([path for path in self._file_reporter.downloaded_files() if path not in failed_files])
+        self._file_reporter.print_pending()
+
+        retry_stats = self._job_system.retry_stats()
+        if retry_stats.retries > 0 or retry_stats.fatal_failures > 0:
+            self._logger.debug(f'Retries: {retry_stats.retries} (waited {retry_stats.total_delay:.2f}s, longest {retry_stats.longest_delay:.2f}s), fatal failures: {retry_stats.fatal_failures}')
+
+    def _download_jobs(self, files_to_download):
         for path in files_to_download:
             description = self._queued_files[path]
 
             if 'db' in description:
-                self._job_system.push_job(DbHeaderJob(description['db']))
-            elif 'url' not in description:
-                self._no_url_files.append(path)
-                continue
+                yield DbHeaderJob(description['db'])
             else:
-                self._job_system.push_job(FetchFileJob(
-                    path=path,
-                    description=description,
-                    hash_check=self._hash_check
-                ))
-        self._file_reporter.start_session()
-        self._job_system.accomplish_pending_jobs()
+                yield self._fetch_job(path)
+
+    def _push_jobs_with_followups(self, paths):
+        for path in paths:
+            fetch_job = self._fetch_job(path)
+            fetch_handle = self._job_system.push_job(fetch_job, _fetch_priority(fetch_job))
+            self._job_system.push_job(self._after_validations[path], depends_on=[fetch_handle])
+
+    def _fetch_job(self, path):
+        description = self._queued_files[path]
+        return FetchFileJob(
+            path=path,
+            description=description,
+            hash_check=self._hash_check,
+            boot_critical=is_boot_critical(path, description),
+            extraction=self._extractions.get(path, None)
+        )
 
-        self._check_downloaded_files(self._file_reporter.downloaded_files())
-        self._file_reporter.print_pending()
+    def _hash_present_files(self) -> Dict[str, str]:
+        if not self._hash_check:
+            return {}
+
+        return self._file_system.hash_many([path for path, description in self._queued_files.items() if 'db' not in description and self._file_system.is_file(path)])
 
-    def _do_we_have_to_download_the_file(self, file_path: str, file_description: Dict[str, Any]) -> bool:
+    def _do_we_have_to_download_the_file(self, file_path: str, file_description: Dict[str, Any], hashes: Dict[str, str]) -> bool:
         if self._hash_check and self._file_system.is_file(file_path):
-            path_hash = self._file_system.hash(file_path)
+            path_hash = hashes[file_path] if file_path in hashes else self._file_system.hash(file_path)
             if path_hash == file_description['hash']:
                 if 'zip_id' in file_description and file_description['zip_id'] in self._unpacked_zips:
                     self._logger.print('Unpacked: %s' % file_path)
@@ -181,6 +227,17 @@ class FileDownloader:
         return self._file_reporter.started_files()
 
 
+def is_boot_critical(path: str, description: Dict[str, Any]) -> bool:
+    return path in _boot_critical_files or description.get('reboot', False)
+
+
+_boot_critical_files = {FILE_MiSTer, FILE_menu_rbf}
+
+
+def _fetch_priority(job):
+    return boot_critical_fetch_priority if getattr(job, 'boot_critical', False) else None
+
+
 def context_from_curl_ssl(curl_ssl):
     context = ssl.create_default_context()
 
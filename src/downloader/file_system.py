@@ -16,39 +16,62 @@
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
+import errno
 import os
 import hashlib
 import shutil
 import json
 import tempfile
+import threading
+import time
+import zlib
 from abc import ABC, abstractmethod
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from pathlib import Path
 from typing import List, Optional, Set, Dict, Any, Tuple, Union
 
+from downloader.archive_stream import ArchiveStreamReader, extract_archive_stream
 from downloader.config import AllowDelete
 from downloader.constants import K_ALLOW_DELETE, K_BASE_PATH, HASH_file_does_not_exist
+from downloader.directory_snapshot import DirectorySnapshot, NoDirectorySnapshot
+from downloader.hash_cache import HashCache, NoHashCache
+from downloader.job_system import ProcessLane, CancellationToken
 from downloader.logger import Logger, NoLogger
 from downloader.other import ClosableValue
 import zipfile
 
 
 is_windows = os.name == 'nt'
+stream_chunk_size = 64 * 1024
+hash_chunk_size = 1024 * 1024
+hash_threads = 4
+scan_threads_per_drive = 8
+copy_chunk_size = 4 * 1024 * 1024
+unzip_threads = 4
+sd_card_unzip_threads = 2
+mmc_block_major = 179
 
 
 class FileSystemFactory:
-    def __init__(self, config: Dict[str, Any], path_dictionary: Dict[str, str], logger: Logger):
+    def __init__(self, config: Dict[str, Any], path_dictionary: Dict[str, str], logger: Logger, process_lane: Optional[ProcessLane] = None, hash_cache: Optional[HashCache] = None, directory_snapshot: Optional[DirectorySnapshot] = None):
         self._config = config
         self._path_dictionary = path_dictionary
         self._logger = logger
+        self._process_lane = process_lane or ProcessLane(max_processes=0)
+        self._hash_cache = hash_cache or NoHashCache()
+        self._directory_snapshot = directory_snapshot or NoDirectorySnapshot()
         self._unique_temp_filenames: Set[Optional[str]] = set()
         self._unique_temp_filenames.add(None)
         self._fs_cache = FsCache()
+        self._copy_stats = CopyStats()
 
     def create_for_system_scope(self) -> 'FileSystem':
         return self.create_for_config(self._config)
 
     def create_for_config(self, config) -> 'FileSystem':
-        return _FileSystem(config, self._path_dictionary, self._logger, self._unique_temp_filenames, self._fs_cache)
+        return _FileSystem(config, self._path_dictionary, self._logger, self._unique_temp_filenames, self._fs_cache, self._process_lane, self._hash_cache, self._directory_snapshot, self._copy_stats)
 
 
 class FileSystem(ABC):
@@ -105,6 +128,10 @@ class FileSystem(ABC):
     def hash(self, path: str) -> str:
         """interface"""
 
+    @abstractmethod
+    def hash_many(self, paths: List[str]) -> Dict[str, str]:
+        """Hashes the files in parallel. Returns their hashes by path."""
+
     @abstractmethod
     def make_dirs(self, path: str) -> None:
         """interface"""
@@ -134,9 +161,22 @@ class FileSystem(ABC):
         """interface"""
 
     @abstractmethod
-    def write_incoming_stream(self, in_stream: Any, target_path: str):
+    def write_incoming_stream(self, in_stream: Any, target_path: str, cancellation_token: Optional[CancellationToken] = None, append: bool = False, max_size: Optional[int] = None) -> 'StreamWriteResult':
+        """interface"""
+
+    @abstractmethod
+    def extract_incoming_stream(self, in_stream: Any, archive_format: str, files: Dict[str, str], cancellation_token: Optional[CancellationToken] = None, max_size: Optional[int] = None, expected_md5: Optional[str] = None) -> 'StreamWriteResult':
+        """Extracts each archive member (value) to its path (key) while the archive is being read from in_stream.
+        When expected_md5 is given, no member is installed unless the whole archive matches it."""
+
+    @abstractmethod
+    def size(self, path: str) -> int:
         """interface"""
 
+    @abstractmethod
+    def free_space(self, path: str) -> Optional[int]:
+        """Bytes available on the filesystem holding the file, or None when they can't be known."""
+
     @abstractmethod
     def unlink(self, path: str, verbose: bool = True) -> bool:
         """interface"""
@@ -157,6 +197,10 @@ class FileSystem(ABC):
     def unzip_contents(self, file: str, path: str, contained_files: Any) -> None:
         """interface"""
 
+    @abstractmethod
+    def unzip_files(self, file: str, files: Dict[str, str]) -> List[str]:
+        """Extracts each zip member (value) straight to its path (key). Returns the paths that couldn't be extracted."""
+
     @abstractmethod
     def turn_off_logs(self) -> None:
         """interface"""
@@ -190,6 +234,12 @@ class ReadOnlyFileSystem:
     def hash(self, path):
         return self._fs.hash(path)
 
+    def hash_many(self, paths):
+        return self._fs.hash_many(paths)
+
+    def size(self, path):
+        return self._fs.size(path)
+
     def unique_temp_filename(self):
         return self._fs.unique_temp_filename()
 
@@ -201,18 +251,33 @@ class ReadOnlyFileSystem:
         raise Exception(f"Cannot delete file '{file_path}' from read-only filesystem wrapper")
 
 
+@dataclass
+class StreamWriteResult:
+    size: int
+    write_seconds: float
+    md5: Optional[str] = None
+    failed_files: List[str] = field(default_factory=list)
+
+
 class UnlinkTemporaryException: pass
 class FolderCreationError(Exception): pass
 class FileCopyError(Exception): pass
+class StreamSizeExceededError(Exception): pass
 
 
 class _FileSystem(FileSystem):
-    def __init__(self, config: Dict[str, Any], path_dictionary: Dict[str, str], logger: Logger, unique_temp_filenames: Set[Optional[str]], fs_cache: 'FsCache'):
+    def __init__(self, config: Dict[str, Any], path_dictionary: Dict[str, str], logger: Logger, unique_temp_filenames: Set[Optional[str]], fs_cache: 'FsCache', process_lane: ProcessLane, hash_cache: HashCache, directory_snapshot: DirectorySnapshot, copy_stats: 'CopyStats'):
         self._config = config
         self._path_dictionary = path_dictionary
         self._logger = logger
         self._unique_temp_filenames = unique_temp_filenames
         self._fs_cache = fs_cache
+        self._process_lane = process_lane
+        self._hash_cache = hash_cache
+        self._directory_snapshot = directory_snapshot
+        self._copy_stats = copy_stats
+        self._write_threads_by_device: Dict[int, int] = {}
+        self._write_threads_lock = threading.Lock()
         self._quick_hit = 0
         self._slow_hit = 0
 
@@ -228,9 +293,10 @@ class _FileSystem(FileSystem):
 
     def is_file(self, path: str, use_cache: bool = True) -> bool:
         full_path = self._path(path)
-        if use_cache and self._fs_cache.contains_file(full_path):
+        known = self._fs_cache.has_file(full_path) if use_cache else None
+        if known is not None:
             self._quick_hit += 1
-            return True
+            return known
         elif os.path.isfile(full_path):
             self._slow_hit += 1
             self._fs_cache.add_file(full_path)
@@ -240,19 +306,72 @@ class _FileSystem(FileSystem):
 
     def print_debug(self) -> None:
         self._logger.debug(f'IS_FILE quick hits: {self._quick_hit} slow hits: {self._slow_hit}')
+        for drive, (size, seconds) in self._copy_stats.by_drive().items():
+            self._logger.debug(f'COPY {drive}: {size} bytes in {seconds:.3f} seconds ({size / max(seconds, 1e-6) / (1024 * 1024):.1f} MB/s)')
 
     def is_folder(self, path: str) -> bool:
-        return os.path.isdir(self._path(path))
+        full_path = self._path(path)
+        known = self._fs_cache.has_folder(full_path)
+        if known is not None:
+            return known
+        return os.path.isdir(full_path)
 
     def precache_is_file_with_folders(self, folders: List[str]) -> None:
+        drives: Dict[str, List[str]] = {}
         for folder_path in folders:
             base_path = self._base_path(folder_path)
             full_folder_path = folder_path if base_path is None else os.path.join(base_path, folder_path)
-            if not os.path.isdir(full_folder_path):
-                continue
+            drives.setdefault(os.sep if base_path is None else base_path, []).append(full_folder_path)
+
+        if len(drives) <= 1:
+            for drive, full_folder_paths in drives.items():
+                self._scan_drive(drive, full_folder_paths)
+            return
 
-            files = [f.path for f in os.scandir(full_folder_path) if f.is_file()]
-            self._fs_cache.add_many_files(files)
+        with ThreadPoolExecutor(max_workers=len(drives)) as executor:
+            for future in [executor.submit(self._scan_drive, drive, full_folder_paths) for drive, full_folder_paths in drives.items()]:
+                future.result()
+
+    def _scan_drive(self, drive: str, full_folder_paths: List[str]) -> None:
+        start = time.monotonic()
+        if len(full_folder_paths) <= 1:
+            for full_folder_path in full_folder_paths:
+                self._scan_folder(full_folder_path)
+        else:
+            with ThreadPoolExecutor(max_workers=min(scan_threads_per_drive, len(full_folder_paths))) as executor:
+                list(executor.map(self._scan_folder, full_folder_paths))
+        self._logger.debug('Scanned %d folders on %s in %.3f seconds.' % (len(full_folder_paths), drive, time.monotonic() - start))
+
+    def _scan_folder(self, full_folder_path: str) -> None:
+        try:
+            stat = os.stat(full_folder_path)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        except OSError as e:
+            self._logger.debug(e)
+            return
+
+        snapshot = self._directory_snapshot.get(full_folder_path, stat)
+        if snapshot is not None:
+            self._fs_cache.add_scanned_folder(full_folder_path, *snapshot, complete=False)
+            return
+
+        files, folders = [], []
+        try:
+            with os.scandir(full_folder_path) as iterator:
+                for entry in iterator:
+                    if entry.is_file():
+                        files.append(entry.name)
+                    elif entry.is_dir():
+                        folders.append(entry.name)
+        except (FileNotFoundError, NotADirectoryError):
+            return
+        except OSError as e:
+            self._logger.debug(e)
+            return
+
+        self._fs_cache.add_scanned_folder(full_folder_path, files, folders)
+        self._directory_snapshot.put(full_folder_path, stat, files, folders)
 
     def read_file_contents(self, path: str) -> str:
         full_path = self._path(path)
@@ -264,12 +383,15 @@ class _FileSystem(FileSystem):
         full_path = self._path(path)
         self._debug_log('Writing file contents', (path, full_path))
         with open(full_path, 'w') as f:
-            return f.write(content)
+            result = f.write(content)
+        self._fs_cache.add_file(full_path)
+        return result
 
     def touch(self, path: str) -> None:
         full_path = self._path(path)
         self._debug_log('Touching', (path, full_path))
         Path(full_path).touch()
+        self._fs_cache.add_file(full_path)
 
     def move(self, source: str, target: str) -> None:
         self._makedirs(self._parent_folder(target))
@@ -285,28 +407,49 @@ class _FileSystem(FileSystem):
         full_target = self._path(target)
         self._debug_log('Copying', (source, full_source), (target, full_target))
         try:
-            shutil.copyfile(full_source, full_target, follow_symlinks=True)
+            self._copy_file(full_source, full_target, target)
         except OSError as e:
             self._logger.debug(e)
             raise FileCopyError(f"Cannot copy '{source}' to '{target}'") from e
-        self._fs_cache.add_file(full_target)
 
     def copy_fast(self, source: str, target: str) -> None:
         full_source = self._path(source)
         full_target = self._path(target)
         self._debug_log('Copying', (source, full_source), (target, full_target))
+        self._copy_file(full_source, full_target, target)
+
+    def _copy_file(self, full_source: str, full_target: str, target: str) -> None:
+        start = time.monotonic()
         with open(full_source, 'rb') as fsource:
+            _raise_if_same_file(fsource, full_target)
             with open(full_target, 'wb') as ftarget:
-                shutil.copyfileobj(fsource, ftarget, length=1024 * 1024 * 4)
+                size = copy_file_contents(fsource, ftarget)
+        self._copy_stats.add(self._base_path(target) or os.sep, size, time.monotonic() - start)
         self._fs_cache.add_file(full_target)
 
     def hash(self, path: str) -> str:
+        full_path = self._path(path)
         try:
-            return hash_file(self._path(path))
+            stat = os.stat(full_path)
+            cached = self._hash_cache.get(full_path, stat)
+            if cached is not None:
+                return cached
+
+            result = hash_file(full_path)
         except FileNotFoundError as e:
             self._logger.debug(e)
             return HASH_file_does_not_exist
 
+        self._hash_cache.put(full_path, stat, result)
+        return result
+
+    def hash_many(self, paths: List[str]) -> Dict[str, str]:
+        if len(paths) <= 1:
+            return {path: self.hash(path) for path in paths}
+
+        with ThreadPoolExecutor(max_workers=min(hash_threads, len(paths))) as executor:
+            return dict(zip(paths, executor.map(self.hash, paths)))
+
     def make_dirs(self, path: str) -> None:
         self._makedirs(self._path(path))
 
@@ -322,6 +465,7 @@ class _FileSystem(FileSystem):
     def _makedirs(self, target: str) -> None:
         try:
             os.makedirs(target, exist_ok=True)
+            self._fs_cache.add_folder(target)
         except FileExistsError as e:
             if e.errno == 17:
                 return
@@ -331,6 +475,10 @@ class _FileSystem(FileSystem):
             raise FolderCreationError(target) from e
 
     def folder_has_items(self, path: str) -> bool:
+        known = self._fs_cache.folder_has_items(self._path(path))
+        if known is not None:
+            return known
+
         try:
             iterator = os.scandir(self._path(path))
             for _ in iterator:
@@ -355,7 +503,9 @@ class _FileSystem(FileSystem):
         self._debug_log('Deleting empty folder', (path, full_path))
         try:
             os.rmdir(full_path)
+            self._fs_cache.remove_folder(full_path)
         except FileNotFoundError as e:
+            self._fs_cache.remove_folder(full_path)
             self._ignore_error(e)
         except NotADirectoryError as e:
             self._ignore_error(e)
@@ -370,8 +520,10 @@ class _FileSystem(FileSystem):
 
         full_path = self._path(path)
         self._debug_log('Deleting non-empty folder', (path, full_path))
+        self._fs_cache.forget_folders_under(full_path)
         try:
             shutil.rmtree(full_path)
+            self._fs_cache.remove_folder(full_path)
         except Exception as e:
             self._logger.debug(e)
             self._logger.debug('Ignoring error.')
@@ -379,9 +531,72 @@ class _FileSystem(FileSystem):
     def download_target_path(self, path: str) -> str:
         return self._path(path)
 
-    def write_incoming_stream(self, in_stream: Any, target_path: str):
-        with open(target_path, 'wb') as out_file:
-            shutil.copyfileobj(in_stream, out_file)
+    def write_incoming_stream(self, in_stream: Any, target_path: str, cancellation_token: Optional[CancellationToken] = None, append: bool = False, max_size: Optional[int] = None) -> 'StreamWriteResult':
+        size = 0
+        write_seconds = 0.0
+        md5 = None if append else hashlib.md5()
+        buffer = _thread_buffer('stream', stream_chunk_size)
+        read_into = getattr(in_stream, 'readinto', None)
+        with open(target_path, 'ab' if append else 'wb') as out_file, memoryview(buffer) as view:
+            while True:
+                if cancellation_token is not None:
+                    cancellation_token.raise_if_cancelled()
+
+                if read_into is not None:
+                    chunk = view[:read_into(buffer)]
+                else:
+                    chunk = in_stream.read(stream_chunk_size)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if max_size is not None and size > max_size:
+                    raise StreamSizeExceededError(f'{target_path} is bigger than {max_size} bytes')
+
+                if md5 is not None:
+                    md5.update(chunk)
+                start = time.monotonic()
+                out_file.write(chunk)
+                write_seconds += time.monotonic() - start
+        self._fs_cache.add_file(target_path)
+        return StreamWriteResult(size=size, write_seconds=write_seconds, md5=None if md5 is None else md5.hexdigest())
+
+    def extract_incoming_stream(self, in_stream: Any, archive_format: str, files: Dict[str, str], cancellation_token: Optional[CancellationToken] = None, max_size: Optional[int] = None, expected_md5: Optional[str] = None) -> 'StreamWriteResult':
+        paths_by_full_path = {self._path(path): path for path in files}
+        targets = {member: self._path(path) for path, member in files.items()}
+        self._debug_log('Extracting stream', (archive_format, len(targets)))
+
+        def on_read(size: int) -> None:
+            if cancellation_token is not None:
+                cancellation_token.raise_if_cancelled()
+            if max_size is not None and size > max_size:
+                raise StreamSizeExceededError(f'Archive is bigger than {max_size} bytes')
+
+        reader = ArchiveStreamReader(in_stream, on_read)
+        start = time.monotonic()
+        found = extract_archive_stream(reader, archive_format, targets, _matches_size_and_crc, expected_md5)
+        failed = []
+        for member, full_path in targets.items():
+            if member in found:
+                self._fs_cache.add_folder(os.path.dirname(full_path))
+                self._fs_cache.add_file(full_path)
+            else:
+                failed.append(paths_by_full_path[full_path])
+        write_seconds = max(0.0, time.monotonic() - start - reader.read_seconds)
+        return StreamWriteResult(size=reader.size, write_seconds=write_seconds, md5=reader.md5.hexdigest(), failed_files=failed)
+
+    def size(self, path: str) -> int:
+        try:
+            return os.path.getsize(self._path(path))
+        except FileNotFoundError:
+            return 0
+
+    def free_space(self, path: str) -> Optional[int]:
+        try:
+            return shutil.disk_usage(os.path.dirname(self._path(path))).free
+        except OSError as e:
+            self._logger.debug(e)
+            return None
 
     def unlink(self, path: str, verbose: bool = True) -> bool:
         verbose = verbose and not path.startswith('/tmp/')
@@ -415,22 +630,52 @@ class _FileSystem(FileSystem):
 
         with zipfile.ZipFile(zip_path, 'w') as zipf:
             zipf.writestr(json_name, json.dumps(db))
+        self._fs_cache.add_file(full_path)
 
     def save_json(self, db: Dict[str, Any], path: str) -> None:
         full_path = self._path(path)
         self._debug_log('Saving json on zip', (path, full_path))
         with open(full_path, 'w') as f:
             json.dump(db, f)
+        self._fs_cache.add_file(full_path)
 
     def unzip_contents(self, file: str, path: str, contained_files: Any) -> None:
         full_path = self._path(path)
         full_file = self._path(file)
         self._debug_log('Unzipping contents', (file, full_file), (path, full_path))
-        with zipfile.ZipFile(full_file, 'r') as zipf:
-            zipf.extractall(full_path)
-
+        members = zip_members(path, contained_files)
+        self._fs_cache.forget_folders_under(full_path)
+        skipped = UnzipJob(full_file, full_path, members, self._write_threads(full_path)).run()
+        self._logger.debug(f'Unzipping {file}: {skipped} unchanged files skipped.')
         self._unlink(file, False)
 
+    def unzip_files(self, file: str, files: Dict[str, str]) -> List[str]:
+        full_file = self._path(file)
+        paths_by_full_path = {self._path(path): path for path in files}
+        self._debug_log('Unzipping files', (file, full_file))
+        failed = UnzipFilesJob(full_file, {self._path(path): member for path, member in files.items()}).run()
+        for full_path in paths_by_full_path:
+            if full_path not in failed:
+                self._fs_cache.add_folder(os.path.dirname(full_path))
+                self._fs_cache.add_file(full_path)
+        return [paths_by_full_path[full_path] for full_path in failed]
+
+    def _write_threads(self, full_path: str) -> int:
+        path = full_path
+        while not os.path.exists(path) and os.path.dirname(path) != path:
+            path = os.path.dirname(path)
+
+        try:
+            device = os.stat(path).st_dev
+        except OSError as e:
+            self._logger.debug(e)
+            return 1
+
+        with self._write_threads_lock:
+            if device not in self._write_threads_by_device:
+                self._write_threads_by_device[device] = write_threads_for_device(device)
+            return self._write_threads_by_device[device]
+
     def _debug_log(self, message: str, path: Tuple[str, str], target: Optional[Tuple[str, str]] = None) -> None:
         if path[0][0] == '/':
             if target is None:
@@ -485,16 +730,109 @@ class InvalidFileResolution(Exception):
     pass
 
 
+_thread_local_buffers = threading.local()
+
+
+def _thread_buffer(name: str, size: int) -> bytearray:
+    buffer = getattr(_thread_local_buffers, name, None)
+    if buffer is None:
+        buffer = bytearray(size)
+        setattr(_thread_local_buffers, name, buffer)
+    return buffer
+
+
 def hash_file(path: str) -> str:
-    with open(path, "rb") as f:
+    buffer = _thread_buffer('hash', hash_chunk_size)
+    with open(path, 'rb', buffering=0) as f, memoryview(buffer) as view:
+        _fadvise(f, 'POSIX_FADV_SEQUENTIAL')
         file_hash = hashlib.md5()
-        chunk = f.read(8192)
-        while chunk:
-            file_hash.update(chunk)
-            chunk = f.read(8192)
+        read = f.readinto(buffer)
+        while read:
+            file_hash.update(view[:read])
+            read = f.readinto(buffer)
+        _fadvise(f, 'POSIX_FADV_DONTNEED')
         return file_hash.hexdigest()
 
 
+def copy_file_contents(fsource: Any, ftarget: Any) -> int:
+    """Copies inside the kernel when possible (copy_file_range, then sendfile), otherwise through a userspace buffer."""
+    source_fd, target_fd = fsource.fileno(), ftarget.fileno()
+    size = os.fstat(source_fd).st_size
+    if size == 0:
+        return 0
+
+    for copy_chunk in _kernel_copies:
+        copied = _kernel_copy(copy_chunk, source_fd, target_fd, size)
+        if copied is not None:
+            return copied
+
+    shutil.copyfileobj(fsource, ftarget, length=copy_chunk_size)
+    return ftarget.tell()
+
+
+def _kernel_copy(copy_chunk: Any, source_fd: int, target_fd: int, size: int) -> Optional[int]:
+    copied = 0
+    while True:
+        try:
+            chunk = copy_chunk(source_fd, target_fd, copied)
+        except OSError as e:
+            if copied == 0 and e.errno in _kernel_copy_unsupported_errors:
+                return None
+            raise
+        if chunk == 0:
+            return None if copied == 0 and size > 0 else copied
+        copied += chunk
+
+
+def _copy_file_range_chunk(source_fd: int, target_fd: int, offset: int) -> int:
+    return os.copy_file_range(source_fd, target_fd, copy_chunk_size, offset, offset)
+
+
+def _sendfile_chunk(source_fd: int, target_fd: int, offset: int) -> int:
+    return os.sendfile(target_fd, source_fd, offset, copy_chunk_size)
+
+
+_kernel_copies = [copy_chunk for copy_chunk, available in [
+    (_copy_file_range_chunk, hasattr(os, 'copy_file_range')),
+    (_sendfile_chunk, hasattr(os, 'sendfile')),
+] if available]
+_kernel_copy_unsupported_errors = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF, errno.ENOTSOCK}
+
+
+def _raise_if_same_file(fsource: Any, full_target: str) -> None:
+    try:
+        target_stat = os.stat(full_target)
+    except FileNotFoundError:
+        return
+    source_stat = os.fstat(fsource.fileno())
+    if (source_stat.st_dev, source_stat.st_ino) == (target_stat.st_dev, target_stat.st_ino):
+        raise shutil.SameFileError(f'{fsource.name} and {full_target} are the same file')
+
+
+class CopyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._by_drive: Dict[str, Tuple[int, float]] = {}
+
+    def add(self, drive: str, size: int, seconds: float) -> None:
+        with self._lock:
+            total_size, total_seconds = self._by_drive.get(drive, (0, 0.0))
+            self._by_drive[drive] = (total_size + size, total_seconds + seconds)
+
+    def by_drive(self) -> Dict[str, Tuple[int, float]]:
+        with self._lock:
+            return dict(self._by_drive)
+
+
+def _fadvise(f: Any, advice: str) -> None:
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    try:
+        os.posix_fadvise(f.fileno(), 0, 0, getattr(os, advice))
+    except OSError:
+        pass
+
+
 def absolute_parent_folder(absolute_path: str) -> str:
     return str(Path(absolute_path).parent)
 
@@ -513,15 +851,327 @@ def _load_json(file_path: str) -> Dict[str, Any]:
         return json.loads(f.read())
 
 
+def zip_members(target: str, contained_files: Any) -> Optional[List[str]]:
+    """Member names of the contained files: their path relative to the target folder, or their zip_path when they are
+    extracted somewhere else (like single files extracted into a temporary folder)."""
+    if not isinstance(contained_files, dict):
+        return None
+
+    prefix = target if target.endswith('/') else target + '/'
+    members = []
+    for file_path, description in contained_files.items():
+        if file_path.startswith(prefix):
+            members.append(file_path[len(prefix):])
+        elif 'zip_path' in description:
+            members.append(description['zip_path'])
+        else:
+            return None
+    return members
+
+
+# Unzipping and hashing run in the calling thread: they are mostly I/O, and zlib and hashlib release the GIL. The
+# process lane is kept for CPU-bound pure-Python work.
+@dataclass
+class UnzipJob:
+    file: str
+    target: str
+    members: Optional[List[str]] = None
+    threads: int = 1
+
+    def run(self) -> int:
+        with zipfile.ZipFile(self.file, 'r') as zipf:
+            infos = zipf.infolist()
+            if self.members is not None:
+                infos_by_name = {info.filename: info for info in infos}
+                if all(member in infos_by_name for member in self.members):
+                    infos = [infos_by_name[member] for member in self.members]
+
+            if self.threads <= 1 or len(infos) <= 1 or not all(_is_plain_zip_name(info.filename) for info in infos):
+                return _extract_zip_members(zipf, infos, self.target)
+
+        # Each thread gets its own handle and a similar amount of bytes. Folders are created beforehand so that the
+        # threads don't race creating them.
+        for folder in sorted({os.path.dirname(os.path.join(self.target, *info.filename.split('/'))) for info in infos}):
+            os.makedirs(folder, exist_ok=True)
+
+        infos = sorted(infos, key=lambda info: info.file_size, reverse=True)
+        chunks = [infos[i::self.threads] for i in range(min(self.threads, len(infos)))]
+        with ThreadPoolExecutor(max_workers=len(chunks)) as executor:
+            return sum(executor.map(self._extract_chunk, chunks))
+
+    def _extract_chunk(self, infos: List[zipfile.ZipInfo]) -> int:
+        with zipfile.ZipFile(self.file, 'r') as zipf:
+            return _extract_zip_members(zipf, infos, self.target)
+
+
+@dataclass
+class UnzipFilesJob:
+    file: str
+    targets: Dict[str, str]
+
+    def run(self) -> List[str]:
+        failed = []
+        with zipfile.ZipFile(self.file, 'r') as zipf:
+            for target, member in self.targets.items():
+                writing = False
+                try:
+                    info = zipf.getinfo(member)
+                    if _matches_zip_member(target, info):
+                        continue
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    writing = True
+                    with zipf.open(info) as source, open(target, 'wb') as destination:
+                        shutil.copyfileobj(source, destination, length=copy_chunk_size)
+                except (KeyError, OSError, zipfile.BadZipFile, zlib.error):
+                    failed.append(target)
+                    if writing and os.path.isfile(target):
+                        os.unlink(target)
+        return failed
+
+
+def _extract_zip_members(zipf: zipfile.ZipFile, infos: List[zipfile.ZipInfo], target: str) -> int:
+    skipped = 0
+    for info in infos:
+        if _is_unchanged_zip_member(target, info):
+            skipped += 1
+            continue
+        zipf.extract(info, target)
+    return skipped
+
+
+def _is_plain_zip_name(name: str) -> bool:
+    return not name.startswith('/') and '..' not in name.split('/') and '\\' not in name and ':' not in name
+
+
+def _is_unchanged_zip_member(target: str, info: zipfile.ZipInfo) -> bool:
+    if info.is_dir() or not _is_plain_zip_name(info.filename):
+        return False
+
+    return _matches_zip_member(os.path.join(target, *info.filename.split('/')), info)
+
+
+def _matches_zip_member(local_path: str, info: zipfile.ZipInfo) -> bool:
+    return _matches_size_and_crc(local_path, info.file_size, info.CRC)
+
+
+def _matches_size_and_crc(local_path: str, size: int, crc: int) -> bool:
+    try:
+        if os.path.getsize(local_path) != size:
+            return False
+        return crc32_file(local_path) == crc
+    except OSError:
+        return False
+
+
+def write_threads_for_device(device: int) -> int:
+    if is_rotational_device(device):
+        return 1
+    if is_sd_card_device(device):
+        return sd_card_unzip_threads
+    return unzip_threads
+
+
+def is_rotational_device(device: int) -> bool:
+    """Spinning disks lose throughput with concurrent writers, as they only add seeks."""
+    if is_windows:
+        return False
+
+    sys_path = _sys_block_path(device)
+    for rotational_path in [f'{sys_path}/queue/rotational', f'{sys_path}/../queue/rotational']:
+        try:
+            with open(rotational_path, 'r') as f:
+                return f.read().strip() == '1'
+        except OSError:
+            continue
+    return False
+
+
+def is_sd_card_device(device: int) -> bool:
+    """SD cards report themselves as non-rotational, but their controllers only handle a couple of writers well."""
+    if is_windows:
+        return False
+
+    return os.major(device) == mmc_block_major or '/mmc' in os.path.realpath(_sys_block_path(device))
+
+
+def _sys_block_path(device: int) -> str:
+    return f'/sys/dev/block/{os.major(device)}:{os.minor(device)}'
+
+
+def crc32_file(path: str) -> int:
+    buffer = _thread_buffer('hash', hash_chunk_size)
+    with open(path, 'rb', buffering=0) as f, memoryview(buffer) as view:
+        crc = 0
+        read = f.readinto(buffer)
+        while read:
+            crc = zlib.crc32(view[:read], crc)
+            read = f.readinto(buffer)
+        return crc
+
+
 class FsCache:
-    def __init__(self): self._files: Set[str] = set()
-    def contains_file(self, path: str) -> bool: return path in self._files
+    """Files known to exist, plus an index of the folders that have been scanned completely.
+
+    Positive answers come from exact names. Negative answers are only given when no name in a scanned folder matches
+    ignoring case, so that case-insensitive storage (FAT, exFAT) and case-sensitive storage are both answered correctly.
+    Folders restored from a directory snapshot may be missing files that were added without updating the folder
+    mtime, so they only give positive answers. Anything else is unknown (None) and has to be checked on disk.
+
+    Everything is indexed per folder, so removals only cost the entries they remove."""
+
+    def __init__(self):
+        self._files: Dict[str, Set[str]] = {}
+        self._folders: Dict[str, _FolderEntry] = {}
+        self._subfolders: Dict[str, Set[str]] = {}
+        self._lock = threading.Lock()
+
+    def contains_file(self, path: str) -> bool:
+        parent, name = os.path.split(path)
+        return name in self._files.get(parent, ())
 
     def add_many_files(self, paths: List[str]) -> None:
-        self._files.update(paths)
+        for path in paths:
+            self.add_file(path)
 
     def add_file(self, path: str) -> None:
-        self._files.add(path)
+        parent, name = os.path.split(path)
+        with self._lock:
+            self._known_files(parent).add(name)
+            entry = self._folders.get(parent, None)
+            if entry is not None:
+                entry.add_file(name)
 
     def remove_file(self, path: str) -> None:
-        if path in self._files: self._files.remove(path)
+        parent, name = os.path.split(path)
+        with self._lock:
+            self._files.get(parent, set()).discard(name)
+            entry = self._folders.get(parent, None)
+            if entry is not None:
+                entry.remove_file(name)
+
+    def add_scanned_folder(self, path: str, files: List[str], folders: List[str], complete: bool = True) -> None:
+        entry = _FolderEntry(set(files), set(folders), complete)
+        with self._lock:
+            self._folders[path] = entry
+            self._index_folder(path)
+            self._known_files(path).update(files)
+
+    def has_file(self, path: str) -> Optional[bool]:
+        parent, name = os.path.split(path)
+        if name in self._files.get(parent, ()):
+            return True
+        entry = self._folders.get(parent, None)
+        if entry is None or not entry.complete or name.lower() in entry.lower_files:
+            return None
+        return False
+
+    def has_folder(self, path: str) -> Optional[bool]:
+        if path in self._folders:
+            return True
+        parent, name = os.path.split(path)
+        entry = self._folders.get(parent, None)
+        if entry is None:
+            return None
+        if name in entry.folders:
+            return True
+        if not entry.complete or name.lower() in entry.lower_folders:
+            return None
+        return False
+
+    def folder_has_items(self, path: str) -> Optional[bool]:
+        entry = self._folders.get(path, None)
+        if entry is None:
+            return None
+        if len(entry.files) > 0 or len(entry.folders) > 0:
+            return True
+        return False if entry.complete else None
+
+    def add_folder(self, path: str) -> None:
+        with self._lock:
+            parent, name = os.path.split(path)
+            while name != '':
+                entry = self._folders.get(parent, None)
+                if entry is not None:
+                    entry.add_folder(name)
+                parent, name = os.path.split(parent)
+
+    def remove_folder(self, path: str) -> None:
+        parent, name = os.path.split(path)
+        with self._lock:
+            for folder in self._folders_under(path):
+                self._folders.pop(folder, None)
+                self._files.pop(folder, None)
+                self._subfolders.pop(folder, None)
+            self._subfolders.get(parent, set()).discard(path)
+            entry = self._folders.get(parent, None)
+            if entry is not None:
+                entry.remove_folder(name)
+
+    def forget_folders_under(self, path: str) -> None:
+        with self._lock:
+            for folder in self._folders_under(path):
+                self._folders.pop(folder, None)
+
+    def _known_files(self, folder: str) -> Set[str]:
+        files = self._files.get(folder, None)
+        if files is None:
+            files = self._files[folder] = set()
+            self._index_folder(folder)
+        return files
+
+    def _index_folder(self, folder: str) -> None:
+        parent, name = os.path.split(folder)
+        while name != '':
+            children = self._subfolders.setdefault(parent, set())
+            if folder in children:
+                return
+            children.add(folder)
+            folder = parent
+            parent, name = os.path.split(folder)
+
+    def _folders_under(self, path: str) -> List[str]:
+        result = []
+        pending = [path]
+        while len(pending) > 0:
+            folder = pending.pop()
+            result.append(folder)
+            pending.extend(self._subfolders.get(folder, ()))
+        return result
+
+
+class _FolderEntry:
+    __slots__ = ('files', 'lower_files', 'folders', 'lower_folders', 'complete')
+
+    def __init__(self, files: Set[str], folders: Set[str], complete: bool):
+        self.files = files
+        self.lower_files = Counter(file.lower() for file in files)
+        self.folders = folders
+        self.lower_folders = Counter(folder.lower() for folder in folders)
+        self.complete = complete
+
+    def add_file(self, name: str) -> None:
+        if name not in self.files:
+            self.files.add(name)
+            self.lower_files[name.lower()] += 1
+
+    def remove_file(self, name: str) -> None:
+        if name in self.files:
+            self.files.remove(name)
+            _decrement(self.lower_files, name.lower())
+
+    def add_folder(self, name: str) -> None:
+        if name not in self.folders:
+            self.folders.add(name)
+            self.lower_folders[name.lower()] += 1
+
+    def remove_folder(self, name: str) -> None:
+        if name in self.folders:
+            self.folders.remove(name)
+            _decrement(self.lower_folders, name.lower())
+
+
+def _decrement(counter: Counter, key: str) -> None:
+    if counter[key] <= 1:
+        del counter[key]
+    else:
+        counter[key] -= 1
@@ -18,17 +18,24 @@
 
 from downloader.base_path_relocator import BasePathRelocator
 from downloader.certificates_fix import CertificatesFix
-from downloader.constants import K_DOWNLOADER_TIMEOUT, K_DEBUG, K_CURL_SSL, K_DOWNLOADER_THREADS_LIMIT, K_DOWNLOADER_RETRIES, K_IS_PC_LAUNCHER, FILE_MiSTer_version
+from downloader.chrome_trace import ChromeTraceRecorder
+from downloader.constants import K_DOWNLOADER_TIMEOUT, K_DEBUG, K_CURL_SSL, K_DOWNLOADER_THREADS_LIMIT, K_DOWNLOADER_RETRIES, K_IS_PC_LAUNCHER, FILE_MiSTer_version, K_USER_DEFINED_OPTIONS, \
+    K_BASE_SYSTEM_PATH, FILE_downloader_journal, FILE_downloader_trace, FILE_downloader_hash_cache, \
+    FILE_downloader_directory_snapshot, K_RAM_STAGING_BUDGET_MB
 from downloader.db_gateway import DbGateway
+from downloader.directory_snapshot import FileDirectorySnapshot
 from downloader.external_drives_repository import ExternalDrivesRepositoryFactory
 from downloader.file_downloader import FileDownloaderFactory, context_from_curl_ssl
 from downloader.file_filter import FileFilterFactory
 from downloader.file_system import FileSystemFactory
 from downloader.free_space_reservation import LinuxFreeSpaceReservation, UnlimitedFreeSpaceReservation
 from downloader.full_run_service import FullRunService
+from downloader.hash_cache import FileHashCache
 from downloader.http_gateway import HttpGateway
 from downloader.importer_command import ImporterCommandFactory
-from downloader.job_system import JobSystem
+from downloader.job_journal import FileJobJournal
+from downloader.job_system import JobSystem, ProcessLane, FixedConcurrencyController, CancellationToken
+from downloader.jobs.concurrency import AimdConcurrencyController
 from downloader.jobs.reporters import DownloaderProgressReporter, FileDownloadProgressReporter
 from downloader.logger import DebugOnlyLoggerDecorator
 from downloader.os_utils import LinuxOsUtils
@@ -43,6 +50,7 @@ from downloader.reboot_calculator import RebootCalculator
 from downloader.store_migrator import StoreMigrator
 from downloader.waiter import Waiter
 import atexit
+import os
 
 
 class FullRunServiceFactory:
@@ -54,33 +62,45 @@ class FullRunServiceFactory:
     def create(self, config):
         path_dictionary = dict()
         waiter = Waiter()
-        file_system_factory = FileSystemFactory(config, path_dictionary, self._logger)
+        process_lane = ProcessLane(max_processes=min(4, (os.cpu_count() or 1) - 1))
+        atexit.register(process_lane.shutdown)
+        hash_cache = FileHashCache(f'{config[K_BASE_SYSTEM_PATH]}/{FILE_downloader_hash_cache}', self._logger)
+        atexit.register(hash_cache.save)
+        directory_snapshot = FileDirectorySnapshot(f'{config[K_BASE_SYSTEM_PATH]}/{FILE_downloader_directory_snapshot}', self._logger)
+        atexit.register(directory_snapshot.save)
+        file_system_factory = FileSystemFactory(config, path_dictionary, self._logger, process_lane, hash_cache, directory_snapshot)
         system_file_system = file_system_factory.create_for_system_scope()
         external_drives_repository = self._external_drives_repository_factory.create(system_file_system, self._logger)
         storage_priority_resolver_factory = StoragePriorityResolver(file_system_factory, external_drives_repository)
         path_resolver_factory = PathResolverFactory(storage_priority_resolver_factory, path_dictionary)
         store_migrator = StoreMigrator(migrations(config, file_system_factory, path_resolver_factory), self._logger)
 
-        local_repository = LocalRepository(config, self._logger, system_file_system, store_migrator, external_drives_repository)
+        job_journal = FileJobJournal(f'{config[K_BASE_SYSTEM_PATH]}/{FILE_downloader_journal}', self._logger)
+        local_repository = LocalRepository(config, self._logger, system_file_system, store_migrator, external_drives_repository, job_journal)
 
         self._local_repository_provider.initialize(local_repository)
         importer_command_factory = ImporterCommandFactory(config)
 
+        cancellation_token = CancellationToken()
         http_gateway = HttpGateway(
             ssl_ctx=context_from_curl_ssl(config[K_CURL_SSL]),
             timeout=config[K_DOWNLOADER_TIMEOUT],
-            logger=DebugOnlyLoggerDecorator(self._logger) if config[K_DEBUG] else None
+            logger=DebugOnlyLoggerDecorator(self._logger) if config[K_DEBUG] else None,
+            cancellation_token=cancellation_token
         )
         atexit.register(http_gateway.cleanup)
         file_download_reporter = FileDownloadProgressReporter(self._logger, waiter)
         job_system = JobSystem(
             reporter=DownloaderProgressReporter(self._logger, [file_download_reporter]),
-            max_threads=config[K_DOWNLOADER_THREADS_LIMIT],
-            max_tries=config[K_DOWNLOADER_RETRIES]
+            max_tries=config[K_DOWNLOADER_RETRIES],
+            max_retry_delay=60,
+            concurrency_controller=self._create_concurrency_controller(config),
+            cancellation_token=cancellation_token,
+            tracer=self._create_tracer(config)
         )
 
         file_filter_factory = FileFilterFactory(self._logger)
-        file_downloader_factory = FileDownloaderFactory(file_system_factory, waiter, self._logger, job_system, file_download_reporter, http_gateway)
+        file_downloader_factory = FileDownloaderFactory(file_system_factory, waiter, self._logger, job_system, file_download_reporter, http_gateway, job_journal, ram_staging_budget=config[K_RAM_STAGING_BUDGET_MB] * 1024 * 1024)
         db_gateway = DbGateway(config, system_file_system, file_downloader_factory, self._logger)
         offline_importer = OfflineImporter(file_system_factory, file_downloader_factory, self._logger)
         free_space_reservation = LinuxFreeSpaceReservation(logger=self._logger, config=config) if system_file_system.is_file(FILE_MiSTer_version) else UnlimitedFreeSpaceReservation()
@@ -102,3 +122,17 @@ class FullRunServiceFactory:
             waiter,
             importer_command_factory
         )
+
+    def _create_concurrency_controller(self, config):
+        if K_DOWNLOADER_THREADS_LIMIT in config[K_USER_DEFINED_OPTIONS]:
+            return FixedConcurrencyController(config[K_DOWNLOADER_THREADS_LIMIT])
+
+        return AimdConcurrencyController(max_limit=64 if config[K_IS_PC_LAUNCHER] else config[K_DOWNLOADER_THREADS_LIMIT])
+
+    def _create_tracer(self, config):
+        if not config[K_DEBUG]:
+            return None
+
+        tracer = ChromeTraceRecorder(self._logger)
+        atexit.register(lambda: tracer.export(f'{config[K_BASE_SYSTEM_PATH]}/{FILE_downloader_trace}'))
+        return tracer
@@ -0,0 +1,62 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import os
+from abc import ABC, abstractmethod
+from typing import Optional
+
+from downloader.logger import Logger
+from downloader.stat_store import StatStore
+
+# Files are identified by size and mtime. Inodes are left out: FAT and exFAT, like the MiSTer SD card, get new inode
+# numbers on every mount. A wrong clock doesn't matter either, as any write still changes the mtime.
+
+
+class HashCache(ABC):
+    @abstractmethod
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]:
+        """Cached md5 of the file, only if its size and mtime didn't change."""
+
+    @abstractmethod
+    def put(self, path: str, stat: os.stat_result, file_hash: str) -> None:
+        """interface"""
+
+    @abstractmethod
+    def save(self) -> None:
+        """interface"""
+
+
+class NoHashCache(HashCache):
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]: return None
+    def put(self, path: str, stat: os.stat_result, file_hash: str) -> None: pass
+    def save(self) -> None: pass
+
+
+class FileHashCache(HashCache):
+    def __init__(self, path: str, logger: Logger):
+        self._store = StatStore(path, logger, 'hash cache')
+
+    def get(self, path: str, stat: os.stat_result) -> Optional[str]:
+        entry = self._store.get(path, lambda entry: len(entry) == 3 and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns)
+        return None if entry is None else entry[2]
+
+    def put(self, path: str, stat: os.stat_result, file_hash: str) -> None:
+        self._store.put(path, stat, [stat.st_size, stat.st_mtime_ns, file_hash])
+
+    def save(self) -> None:
+        self._store.save()
@@ -14,6 +14,7 @@
 
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
+import socket
 import ssl
 import time
 import abc
@@ -22,6 +23,7 @@ from typing import Tuple, Any, Optional, Generator, List, Dict, Callable, Union
 from urllib.parse import urlparse, ParseResult
 from http.client import HTTPConnection, HTTPSConnection, HTTPResponse, HTTPException
 
+from downloader.job_system import CancellationToken
 from downloader.logger import Logger
 
 
@@ -29,6 +31,10 @@ class HttpGatewayException(Exception):
     pass
 
 
+max_drain_size = 64 * 1024
+_transport_errors = (HTTPException, ConnectionError, socket.timeout, ssl.SSLError)
+
+
 class _Connection(abc.ABC):
     @abc.abstractmethod
     def do_request(self, method: str, url: str, body: Any, headers: Any) -> None: pass
@@ -56,10 +62,11 @@ class _Connection(abc.ABC):
 
 
 class HttpGateway:
-    def __init__(self, ssl_ctx: ssl.SSLContext, timeout: int, logger: Logger = None):
+    def __init__(self, ssl_ctx: ssl.SSLContext, timeout: int, logger: Logger = None, cancellation_token: Optional[CancellationToken] = None):
         self._ssl_ctx = ssl_ctx
         self._timeout = timeout
         self._logger = logger
+        self._cancellation_token = cancellation_token or CancellationToken()
         self._connections: Dict[str, _ConnectionQueue] = {}
         self._clean_connections_timer = time.time()
 
@@ -109,14 +116,36 @@ class HttpGateway:
             url,
             'GET' if method is None else method.upper(),
             body,
-            headers or _default_headers,
+            {**_default_headers, **headers} if headers else _default_headers,
             0
         )
         if self._logger is not None: self._logger.debug(f'HTTP {conn.response.status}: {final_url}\nvvvv\n')
         try:
             yield final_url, conn.response
-        finally:
-            conn.finish_response()
+        except _transport_errors as e:
+            if self._logger is not None: self._logger.debug(f'Closing connection after {type(e).__name__} while reading: {final_url}')
+            conn.kill()
+            raise e
+        except BaseException as e:
+            # Errors raised by the caller, like a bad status, leave the connection usable once the rest of the body is
+            # read. Only big or unknown leftovers are not worth reading.
+            if self._drain(conn.response):
+                conn.finish_response()
+            else:
+                if self._logger is not None: self._logger.debug(f'Closing connection after {type(e).__name__} with unread body: {final_url}')
+                conn.kill()
+            raise e
+        conn.finish_response()
+
+    @staticmethod
+    def _drain(response: HTTPResponse) -> bool:
+        if response.length is None or response.length > max_drain_size:
+            return False
+        try:
+            response.read()
+            return True
+        except _transport_errors:
+            return False
 
     def _open_impl(self, url: str, method: str, body: Any, headers: Any, retry: int) -> Tuple[str, _Connection]:
         self._clean_timeout_connections(time.time())
@@ -133,6 +162,7 @@ class HttpGateway:
         return url, conn
 
     def _request(self, url: str, method: str, body: Any, headers: Any, retry: int) -> Tuple[int, _Connection]:
+        self._cancellation_token.raise_if_cancelled()
         parsed_url = urlparse(url)
         conn = self._take_connection(parsed_url)
         try:
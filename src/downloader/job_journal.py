@@ -0,0 +1,154 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import json
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Dict, Any, Optional
+
+from downloader.logger import Logger
+
+
+class JobJournal(ABC):
+    @abstractmethod
+    def load(self) -> None:
+        """Reads the entries left by a previous run that didn't finish."""
+
+    @abstractmethod
+    def record_validated(self, path: str, file_hash: str) -> None:
+        """Called when a downloaded file has been validated and installed. The file's data reaches the disk before the
+        entry does, so a stat match on the next run means the whole file was written."""
+
+    @abstractmethod
+    def was_validated(self, path: str, file_hash: str) -> bool:
+        """True if a previous run validated the file with this hash and its size and mtime didn't change since."""
+
+    @abstractmethod
+    def flush(self) -> None:
+        """Makes sure the recorded entries are on disk."""
+
+    @abstractmethod
+    def clear(self) -> None:
+        """Called once the store has been saved, so the journal is no longer needed."""
+
+
+class NoJobJournal(JobJournal):
+    def load(self) -> None: pass
+    def record_validated(self, path: str, file_hash: str) -> None: pass
+    def was_validated(self, path: str, file_hash: str) -> bool: return False
+    def flush(self) -> None: pass
+    def clear(self) -> None: pass
+
+
+class FileJobJournal(JobJournal):
+    def __init__(self, path: str, logger: Logger, flush_interval: float = 2.0):
+        self._path = path
+        self._logger = logger
+        self._flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._fd: Optional[int] = None
+        self._buffer = []
+        self._last_flush = time.monotonic()
+        self._validated: Dict[str, Dict[str, Any]] = {}
+
+    def load(self) -> None:
+        try:
+            with open(self._path, 'r') as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            return
+        except OSError as e:
+            self._logger.debug(e)
+            return
+
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # The last line might be truncated after a power cut.
+
+            if entry.get('state') == 'validated':
+                self._validated[entry['path']] = entry
+
+        self._logger.debug(f'Job journal: {len(self._validated)} validated files from a previous run.')
+
+    def record_validated(self, path: str, file_hash: str) -> None:
+        try:
+            stat = os.stat(path)
+        except OSError as e:
+            self._logger.debug(e)
+            return
+        self._append({'state': 'validated', 'path': path, 'hash': file_hash, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+    def was_validated(self, path: str, file_hash: str) -> bool:
+        entry = self._validated.get(path, None)
+        if entry is None or entry['hash'] != file_hash or 'mtime_ns' not in entry:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns
+
+    def clear(self) -> None:
+        with self._lock:
+            self._buffer = []
+            self._close()
+            try:
+                os.unlink(self._path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self._logger.debug(e)
+        self._validated = {}
+
+    def flush(self) -> None:
+        with self._lock:
+            self._flush()
+
+    def _append(self, entry: Dict[str, Any]) -> None:
+        with self._lock:
+            self._buffer.append(json.dumps(entry) + '\n')
+            if time.monotonic() - self._last_flush >= self._flush_interval:
+                self._flush()
+
+    def _flush(self) -> None:
+        self._last_flush = time.monotonic()
+        if len(self._buffer) == 0:
+            return
+
+        # A single sync puts every buffered file, and the renames that installed them, on disk before their entries.
+        if hasattr(os, 'sync'):
+            os.sync()
+
+        try:
+            if self._fd is None:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                self._fd = os.open(self._path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            os.write(self._fd, ''.join(self._buffer).encode())
+            os.fsync(self._fd)
+        except OSError as e:
+            self._logger.debug(e)
+        self._buffer = []
+
+    def _close(self) -> None:
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
@@ -18,12 +18,17 @@ import time
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
 from abc import abstractmethod, ABC
-from concurrent.futures import ThreadPoolExecutor, Future
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
 from dataclasses import dataclass
-from typing import Dict, Optional, Callable, List, Tuple, Any
+from typing import Dict, Optional, Callable, List, Tuple, Any, Iterable, Iterator, FrozenSet
+import heapq
+import itertools
 import queue
+import random
 import threading
 import logging
+import multiprocessing
 import signal
 
 _thread_local_storage = threading.local()
@@ -37,9 +42,10 @@ class JobSystem:
         JobSystem._next_job_type_id += 1
         return JobSystem._next_job_type_id
 
-    def __init__(self, reporter: 'ProgressReporter', max_threads: int = 6, max_tries: int = 3, wait_timeout: float = 0.1):
-        self._max_threads: int = max_threads
+    def __init__(self, reporter: 'ProgressReporter', max_threads: int = 6, max_tries: int = 3, wait_timeout: float = 0.1, max_retry_delay: float = 0, concurrency_controller: Optional['ConcurrencyController'] = None, cancellation_token: Optional['CancellationToken'] = None, max_queued_jobs: int = 1000, tracer: Optional['JobTracer'] = None):
+        self._concurrency: ConcurrencyController = concurrency_controller or FixedConcurrencyController(max_threads)
         self._max_tries: int = max_tries
+        self._max_retry_delay: float = max_retry_delay
         self._wait_timeout: float = wait_timeout
         self._reporter: ProgressReporter = reporter
         self._lock = threading.Lock()
@@ -48,30 +54,151 @@ class JobSystem:
         self._pending_jobs_amount: int = 0
         self._pending_jobs_cancelled: bool = False
         self._is_accomplishing_jobs: bool = False
-        self._package_parents: Dict[int, _JobPackage] = {}
         self._jobs_pushed = 0
+        self._delayed_packages: List[Tuple[float, int, _JobPackage]] = []
+        self._retry_stats = RetryStats()
+        self._cancellation_token: CancellationToken = cancellation_token or CancellationToken()
+        self._max_queued_jobs: int = max_queued_jobs
+        self._job_sources: List[Tuple[Iterator['Job'], Optional[Callable[['Job'], Optional[int]]]]] = []
+        self._tracer: JobTracer = tracer or NoJobTracer()
+        self._lane = 'main'
 
     def pending_jobs_amount(self) -> int:
         return self._pending_jobs_amount
 
+    def retry_stats(self) -> 'RetryStats':
+        return self._retry_stats
+
+    def concurrency_controller(self) -> 'ConcurrencyController':
+        return self._concurrency
+
+    def cancellation_token(self) -> 'CancellationToken':
+        return self._cancellation_token
+
+    def trace_transfer(self, job: 'Job', size: int) -> None:
+        self._trace('transferred', job, size)
+
     def register_worker(self, job_id: int, worker: 'Worker') -> None:
         if self._is_accomplishing_jobs:
             raise CantRegisterWorkerException('Can not register workers while accomplishing jobs')
         self._workers[job_id] = worker
 
-    def push_job(self, job: 'Job', priority: Optional[int] = None) -> None:
-        worker = self._get_worker(job)
+    def push_job(self, job: 'Job', priority: Optional[int] = None, depends_on: Optional[Iterable['JobHandle']] = None) -> 'JobHandle':
+        package = self._new_package(job, priority, getattr(_thread_local_storage, 'current_package', None))
+        with self._lock:
+            self._pending_jobs_amount += 1
+            self._link_handle(package.handle, depends_on)
+        self._trace('queued', job)
+        return package.handle
+
+    def push_jobs(self, jobs: Iterable['Job'], priority_fn: Optional[Callable[['Job'], Optional[int]]] = None) -> List['JobHandle']:
+        """Same as push_job for each job, but the whole batch is queued at once."""
         parent_package: Optional[_JobPackage] = getattr(_thread_local_storage, 'current_package', None)
+        packages = [self._new_package(job, None if priority_fn is None else priority_fn(job), parent_package) for job in jobs]
+        if len(packages) == 0:
+            return []
+
+        with self._lock:
+            self._pending_jobs_amount += len(packages)
+            if parent_package is not None:
+                parent_package.handle.outstanding += len(packages)
+
+            job_queue = self._job_queue
+            with job_queue.mutex:
+                job_queue.queue.extend(packages)
+                heapq.heapify(job_queue.queue)
+                job_queue.unfinished_tasks += len(packages)
+                job_queue.not_empty.notify(len(packages))
+        for package in packages:
+            self._trace('queued', package.job)
+        return [package.handle for package in packages]
+
+    def _new_package(self, job: 'Job', priority: Optional[int], parent_package: Optional['_JobPackage']) -> '_JobPackage':
+        worker = self._get_worker(job)
         self._jobs_pushed += 1
-        self._job_queue.put(_JobPackage(
+        package = _JobPackage(
             job=job,
             worker=worker,
             tries=0 if parent_package is None else parent_package.tries,
             priority=priority or self._jobs_pushed,
-            parent=parent_package
-        ))
+            handle=JobHandle(None if parent_package is None else parent_package.handle),
+            order=self._jobs_pushed
+        )
+        if parent_package is not None:
+            package.ancestors = parent_package.ancestors | {parent_package.job.type_id}
+            package.cyclic = parent_package.cyclic or job.type_id in package.ancestors
+
+        package.handle.package = package
+        return package
+
+    def push_job_source(self, jobs: Iterable['Job'], priority_fn: Optional[Callable[['Job'], Optional[int]]] = None) -> None:
+        """Jobs are taken from the iterable only while the queue has room, so big batches are never fully materialized."""
+        self._job_sources.append((iter(jobs), priority_fn))
+
+    def _feed_from_sources(self) -> None:
+        while len(self._job_sources) > 0:
+            room = self._max_queued_jobs - self._job_queue.qsize()
+            if room <= 0:
+                return
+
+            source, priority_fn = self._job_sources[0]
+            jobs = list(itertools.islice(source, room))
+            if len(jobs) < room:
+                self._job_sources.pop(0)
+            self.push_jobs(jobs, priority_fn)
+
+    def _has_pending_work(self) -> bool:
+        return (self._pending_jobs_amount > 0 or len(self._job_sources) > 0) and not self._pending_jobs_cancelled
+
+    def _link_handle(self, handle: 'JobHandle', depends_on: Optional[Iterable['JobHandle']]) -> None:
+        if handle.owner is not None:
+            handle.owner.outstanding += 1
+
+        for dependency in depends_on or []:
+            if dependency.done:
+                handle.dependency_failed = handle.dependency_failed or dependency.failed
+            else:
+                dependency.dependents.append(handle)
+                handle.waiting += 1
+
+        if handle.waiting == 0:
+            self._release_handles([handle])
+
+    def _release_handles(self, handles: List['JobHandle']) -> None:
+        for handle in handles:
+            self._job_queue.put(handle.package)
+
+    def _settle_handle(self, handle: Optional['JobHandle'], ready: List['JobHandle']) -> None:
+        failed = False
+        while handle is not None:
+            handle.failed = handle.failed or failed
+            handle.outstanding -= 1
+            if handle.outstanding > 0:
+                return
+
+            handle.done = True
+            for dependent in handle.dependents:
+                dependent.dependency_failed = dependent.dependency_failed or handle.failed
+                dependent.waiting -= 1
+                if dependent.waiting == 0:
+                    ready.append(dependent)
+            handle.dependents = []
+            handle.package = None
+
+            failed = handle.failed
+            owner = handle.owner
+            handle.owner = None
+            handle = owner
+
+    def _finish_handle(self, handle: 'JobHandle', failed: bool) -> None:
         with self._lock:
-            self._pending_jobs_amount += 1
+            handle.failed = handle.failed or failed
+            ready: List[JobHandle] = []
+            self._settle_handle(handle, ready)
+            self._release_handles(ready)
+
+    def _trace(self, event: str, job: 'Job', size: int = 0) -> None:
+        self._tracer.record(_job_trace_event(event, job, self._lane, size))
 
     def cancel_pending_jobs(self) -> None:
         with self._lock:
@@ -83,12 +210,16 @@ class JobSystem:
 
         self._is_accomplishing_jobs = True
         self._pending_jobs_cancelled = False
+        self._cancellation_token.reset()
         try:
-            if self._max_threads > 1:
-                self._accomplish_with_threads(self._max_threads)
+            max_threads = self._concurrency.max_limit()
+            if max_threads > 1:
+                self._lane = 'thread'
+                self._accomplish_with_threads(max_threads)
             else:
                 self._accomplish_without_threads()
         finally:
+            self._lane = 'main'
             self._is_accomplishing_jobs = False
 
     def _accomplish_with_threads(self, max_threads: int) -> None:
@@ -99,16 +230,25 @@ class JobSystem:
             futures = []
             notifications: queue.Queue[Tuple[bool, '_JobPackage']] = queue.Queue()
             with ThreadPoolExecutor(max_workers=max_threads) as thread_executor:
-                while self._pending_jobs_amount > 0 and not self._pending_jobs_cancelled:
-                    try:
-                        package = self._job_queue.get(timeout=self._wait_timeout)
-                    except queue.Empty:
-                        package = None
+                while self._has_pending_work():
+                    self._feed_from_sources()
+                    self._enqueue_due_retries()
+                    package = None
+                    if len(futures) < self._concurrency.limit():
+                        try:
+                            package = self._job_queue.get(timeout=self._wait_timeout)
+                        except queue.Empty:
+                            pass
+                    else:
+                        wait([future for _, future in futures], timeout=self._wait_timeout, return_when=FIRST_COMPLETED)
 
                     if package is not None:
                         self._assert_there_are_no_cycles(package)
-                        future = thread_executor.submit(self._operate_on_next_job, package, notifications)
-                        futures.append((package, future))
+                        if package.handle.dependency_failed:
+                            self._fail_package(package, DependencyFailedException(f'Job {package.job.type_id} depends on a job that failed'))
+                        else:
+                            future = thread_executor.submit(self._operate_on_next_job, package, notifications)
+                            futures.append((package, future))
 
                     self._handle_notifications(notifications)
                     futures = self._handle_futures(futures)
@@ -122,54 +262,105 @@ class JobSystem:
 
     def _accomplish_without_threads(self) -> None:
         notifications: queue.Queue[Tuple[bool, '_JobPackage']] = queue.Queue()
-        while self._pending_jobs_amount > 0 and not self._pending_jobs_cancelled and not self._job_queue.empty():
+        while self._has_pending_work():
+            self._feed_from_sources()
+            self._enqueue_due_retries()
+            if self._job_queue.empty():
+                if len(self._delayed_packages) == 0:
+                    break
+                time.sleep(max(0.0, min(self._wait_timeout, self._delayed_packages[0][0] - time.monotonic())))
+                continue
+
             package = self._job_queue.get(block=False)
             self._job_queue.task_done()
             if package is not None:
                 self._assert_there_are_no_cycles(package)
-                try:
-                    self._operate_on_next_job(package, notifications)
-                except BaseException as e:
-                    self._retry_package(package, e)
+                if package.handle.dependency_failed:
+                    self._fail_package(package, DependencyFailedException(f'Job {package.job.type_id} depends on a job that failed'))
+                else:
+                    try:
+                        self._operate_on_next_job(package, notifications)
+                    except BaseException as e:
+                        self._retry_package(package, e)
 
             self._handle_notifications(notifications)
             self._report_work_in_progress()
 
         self._handle_notifications(notifications)
 
-    @staticmethod
-    def _operate_on_next_job(package: '_JobPackage', notifications: queue.Queue[Tuple[bool, '_JobPackage']]) -> None:
+    def _operate_on_next_job(self, package: '_JobPackage', notifications: queue.Queue[Tuple[bool, '_JobPackage']]) -> None:
         try:
             _thread_local_storage.current_package = package
 
             job, worker = package.job, package.worker
             notifications.put((False, package))
+            self._trace('started', job)
 
             worker.operate_on(job)
 
             notifications.put((True, package))
         finally:
+            self._trace('finished', package.job)
             del _thread_local_storage.current_package
 
     def _retry_package(self, package: '_JobPackage', e: BaseException) -> None:
         if isinstance(e, JobSystemAbortException):
             raise e
-        should_retry = package.tries < self._max_tries
-        if should_retry:
-            retry_job = package.job.retry_job()
-            self._job_queue.put(_JobPackage(
-                job=retry_job,
-                worker=self._get_worker(retry_job),
-                tries=package.tries + 1,
-                priority=package.priority
-            ))
+
+        if isinstance(e, JobCancelledException):
+            self._job_queue.put(package)
+            self._trace('retried', package.job)
+            self._try_report_exception(e, lambda: self._report_job_retried(package, e))
+            return
+
+        self._concurrency.notify_job_errored(package.job, e)
+        backoff = package.worker.backoff(package.job, e)
+        if backoff is None:
+            self._retry_stats.fatal_failures += 1
+            self._fail_package(package, e)
+            return
+
+        max_tries = self._max_tries if backoff.max_tries is None else min(self._max_tries, backoff.max_tries)
+        if package.tries >= max_tries:
+            self._fail_package(package, e)
+            return
+
+        retry_job = package.job.retry_job()
+        delay = min(self._max_retry_delay, backoff.delay(package.tries))
+        retry_package = _JobPackage(
+            job=retry_job,
+            worker=self._get_worker(retry_job),
+            tries=package.tries + 1,
+            priority=package.priority,
+            handle=package.handle,
+            order=package.order,
+            ancestors=package.ancestors,
+            cyclic=package.cyclic
+        )
+        self._retry_stats.add(delay)
+        if delay > 0:
+            self._jobs_pushed += 1
+            heapq.heappush(self._delayed_packages, (time.monotonic() + delay, self._jobs_pushed, retry_package))
         else:
-            self._pending_jobs_amount -= 1
+            self._job_queue.put(retry_package)
+        self._trace('retried', package.job)
+        self._try_report_exception(e, lambda: self._report_job_retried(package, e))
+
+    def _enqueue_due_retries(self) -> None:
+        now = time.monotonic()
+        while len(self._delayed_packages) > 0 and self._delayed_packages[0][0] <= now:
+            _, _, package = heapq.heappop(self._delayed_packages)
+            self._job_queue.put(package)
+
+    def _fail_package(self, package: '_JobPackage', e: BaseException) -> None:
+        self._trace('failed', package.job)
+        self._pending_jobs_amount -= 1
+        self._finish_handle(package.handle, failed=True)
+        self._try_report_exception(e, lambda: self._report_job_failed(package, e))
+
+    def _try_report_exception(self, e: BaseException, cb: Callable[[], None]) -> None:
         try:
-            if should_retry:
-                self._report_job_retried(package, e)
-            else:
-                self._report_job_failed(package, e)
+            cb()
         except ReportException as report_exception:
             logger = logging.getLogger()
             logger.exception(e)
@@ -189,6 +380,7 @@ class JobSystem:
             completed, package = notification
             if completed:
                 self._pending_jobs_amount -= 1
+                self._finish_handle(package.handle, failed=False)
                 self._report_job_completed(package)
             else:
                 self._report_job_started(package)
@@ -205,29 +397,13 @@ class JobSystem:
         return still_pending
 
     def _assert_there_are_no_cycles(self, package: '_JobPackage') -> None:
-        parent_package = package.parent
-        if parent_package is None:
-            return
-
-        job = package.job
-        seen = set()
-        current = parent_package
-
-        while current is not None:
-            if current.job.type_id in seen:
-                raise CycleDetectedException(f'Can not push Job {package.job.type_id} because it introduced a cycle')
-
-            seen.add(current.job.type_id)
-            with self._lock:
-                current = self._package_parents.get(current.job.type_id)
-
-        if parent_package is not None:
-            with self._lock:
-                self._package_parents[job.type_id] = parent_package
+        if package.cyclic:
+            raise CycleDetectedException(f'Can not push Job {package.job.type_id} because it introduced a cycle')
 
     def _sigint_handler(self, previous_handler: Any, sig: Any, frame: Any) -> None:
         print('SHUTTING DOWN, PLEASE WAIT...')
         self.cancel_pending_jobs()
+        self._cancellation_token.cancel()
         if previous_handler is not None:
             previous_handler(sig, frame)
 
@@ -261,6 +437,8 @@ class CycleDetectedException(JobSystemAbortException): pass
 class NoWorkerException(JobSystemAbortException): pass
 class CantRegisterWorkerException(JobSystemAbortException): pass
 class CantAccomplishJobs(JobSystemAbortException): pass
+class DependencyFailedException(Exception): pass
+class JobCancelledException(Exception): pass
 class ReportException(Exception): pass
 
 
@@ -283,6 +461,148 @@ class Worker(ABC):
         """Different progress reporter for the jobs operated by this worker."""
         return None
 
+    def backoff(self, job: Job, exception: BaseException) -> Optional['Backoff']:
+        """Retry schedule for the exception raised while operating on the job. None means the error is fatal."""
+        return default_backoff
+
+
+@dataclass(frozen=True)
+class Backoff:
+    base_delay: float = 0.5
+    max_delay: float = 10.0
+    max_tries: Optional[int] = None
+
+    def delay(self, tries: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** tries)))
+
+
+default_backoff = Backoff()
+
+
+@dataclass
+class RetryStats:
+    retries: int = 0
+    fatal_failures: int = 0
+    total_delay: float = 0.0
+    longest_delay: float = 0.0
+
+    def add(self, delay: float) -> None:
+        self.retries += 1
+        self.total_delay += delay
+        self.longest_delay = max(self.longest_delay, delay)
+
+
+class ConcurrencyController(ABC):
+    @abstractmethod
+    def limit(self) -> int:
+        """Maximum amount of jobs that can be in flight right now."""
+
+    @abstractmethod
+    def max_limit(self) -> int:
+        """Upper bound for limit. Used to size the thread pool."""
+
+    def notify_transfer(self, size: int, seconds: float, write_seconds: float) -> None:
+        """Called by workers after moving data. Must be thread-safe."""
+
+    def notify_job_errored(self, job: Job, exception: BaseException) -> None:
+        """Called when a job raised an exception."""
+
+
+class FixedConcurrencyController(ConcurrencyController):
+    def __init__(self, limit: int):
+        self._limit = limit
+
+    def limit(self) -> int:
+        return self._limit
+
+    def max_limit(self) -> int:
+        return self._limit
+
+
+class CancellationToken:
+    def __init__(self):
+        self._event = threading.Event()
+
+    def cancel(self) -> None:
+        self._event.set()
+
+    def reset(self) -> None:
+        self._event.clear()
+
+    def is_cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def raise_if_cancelled(self) -> None:
+        if self._event.is_set():
+            raise JobCancelledException('Cancelled.')
+
+
+class JobHandle:
+    """Returned when pushing a job. It is done once the job, and every job pushed while operating on it, are done."""
+    __slots__ = ('owner', 'package', 'outstanding', 'waiting', 'dependents', 'dependency_failed', 'failed', 'done')
+
+    def __init__(self, owner: Optional['JobHandle']):
+        self.owner = owner
+        self.package: Optional[_JobPackage] = None
+        self.outstanding = 1
+        self.waiting = 0
+        self.dependents: List[JobHandle] = []
+        self.dependency_failed = False
+        self.failed = False
+        self.done = False
+
+
+class ProcessJob(ABC):
+    @abstractmethod
+    def run(self) -> Any:
+        """Does the CPU-heavy work. Must be picklable and self-contained, since it may run in another process."""
+
+
+class ProcessLane:
+    def __init__(self, max_processes: int):
+        self._max_processes = max_processes
+        self._lock = threading.Lock()
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._broken = False
+
+    def offload(self, job: ProcessJob) -> Any:
+        executor = self._get_executor()
+        if executor is None:
+            return job.run()
+
+        try:
+            return executor.submit(job.run).result()
+        except BrokenProcessPool as e:
+            logging.getLogger().debug(e)
+            self._broken = True
+            return job.run()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+
+    def _get_executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._max_processes <= 0 or self._broken:
+            return None
+
+        with self._lock:
+            if self._executor is None:
+                try:
+                    self._executor = ProcessPoolExecutor(max_workers=self._max_processes, mp_context=_process_context())
+                except (OSError, NotImplementedError) as e:
+                    logging.getLogger().debug(e)
+                    self._broken = True
+            return self._executor
+
+
+def _process_context():
+    # Forking a process that is already running download threads can deadlock the child, a fork server starts clean.
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context('forkserver')
+    return multiprocessing.get_context()
+
 
 class ProgressReporter(ABC):
     @abstractmethod
@@ -307,12 +627,44 @@ class ProgressReporter(ABC):
 
 
 @dataclass
+class TraceEvent:
+    event: str
+    job_type: str
+    path: Optional[str]
+    lane: str
+    timestamp: float
+    thread_id: int
+    size: int = 0
+
+
+def _job_trace_event(event: str, job: Any, lane: str, size: int = 0) -> TraceEvent:
+    # Only plain values are kept, so that recorded events don't hold finished jobs and their payloads in memory.
+    path = getattr(job, 'path', None)
+    return TraceEvent(event, type(job).__name__, path if isinstance(path, str) else None, lane, time.perf_counter(), threading.get_ident(), size)
+
+
+class JobTracer(ABC):
+    @abstractmethod
+    def record(self, event: TraceEvent) -> None:
+        """Called from any thread when a job is queued, started, finished, retried, failed or transfers bytes. Must not throw exceptions."""
+
+
+class NoJobTracer(JobTracer):
+    def record(self, event: TraceEvent) -> None: pass
+
+
 class _JobPackage:
-    job: Job
-    worker: Worker
-    tries: int
-    priority: int
-    parent: Optional['_JobPackage'] = None
+    __slots__ = ('job', 'worker', 'tries', 'priority', 'handle', 'order', 'ancestors', 'cyclic')
+
+    def __init__(self, job: Job, worker: Worker, tries: int, priority: int, handle: JobHandle, order: int = 0, ancestors: FrozenSet[int] = frozenset(), cyclic: bool = False):
+        self.job = job
+        self.worker = worker
+        self.tries = tries
+        self.priority = priority
+        self.handle = handle
+        self.order = order
+        self.ancestors = ancestors
+        self.cyclic = cyclic
 
     def __lt__(self, other: '_JobPackage') -> bool:
-        return self.priority < other.priority
+        return self.priority < other.priority or (self.priority == other.priority and self.order < other.order)
@@ -0,0 +1,48 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+from http.client import HTTPException
+from typing import Optional
+
+from downloader.http_gateway import HttpGatewayException
+from downloader.job_system import Backoff
+from downloader.jobs.errors import BadHttpStatusException, BadFileHashException, BadFileSizeException
+
+
+network_backoff = Backoff(base_delay=1.0, max_delay=15.0)
+server_busy_backoff = Backoff(base_delay=4.0, max_delay=60.0)
+bad_hash_backoff = Backoff(base_delay=1.0, max_delay=1.0, max_tries=1)
+default_file_backoff = Backoff(base_delay=0.5, max_delay=5.0)
+
+fatal_http_statuses = {400, 401, 403, 404, 405, 410, 414, 451}
+
+
+def backoff_for_exception(exception: BaseException) -> Optional[Backoff]:
+    if isinstance(exception, BadHttpStatusException):
+        if exception.status in fatal_http_statuses:
+            return None
+        elif exception.status == 429 or exception.status >= 500:
+            return server_busy_backoff
+        else:
+            return network_backoff
+    elif isinstance(exception, (BadFileHashException, BadFileSizeException)):
+        return bad_hash_backoff
+    elif isinstance(exception, (HttpGatewayException, HTTPException, OSError)):
+        return network_backoff
+    else:
+        return default_file_backoff
@@ -0,0 +1,87 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import socket
+import threading
+import time
+from http.client import HTTPException
+from typing import Callable
+
+from downloader.http_gateway import HttpGatewayException
+from downloader.job_system import ConcurrencyController, Job
+from downloader.jobs.errors import BadHttpStatusException
+
+
+class AimdConcurrencyController(ConcurrencyController):
+    """Additive increase while throughput keeps improving, multiplicative decrease on errors or write saturation."""
+
+    def __init__(self, min_limit: int = 2, max_limit: int = 20, initial_limit: int = 4, window_seconds: float = 2.0, clock: Callable[[], float] = time.monotonic):
+        self._min_limit = min_limit
+        self._max_limit = max(min_limit, max_limit)
+        self._limit = min(self._max_limit, max(min_limit, initial_limit))
+        self._window_seconds = window_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._window_start = clock()
+        self._window_bytes = 0
+        self._window_transfer_seconds = 0.0
+        self._window_write_seconds = 0.0
+        self._window_errors = 0
+        self._last_throughput = 0.0
+
+    def limit(self) -> int:
+        with self._lock:
+            now = self._clock()
+            if now - self._window_start >= self._window_seconds:
+                self._adjust(now)
+            return self._limit
+
+    def max_limit(self) -> int:
+        return self._max_limit
+
+    def notify_transfer(self, size: int, seconds: float, write_seconds: float) -> None:
+        with self._lock:
+            self._window_bytes += size
+            self._window_transfer_seconds += seconds
+            self._window_write_seconds += write_seconds
+
+    def notify_job_errored(self, job: Job, exception: BaseException) -> None:
+        if isinstance(exception, BadHttpStatusException) and exception.status != 429 and exception.status < 500:
+            return
+
+        if isinstance(exception, (BadHttpStatusException, HttpGatewayException, HTTPException, socket.timeout, ConnectionError)):
+            with self._lock:
+                self._window_errors += 1
+
+    def _adjust(self, now: float) -> None:
+        throughput = self._window_bytes / (now - self._window_start)
+        write_saturated = self._window_transfer_seconds > 0 and self._window_write_seconds / self._window_transfer_seconds > 0.8
+
+        if self._window_errors > 0 or write_saturated:
+            self._limit = max(self._min_limit, self._limit // 2)
+            self._last_throughput = throughput
+        elif self._window_bytes > 0:
+            if throughput > self._last_throughput * 1.05:
+                self._limit = min(self._max_limit, self._limit + 1)
+            self._last_throughput = throughput
+
+        self._window_start = now
+        self._window_bytes = 0
+        self._window_transfer_seconds = 0.0
+        self._window_write_seconds = 0.0
+        self._window_errors = 0
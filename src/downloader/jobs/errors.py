@@ -18,3 +18,11 @@
 
 
 class FileDownloadException(Exception): pass
+class BadFileHashException(FileDownloadException): pass
+class BadFileSizeException(FileDownloadException): pass
+
+
+class BadHttpStatusException(FileDownloadException):
+    def __init__(self, message: str, status: int):
+        super().__init__(message)
+        self.status = status
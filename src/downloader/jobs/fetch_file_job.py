@@ -17,15 +17,24 @@
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
 from dataclasses import dataclass, field
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 
 from downloader.job_system import Job, JobSystem
 
 
+@dataclass
+class ArchiveExtraction:
+    files: Dict[str, str]
+    archive_format: str
+    failed_files: List[str] = field(default_factory=list)
+    streamed: bool = True
+
+
 @dataclass
 class FetchFileJob(Job):
     type_id: int = field(init=False, default=JobSystem.get_job_type_id())
     path: str
     description: Dict[str, Any]
     hash_check: bool
-    after_validation: Optional[Job] = None
+    boot_critical: bool = False
+    extraction: Optional[ArchiveExtraction] = None
@@ -16,12 +16,18 @@
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
-from typing import Dict, Any
+import time
+from typing import Dict, Any, Optional, Tuple
 
-from downloader.jobs.fetch_file_job import FetchFileJob
+from downloader.archive_stream import ArchiveStreamError, ArchiveStreamHashError, UnsupportedArchiveStreamError
+from downloader.jobs.fetch_file_job import FetchFileJob, ArchiveExtraction
+from downloader.jobs.priorities import boot_critical_validation_priority, validation_priority
 from downloader.jobs.validate_file_job import ValidateFileJob
 from downloader.jobs.worker_context import DownloaderWorker
-from downloader.jobs.errors import FileDownloadException
+from downloader.job_system import JobCancelledException
+from downloader.jobs.errors import FileDownloadException, BadHttpStatusException, BadFileSizeException, BadFileHashException
+from downloader.file_system import StreamWriteResult, StreamSizeExceededError
+from downloader.target_path_repository import downloader_in_progress_postfix
 
 
 class FetchFileWorker(DownloaderWorker):
@@ -30,14 +36,82 @@ class FetchFileWorker(DownloaderWorker):
 
     def operate_on(self, job: FetchFileJob):
         file_path, description = job.path, job.description
-        self._fetch_file(file_path, description)
-        self._ctx.job_system.push_job(ValidateFileJob(fetch_job=job), priority=1)
+        if job.extraction is not None and job.extraction.streamed:
+            result = self._extract_file(file_path, description, job.hash_check, job.extraction)
+        else:
+            result = self._fetch_file(file_path, description, job.hash_check)
+        self._ctx.job_system.trace_transfer(job, result.size)
+        self._ctx.job_system.push_job(ValidateFileJob(fetch_job=job, stream_hash=result.md5), priority=boot_critical_validation_priority if job.boot_critical else validation_priority)
 
-    def _fetch_file(self, file_path: str, description: Dict[str, Any]):
+    def _fetch_file(self, file_path: str, description: Dict[str, Any], hash_check: bool) -> StreamWriteResult:
         target_path = self._ctx.file_system.download_target_path(self._ctx.target_path_repository.create_target(file_path, description))
-        with self._ctx.http_gateway.open(description['url']) as (final_url, in_stream):
-            description['url'] = final_url
-            if in_stream.status != 200:
-                raise FileDownloadException(f'Bad http status! {file_path}: {in_stream.status}')
+        offset, validator = self._resume_point(file_path, target_path, description)
+        start = time.monotonic()
+        response_validator = None
+        try:
+            with self._ctx.http_gateway.open(description['url'], headers=None if offset == 0 else {'Range': f'bytes={offset}-', 'If-Range': validator}) as (final_url, in_stream):
+                description['url'] = final_url
+                response_validator = _range_validator(in_stream)
+                if in_stream.status == 416:
+                    self._ctx.target_path_repository.clean_target(file_path)
 
-            self._ctx.file_system.write_incoming_stream(in_stream, target_path)
+                resuming = offset > 0 and in_stream.status == 206
+                if in_stream.status != 200 and not resuming:
+                    raise BadHttpStatusException(f'Bad http status! {file_path}: {in_stream.status}', in_stream.status)
+
+                max_size = description['size'] - (offset if resuming else 0) if hash_check and 'size' in description else None
+                result = self._ctx.file_system.write_incoming_stream(in_stream, target_path, self._ctx.job_system.cancellation_token(), append=resuming, max_size=max_size)
+        except JobCancelledException as e:
+            self._ctx.target_path_repository.keep_partial_target(file_path, response_validator)
+            raise e
+        except StreamSizeExceededError as e:
+            self._ctx.target_path_repository.clean_target(file_path)
+            raise BadFileSizeException(f'Bad size on {file_path}: {e}') from e
+
+        self._ctx.job_system.concurrency_controller().notify_transfer(result.size, time.monotonic() - start, result.write_seconds)
+        return result
+
+    def _extract_file(self, file_path: str, description: Dict[str, Any], hash_check: bool, extraction: ArchiveExtraction) -> StreamWriteResult:
+        start = time.monotonic()
+        try:
+            with self._ctx.http_gateway.open(description['url']) as (final_url, in_stream):
+                description['url'] = final_url
+                if in_stream.status != 200:
+                    raise BadHttpStatusException(f'Bad http status! {file_path}: {in_stream.status}', in_stream.status)
+
+                max_size = description['size'] if hash_check and 'size' in description else None
+                expected_md5 = description['hash'] if hash_check else None
+                result = self._ctx.file_system.extract_incoming_stream(in_stream, extraction.archive_format, extraction.files, self._ctx.job_system.cancellation_token(), max_size=max_size, expected_md5=expected_md5)
+        except UnsupportedArchiveStreamError as e:
+            self._ctx.logger.debug(f'Can not extract {file_path} while downloading it ({e}), downloading it first.')
+            extraction.streamed = False
+            return self._fetch_file(file_path, description, hash_check)
+        except StreamSizeExceededError as e:
+            raise BadFileSizeException(f'Bad size on {file_path}: {e}') from e
+        except ArchiveStreamHashError as e:
+            raise BadFileHashException(f'Bad hash on {file_path}: {e}') from e
+        except ArchiveStreamError as e:
+            raise FileDownloadException(f'Bad archive {file_path}: {e}') from e
+
+        extraction.failed_files = result.failed_files
+        self._ctx.job_system.concurrency_controller().notify_transfer(result.size, time.monotonic() - start, result.write_seconds)
+        return result
+
+    def _resume_point(self, file_path: str, target_path: str, description: Dict[str, Any]) -> Tuple[int, Optional[str]]:
+        if not target_path.endswith(downloader_in_progress_postfix):
+            return 0, None
+
+        # Without the validator of the original response, a changed remote file can't be told apart, so it starts over.
+        validator = self._ctx.target_path_repository.take_resume_validator(file_path)
+        size = self._ctx.file_system.size(target_path)
+        if validator is None or size >= description.get('size', 0):
+            return 0, None
+
+        return size, validator
+
+
+def _range_validator(response: Any) -> Optional[str]:
+    etag = response.headers.get('ETag', None)
+    if etag is not None and not etag.startswith('W/'):  # If-Range only accepts strong ETags.
+        return etag
+    return response.headers.get('Last-Modified', None)
@@ -26,9 +26,10 @@ from downloader.db_entity import DbEntity
 from downloader.http_gateway import HttpGatewayException
 from downloader.jobs.validate_file_job import ValidateFileJob
 from downloader.jobs.fetch_file_job import FetchFileJob
+from downloader.jobs.unzip_contents_job import UnzipContentsJob
 from downloader.jobs.errors import FileDownloadException
 from downloader.waiter import Waiter
-from downloader.job_system import ProgressReporter, Job
+from downloader.job_system import ProgressReporter, Job, DependencyFailedException
 from downloader.logger import Logger
 
 
@@ -185,6 +186,9 @@ class FileDownloadProgressReporter(ProgressReporter):
             )
 
     def notify_job_failed(self, job: Job, exception: BaseException):
+        if isinstance(exception, DependencyFailedException):
+            return  # The job it depends on already reported its file as failed, and this one never started.
+
         _, path = self._url_path_from_job(job)
         self._failed_files.append(path)
         self.notify_job_retried(job, exception)
@@ -202,6 +206,8 @@ class FileDownloadProgressReporter(ProgressReporter):
             job = job.fetch_job
         if isinstance(job, FetchFileJob):
             url, path = job.description.get('url', None) or '', job.path
+        elif isinstance(job, UnzipContentsJob):
+            url, path = '', job.zip_path
         else:
             return None
         return url, path
@@ -0,0 +1,100 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import List, Tuple, Dict, Any, Optional
+import itertools
+import posixpath
+
+QueuedFile = Tuple[str, Dict[str, Any]]
+
+
+class SchedulingPolicy(ABC):
+    @abstractmethod
+    def order(self, files: List[QueuedFile]) -> List[QueuedFile]:
+        """Returns the files in the order they should be fetched. Entries with a 'db' description are database headers, and come right before the files of that database."""
+
+
+class QueueOrderPolicy(SchedulingPolicy):
+    def order(self, files: List[QueuedFile]) -> List[QueuedFile]: return list(files)
+
+
+class LargestFirstPolicy(SchedulingPolicy):
+    """Starts the big files early so they don't stretch the tail of the run."""
+    def order(self, files: List[QueuedFile]) -> List[QueuedFile]:
+        headers, rest = _split_headers(files)
+        return headers + sorted(rest, key=lambda entry: -_size(entry))
+
+
+class SmallestFirstPolicy(SchedulingPolicy):
+    """Completes as many files as possible as soon as possible."""
+    def order(self, files: List[QueuedFile]) -> List[QueuedFile]:
+        headers, rest = _split_headers(files)
+        return headers + sorted(rest, key=_size)
+
+
+class RoundRobinByDatabasePolicy(SchedulingPolicy):
+    """Takes one file of each database in turn, so a huge database doesn't starve the others."""
+    def order(self, files: List[QueuedFile]) -> List[QueuedFile]:
+        result = []
+        groups = [iter(group) for group in _split_by_database(files)]
+        for entries in itertools.zip_longest(*groups):
+            result.extend(entry for entry in entries if entry is not None)
+        return result
+
+
+class GroupedByDirectoryPolicy(SchedulingPolicy):
+    """Keeps files of the same directory together, so consecutive writes hit the same FAT directory entries."""
+    def order(self, files: List[QueuedFile]) -> List[QueuedFile]:
+        headers, rest = _split_headers(files)
+        directories: Dict[str, List[QueuedFile]] = OrderedDict()
+        for entry in rest:
+            directories.setdefault(posixpath.dirname(entry[0].lower()), []).append(entry)
+        return headers + [entry for directory in directories.values() for entry in directory]
+
+
+scheduling_policies = {
+    'queue_order': QueueOrderPolicy,
+    'largest_first': LargestFirstPolicy,
+    'smallest_first': SmallestFirstPolicy,
+    'round_robin_by_database': RoundRobinByDatabasePolicy,
+    'grouped_by_directory': GroupedByDirectoryPolicy,
+}
+
+
+def _size(entry: QueuedFile) -> int:
+    return entry[1].get('size', 0)
+
+
+def _split_headers(files: List[QueuedFile]) -> Tuple[List[QueuedFile], List[QueuedFile]]:
+    headers, rest = [], []
+    for entry in files:
+        (headers if 'db' in entry[1] else rest).append(entry)
+    return headers, rest
+
+
+def _split_by_database(files: List[QueuedFile]) -> List[List[QueuedFile]]:
+    groups: List[List[QueuedFile]] = []
+    current: Optional[List[QueuedFile]] = None
+    for entry in files:
+        if current is None or 'db' in entry[1]:
+            current = []
+            groups.append(current)
+        current.append(entry)
+    return groups
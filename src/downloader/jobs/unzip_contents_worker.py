@@ -0,0 +1,42 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+from typing import Optional
+
+from downloader.job_system import Job, Backoff
+from downloader.jobs.unzip_contents_job import UnzipContentsJob
+from downloader.jobs.worker_context import DownloaderWorker
+
+
+class UnzipContentsWorker(DownloaderWorker):
+    def initialize(self): self._ctx.job_system.register_worker(UnzipContentsJob.type_id, self)
+    def reporter(self): return self._ctx.file_download_reporter
+
+    def backoff(self, job: Job, exception: BaseException) -> Optional[Backoff]:
+        return None  # Extracting the same archive again won't fix it.
+
+    def operate_on(self, job: UnzipContentsJob):
+        if job.extraction.streamed:
+            return  # Already extracted while it was being downloaded.
+
+        try:
+            if job.target_folder_path is not None:
+                self._ctx.file_system.unzip_contents(job.zip_path, job.target_folder_path, job.contained_files)
+            else:
+                job.extraction.failed_files = self._ctx.file_system.unzip_files(job.zip_path, job.extraction.files)
+        finally:
+            self._ctx.file_system.unlink(job.zip_path)
@@ -17,6 +17,7 @@
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
 from dataclasses import dataclass, field
+from typing import Optional
 
 from downloader.job_system import Job, JobSystem
 from downloader.jobs.fetch_file_job import FetchFileJob
@@ -26,5 +27,6 @@ from downloader.jobs.fetch_file_job import FetchFileJob
 class ValidateFileJob(Job):
     type_id: int = field(init=False, default=JobSystem.get_job_type_id())
     fetch_job: FetchFileJob
+    stream_hash: Optional[str] = None
 
     def retry_job(self): return self.fetch_job
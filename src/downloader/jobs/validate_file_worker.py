@@ -16,9 +16,11 @@
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
+from typing import Optional
+
 from downloader.jobs.validate_file_job import ValidateFileJob
 from downloader.jobs.worker_context import DownloaderWorker
-from downloader.jobs.errors import FileDownloadException
+from downloader.jobs.errors import FileDownloadException, BadFileHashException
 
 
 class ValidateFileWorker(DownloaderWorker):
@@ -27,19 +29,26 @@ class ValidateFileWorker(DownloaderWorker):
 
     def operate_on(self, job: ValidateFileJob):
         file_path, file_hash, hash_check = job.fetch_job.path, job.fetch_job.description['hash'], job.fetch_job.hash_check
-        self._validate_file(file_path, file_hash, hash_check)
-        if job.fetch_job.after_validation is not None:
-            self._ctx.job_system.push_job(job.fetch_job.after_validation)
+        if job.fetch_job.extraction is not None and job.fetch_job.extraction.streamed:
+            self._validate_extracted_archive(file_path, file_hash, hash_check, job.stream_hash)
+        else:
+            self._validate_file(file_path, file_hash, hash_check, job.stream_hash)
+            self._ctx.job_journal.record_validated(self._ctx.file_system.download_target_path(file_path), file_hash)
 
-    def _validate_file(self, file_path: str, file_hash: str, hash_check: bool):
+    def _validate_file(self, file_path: str, file_hash: str, hash_check: bool, stream_hash: Optional[str]):
         target_path = self._ctx.target_path_repository.access_target(file_path)
         if not self._ctx.file_system.is_file(target_path, use_cache=False):
             self._ctx.target_path_repository.clean_target(file_path)
             raise FileDownloadException(f'Missing {file_path}')
 
-        path_hash = self._ctx.file_system.hash(target_path)
+        path_hash = stream_hash if stream_hash is not None else self._ctx.file_system.hash(target_path)
         if hash_check and path_hash != file_hash:
             self._ctx.target_path_repository.clean_target(file_path)
-            raise FileDownloadException(f'Bad hash on {file_path} ({file_hash} != {path_hash})')
+            raise BadFileHashException(f'Bad hash on {file_path} ({file_hash} != {path_hash})')
 
         self._ctx.target_path_repository.finish_target(file_path)
+
+    def _validate_extracted_archive(self, file_path: str, file_hash: str, hash_check: bool, stream_hash: Optional[str]):
+        # The archive was never stored, only its members, so its hash can only come from the stream.
+        if hash_check and stream_hash != file_hash:
+            raise BadFileHashException(f'Bad hash on {file_path} ({file_hash} != {stream_hash})')
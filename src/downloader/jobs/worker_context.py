@@ -18,10 +18,13 @@
 
 from abc import abstractmethod
 from dataclasses import dataclass
+from typing import Optional
 
 from downloader.file_system import FileSystem
 from downloader.http_gateway import HttpGateway
-from downloader.job_system import JobSystem, Worker
+from downloader.job_journal import JobJournal
+from downloader.job_system import JobSystem, Worker, Job, Backoff
+from downloader.jobs.backoffs import backoff_for_exception
 from downloader.jobs.reporters import FileDownloadProgressReporter
 from downloader.logger import Logger
 from downloader.target_path_repository import TargetPathRepository
@@ -37,6 +40,7 @@ class DownloaderWorkerContext:
     file_system: FileSystem
     waiter: Waiter
     file_download_reporter: FileDownloadProgressReporter
+    job_journal: JobJournal
 
 
 class DownloaderWorker(Worker):
@@ -46,3 +50,6 @@ class DownloaderWorker(Worker):
     @abstractmethod
     def initialize(self):
         """Initialize the worker"""
+
+    def backoff(self, job: Job, exception: BaseException) -> Optional[Backoff]:
+        return backoff_for_exception(exception)
@@ -20,11 +20,13 @@ from typing import Dict, Any, List
 
 from downloader.file_system import FileSystem
 from downloader.http_gateway import HttpGateway
+from downloader.job_journal import JobJournal
 from downloader.job_system import JobSystem
 from downloader.jobs.db_header_job import DbHeaderWorker
 from downloader.jobs.validate_file_worker import ValidateFileWorker
 from downloader.jobs.fetch_file_worker import FetchFileWorker
 from downloader.jobs.reporters import FileDownloadProgressReporter
+from downloader.jobs.unzip_contents_worker import UnzipContentsWorker
 from downloader.jobs.worker_context import DownloaderWorkerContext, DownloaderWorker
 from downloader.logger import Logger
 from downloader.target_path_repository import TargetPathRepository
@@ -32,7 +34,7 @@ from downloader.waiter import Waiter
 
 
 class DownloaderWorkersFactory:
-    def __init__(self, config: Dict[str, Any], waiter: Waiter, logger: Logger, file_system: FileSystem, target_path_repository: TargetPathRepository, file_download_reporter: FileDownloadProgressReporter, job_system: JobSystem, http_gateway: HttpGateway):
+    def __init__(self, config: Dict[str, Any], waiter: Waiter, logger: Logger, file_system: FileSystem, target_path_repository: TargetPathRepository, file_download_reporter: FileDownloadProgressReporter, job_system: JobSystem, http_gateway: HttpGateway, job_journal: JobJournal):
         self._config = config
         self._waiter = waiter
         self._logger = logger
@@ -41,6 +43,7 @@ class DownloaderWorkersFactory:
         self._file_download_reporter = file_download_reporter
         self._job_system = job_system
         self._http_gateway = http_gateway
+        self._job_journal = job_journal
 
     def prepare_workers(self):
         work_ctx = DownloaderWorkerContext(
@@ -50,12 +53,14 @@ class DownloaderWorkersFactory:
             http_gateway=self._http_gateway,
             file_system=self._file_system,
             target_path_repository=self._target_path_repository,
-            file_download_reporter=self._file_download_reporter
+            file_download_reporter=self._file_download_reporter,
+            job_journal=self._job_journal
         )
         workers: List[DownloaderWorker] = [
             FetchFileWorker(work_ctx),
             ValidateFileWorker(work_ctx),
             DbHeaderWorker(work_ctx),
+            UnzipContentsWorker(work_ctx),
         ]
         for w in workers:
             w.initialize()
@@ -119,7 +119,7 @@ class LinuxUpdater:
                 self._logger.print()
                 return
 
-        if not self._file_system.is_file(FILE_Linux_7z):
+        if not self._file_system.is_file(FILE_Linux_7z, use_cache=False):
             self._logger.print('ERROR! 7z is not present in the system.')
             self._logger.print('Aborting Linux update.')
             self._logger.print()
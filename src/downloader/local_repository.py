@@ -18,13 +18,14 @@
 from downloader.constants import FILE_downloader_storage_zip, FILE_downloader_log, \
     FILE_downloader_last_successful_run, K_CONFIG_PATH, K_BASE_SYSTEM_PATH, \
     FILE_downloader_external_storage, K_LOGFILE, FILE_downloader_storage_json
+from downloader.job_journal import JobJournal, NoJobJournal
 from downloader.local_store_wrapper import LocalStoreWrapper
 from downloader.other import UnreachableException, empty_store_without_base_path
 from downloader.store_migrator import make_new_local_store
 
 
 class LocalRepository:
-    def __init__(self, config, logger, file_system, store_migrator, external_drives_repository):
+    def __init__(self, config, logger, file_system, store_migrator, external_drives_repository, job_journal: JobJournal = None):
         self._config = config
         self._logger = logger
         self._file_system = file_system
@@ -35,6 +36,7 @@ class LocalRepository:
         self._storage_path_load_value = None
         self._last_successful_run_value = None
         self._logfile_path_value = None
+        self._job_journal = job_journal or NoJobJournal()
 
     @property
     def _storage_save_path(self):
@@ -76,6 +78,10 @@ class LocalRepository:
     def set_logfile_path(self, value):
         self._logfile_path_value = value
 
+    @property
+    def job_journal(self) -> JobJournal:
+        return self._job_journal
+
     def load_store(self):
         self._logger.bench('Loading store...')
 
@@ -92,6 +98,7 @@ class LocalRepository:
         self._store_migrator.migrate(local_store)  # exception must be fixed, users are not modifying this by hand
 
         external_drives = self._store_drives()
+        self._job_journal.load()
 
         for drive in external_drives:
             external_store_file = '%s/%s' % (drive, FILE_downloader_external_storage)
@@ -125,6 +132,7 @@ class LocalRepository:
     def save_store(self, local_store_wrapper):
         if not local_store_wrapper.needs_save():
             self._logger.debug('Skipping local_store saving...')
+            self._job_journal.clear()
             return
 
         local_store = local_store_wrapper.unwrap_local_store()
@@ -161,6 +169,7 @@ class LocalRepository:
                 self._file_system.unlink(db_to_clean)
 
         self._file_system.touch(self._last_successful_run)
+        self._job_journal.clear()
 
     def save_log_from_tmp(self, path):
         self._file_system.turn_off_logs()
@@ -140,9 +140,13 @@ class _OfflineDatabaseImporter:
         return summary_downloader.errors()
 
     def _import_files(self, files, read_store, write_store):
+        hashes = self._file_system.hash_many([
+            file_path for file_path, file_description in files.items()
+            if file_description['hash'] != 'ignore' and file_path not in read_store.files and self._file_system.is_file(file_path)
+        ])
         for file_path, file_description in files.items():
             if self._file_system.is_file(file_path) and \
-                    (file_description['hash'] == 'ignore' or self._file_system.hash(file_path) == file_description['hash']) and \
+                    (file_description['hash'] == 'ignore' or hashes.get(file_path, None) == file_description['hash']) and \
                     file_path not in read_store.files:
                 write_store.add_file(file_path, file_description)
 
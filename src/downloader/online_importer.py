@@ -18,12 +18,16 @@
 
 from typing import Dict, Set
 
+from downloader.archive_stream import archive_format
 from downloader.config import download_sensitive_configs
 from downloader.constants import K_BASE_PATH, K_ZIP_FILE_COUNT_THRESHOLD,\
     K_ZIP_ACCUMULATED_MB_THRESHOLD, FILE_MiSTer_new, FILE_MiSTer, FILE_MiSTer_old, K_BASE_SYSTEM_PATH
 from downloader.file_filter import BadFileFilterPartException
-from downloader.file_system import FolderCreationError, ReadOnlyFileSystem, UnlinkTemporaryException, FileCopyError
+from downloader.file_system import FolderCreationError, ReadOnlyFileSystem, UnlinkTemporaryException, zip_members
 from downloader.free_space_reservation import FreeSpaceReservation
+from downloader.job_journal import JobJournal
+from downloader.jobs.fetch_file_job import ArchiveExtraction
+from downloader.jobs.unzip_contents_job import UnzipContentsJob
 from downloader.other import UnreachableException, calculate_url
 
 
@@ -108,7 +112,7 @@ class OnlineImporter:
             resolver = _Resolver(filtered_db, read_only_store, config, path_resolver, self._local_repository, self._logger, self._base_session, externals)
             resolved_db = resolver.translate_paths()
 
-            db_file_selector = _DatabaseFileSelector(resolved_db, read_only_store, full_resync, file_system, self._logger, self._base_session, self._free_space_reservation)
+            db_file_selector = _DatabaseFileSelector(resolved_db, read_only_store, full_resync, file_system, self._logger, self._base_session, self._free_space_reservation, self._local_repository.job_journal)
 
             self._logger.bench('Precaching files...')
             file_system.precache_is_file_with_folders(resolved_db.folders.keys())
@@ -204,6 +208,8 @@ class OnlineImporter:
                     download_description = {'hash': file_description['hash'], 'size': file_description['size']}
                     if 'url' in file_description:
                         download_description['url'] = file_description['url']
+                    if file_description.get('reboot', False):
+                        download_description['reboot'] = True
 
                     base_files_url = db.base_files_url
                     if 'zip_id' in file_description and file_description['zip_id'] in db.zips:
@@ -735,7 +741,7 @@ class _OnlineZipSummaries:
 
 
 class _DatabaseFileSelector:
-    def __init__(self, db, read_only_store, full_resync, file_system, logger, session, free_space_reservation: FreeSpaceReservation):
+    def __init__(self, db, read_only_store, full_resync, file_system, logger, session, free_space_reservation: FreeSpaceReservation, job_journal: JobJournal):
         self._db = db
         self._read_only_store = read_only_store
         self._full_resync = full_resync
@@ -743,12 +749,16 @@ class _DatabaseFileSelector:
         self._logger = logger
         self._session = session
         self._free_space_reservation = free_space_reservation
+        self._job_journal = job_journal
+        self._validated_by_interrupted_run = {}
 
     def select_changed_files(self):
         changed_files = {}
         already_present_files = {}
         needed_zips = {}
 
+        hashes = self._file_system.hash_many([file_path for file_path, file_description in self._db.files.items() if self._needs_disk_hash(file_path, file_description)])
+
         for file_path, file_description in self._db.files.items():
             if file_path in self._session.processed_files:
                 self._logger.print('DUPLICATED: %s' % file_path)
@@ -762,12 +772,16 @@ class _DatabaseFileSelector:
                     already_present_files[file_path] = [file_description, True]
                     continue
 
-                if store_hash == 'file_does_not_exist_so_cant_get_hash' and self._file_system.hash(file_path) == file_description['hash']:
+                if self._was_validated_by_interrupted_run(file_path, file_description):
+                    already_present_files[file_path] = [file_description, False]
+                    continue
+
+                if store_hash == 'file_does_not_exist_so_cant_get_hash' and self._disk_hash(hashes, file_path) == file_description['hash']:
                     already_present_files[file_path] = [file_description, False]
                     continue
 
                 if 'overwrite' in file_description and not file_description['overwrite']:
-                    if self._file_system.hash(file_path) != file_description['hash']:
+                    if self._disk_hash(hashes, file_path) != file_description['hash']:
                         self._session.add_new_file_not_overwritten(self._db.db_id, file_path)
                     continue
 
@@ -786,6 +800,29 @@ class _DatabaseFileSelector:
 
         return changed_files, already_present_files, needed_zips
 
+    def _needs_disk_hash(self, file_path, file_description):
+        if file_path in self._session.processed_files or not self._file_system.is_file(file_path):
+            return False
+
+        store_hash = self._read_only_store.hash_file(file_path)
+        if not self._full_resync and store_hash == file_description['hash']:
+            return False
+
+        if store_hash != 'file_does_not_exist_so_cant_get_hash' and file_description.get('overwrite', True):
+            return False
+
+        return not self._was_validated_by_interrupted_run(file_path, file_description)
+
+    def _disk_hash(self, hashes, file_path):
+        if file_path in hashes:
+            return hashes[file_path]
+        return self._file_system.hash(file_path)
+
+    def _was_validated_by_interrupted_run(self, file_path, file_description):
+        if file_path not in self._validated_by_interrupted_run:
+            self._validated_by_interrupted_run[file_path] = self._job_journal.was_validated(self._file_system.download_target_path(file_path), file_description['hash'])
+        return self._validated_by_interrupted_run[file_path]
+
 
 class _OnlineDatabaseImporter:
     def __init__(self, db, write_only_store, read_only_store, externals, config, file_system,
@@ -850,6 +887,7 @@ class _OnlineDatabaseImporter:
     def _import_zip_contents(self, needed_zips, filtered_zip_data, file_downloader, not_fitting_files):
         zip_downloader = self._file_downloader_factory.create(self._config, parallel_update=True)
         zip_ids_by_temp_zip = dict()
+        extractions_by_temp_zip = dict()
 
         temp_filename = self._file_system.unique_temp_filename()
 
@@ -875,7 +913,14 @@ class _OnlineDatabaseImporter:
 
             temp_zip = '%s_%s_contents.zip' % (temp_filename.value, zip_id)
             zip_ids_by_temp_zip[temp_zip] = zip_id
-            zip_downloader.queue_file(self._db.zips[zip_id]['contents_file'], temp_zip)
+            unzip_job = self._unzip_contents_job(temp_zip, zip_id, zipped_files)
+            if not unzip_job.extraction.streamed and unzip_job.extraction.archive_format != 'zip':
+                self._logger.print('ERROR: Contents of %s can only be extracted from a zip file, contact the db maintainer. Skipping...' % zip_id)
+                self._session.zips_that_failed.append(zip_id)
+                continue
+
+            extractions_by_temp_zip[temp_zip] = unzip_job.extraction
+            zip_downloader.queue_file(self._db.zips[zip_id]['contents_file'], temp_zip, unzip_job.extraction, unzip_job)
 
         temp_filename.close()
 
@@ -885,28 +930,39 @@ class _OnlineDatabaseImporter:
         zip_downloader.download_files(self._is_first_run())
         for temp_zip in sorted(zip_downloader.correctly_downloaded_files()):
             zip_id = zip_ids_by_temp_zip[temp_zip]
-            zipped_files = needed_zips[zip_id]
-            zip_description = self._db.zips[zip_id]
-
-            self._import_zip_contents_from_temp_zip(temp_zip, zip_id, zipped_files, zip_description, filtered_zip_data, file_downloader)
+            self._import_zip_contents_from_extraction(zip_id, self._db.zips[zip_id], filtered_zip_data, file_downloader, extractions_by_temp_zip[temp_zip])
 
         self._session.files_that_failed.extend(zip_downloader.errors())
 
-    def _import_zip_contents_from_temp_zip(self, temp_zip, zip_id, zipped_files, zip_description, filtered_zip_data, file_downloader):
+    def _unzip_contents_job(self, temp_zip, zip_id, zipped_files):
+        zip_description = self._db.zips[zip_id]
         kind = zip_description['kind']
+        contents_format = archive_format(zip_description['contents_file'].get('url', '')) or 'zip'
         if kind == 'extract_all_contents':
-            target_folder_path = zip_description['target_folder_path']
-            if target_folder_path[0] == '|':
-                target_folder_path = target_folder_path[1:]
+            target_folder_path = _target_folder_path(zip_description)
+            members = zip_members(target_folder_path, zipped_files['files'])
+            files = {} if members is None else dict(zip(zipped_files['files'], members))
+            extraction = ArchiveExtraction(files=files, archive_format=contents_format, streamed=members is not None)
+            return UnzipContentsJob(zip_path=temp_zip, extraction=extraction, target_folder_path=target_folder_path, contained_files=zipped_files['files'])
+        elif kind == 'extract_single_files':
+            files = {file_path: file_description['zip_path'] for file_path, file_description in zipped_files['files'].items()}
+            return UnzipContentsJob(zip_path=temp_zip, extraction=ArchiveExtraction(files=files, archive_format=contents_format))
+        else:
+            raise UnreachableException('ERROR: ZIP %s has wrong field kind "%s", contact the db maintainer.' % (zip_id, kind))  # pragma: no cover
 
-            self._logger.print(zip_description['description'])
-            self._file_system.unzip_contents(temp_zip, target_folder_path, list(zipped_files['files']))
-            self._file_system.unlink(temp_zip)
+    def _import_zip_contents_from_extraction(self, zip_id, zip_description, filtered_zip_data, file_downloader, extraction):
+        self._logger.print(zip_description['description'])
+        for file_path in extraction.failed_files:
+            self._session.files_that_failed_from_zip.append(file_path)
+            self._logger.print('ERROR: File "%s" could not be extracted, skipping.' % file_path)
+
+        if zip_description['kind'] == 'extract_all_contents':
             file_downloader.mark_unpacked_zip(zip_id, zip_description['base_files_url'])
 
             filtered_files = filtered_zip_data[zip_id]['files'] if zip_id in filtered_zip_data else []
             for file_path in filtered_files:
-                self._file_system.unlink(file_path)
+                if self._file_system.is_file(file_path):
+                    self._file_system.unlink(file_path)
 
             # TODO: Add this back when adding official support fort zips
             # for folder_path in sorted(filtered_zip_data[zip_id]['folders'].keys(), key=len, reverse=True):
@@ -917,24 +973,8 @@ class _OnlineDatabaseImporter:
             #
             #     self._file_system.remove_folder(folder_path)
 
-        elif kind == 'extract_single_files':
-            self._logger.print(zip_description['description'])
-            temp_filename = self._file_system.unique_temp_filename()
-            tmp_path = '%s_%s/' % (temp_filename.value, zip_id)
-            self._file_system.unzip_contents(temp_zip, tmp_path, list(zipped_files['files']))
-            for file_path, file_description in zipped_files['files'].items():
-                try:
-                    self._file_system.copy('%s%s' % (tmp_path, file_description['zip_path']), file_path)
-                except FileCopyError as _e:
-                    self._session.files_that_failed_from_zip.append(file_path)
-                    self._logger.print('ERROR: File "%s" could not be copied, skipping.' % file_path)
-
-            self._file_system.unlink(temp_zip)
-            self._file_system.remove_non_empty_folder(tmp_path)
-            temp_filename.close()
-            file_downloader.mark_unpacked_zip(zip_id, 'whatever')
         else:
-            raise UnreachableException('ERROR: ZIP %s has wrong field kind "%s", contact the db maintainer.' % (zip_id, kind))  # pragma: no cover
+            file_downloader.mark_unpacked_zip(zip_id, 'whatever')
 
     def create_folders(self):
         for folder_path in sorted(self._db.folders):
@@ -1001,6 +1041,11 @@ class _OnlineDatabaseImporter:
             self._logger.print()
 
 
+def _target_folder_path(zip_description: Dict[str, str]) -> str:
+    target_folder_path = zip_description['target_folder_path']
+    return target_folder_path[1:] if target_folder_path[0] == '|' else target_folder_path
+
+
 def is_system_path(description: Dict[str, str]) -> bool:
     return 'path' in description and description['path'] == 'system'
 
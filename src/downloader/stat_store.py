@@ -0,0 +1,99 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import json
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Set
+
+from downloader.logger import Logger
+
+# FAT stores mtimes with 2 seconds of resolution, so a path changed right after being stored could keep the same stat.
+racy_mtime_window_ns = 2_000_000_000
+max_entries_without_pruning = 200_000
+
+
+class StatStore:
+    """Entries keyed by path and guarded by its stat, persisted between runs as a single JSON file.
+
+    The file is loaded lazily, replaced atomically on save, discarded if corrupt, and pruned down to the entries used
+    during the run once it grows past max_entries_without_pruning."""
+
+    def __init__(self, path: str, logger: Logger, description: str):
+        self._path = path
+        self._logger = logger
+        self._description = description
+        self._lock = threading.Lock()
+        self._entries: Optional[Dict[str, List]] = None
+        self._used: Set[str] = set()
+        self._dirty = False
+
+    def get(self, key: str, is_current: Callable[[List], bool]) -> Optional[List]:
+        with self._lock:
+            entry = self._load().get(key, None)
+            if entry is None or not is_current(entry):
+                return None
+            self._used.add(key)
+            return entry
+
+    def put(self, key: str, stat: os.stat_result, entry: List) -> None:
+        if time.time_ns() - stat.st_mtime_ns < racy_mtime_window_ns:
+            return
+
+        with self._lock:
+            self._load()[key] = entry
+            self._used.add(key)
+            self._dirty = True
+
+    def save(self) -> None:
+        with self._lock:
+            if not self._dirty:
+                return
+
+            entries = self._load()
+            if len(entries) > max_entries_without_pruning:
+                entries = {key: entry for key, entry in entries.items() if key in self._used}
+
+            try:
+                os.makedirs(os.path.dirname(self._path), exist_ok=True)
+                temp_path = self._path + '.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump(entries, f, separators=(',', ':'))
+                os.replace(temp_path, self._path)
+                self._dirty = False
+            except OSError as e:
+                self._logger.debug(e)
+
+    def _load(self) -> Dict[str, List]:
+        if self._entries is not None:
+            return self._entries
+
+        self._entries = {}
+        try:
+            with open(self._path, 'r') as f:
+                entries = json.load(f)
+            if isinstance(entries, dict):
+                self._entries = entries
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as e:
+            self._logger.debug(f'Discarding {self._description}: ', e)
+
+        self._logger.debug(f'{self._description.capitalize()}: {len(self._entries)} entries.')
+        return self._entries
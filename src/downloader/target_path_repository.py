@@ -16,16 +16,48 @@
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
-from downloader.constants import FILE_MiSTer, FILE_MiSTer_new
+import threading
+
+from downloader.constants import FILE_MiSTer, FILE_MiSTer_new, DEFAULT_RAM_STAGING_BUDGET_MB
 
 
 downloader_in_progress_postfix = '._downloader_in_progress'
+downloader_in_progress_validator_postfix = '._downloader_in_progress_validator'
+ram_staging_max_file_size = 5000000
+ram_staging_budget = DEFAULT_RAM_STAGING_BUDGET_MB * 1024 * 1024
+
+
+class RamStagingBudget:
+    """Bytes that may be staged in /tmp (tmpfs, so RAM on MiSTer) at the same time, shared by all download workers."""
+
+    def __init__(self, budget=ram_staging_budget):
+        self._available = budget
+        self._lock = threading.Lock()
+
+    def try_reserve(self, size):
+        with self._lock:
+            if size > self._available:
+                return False
+            self._available -= size
+            return True
+
+    def release(self, size):
+        with self._lock:
+            self._available += size
 
 
 class TargetPathRepository:
-    def __init__(self, config, file_system):
+    """Decides where each download is staged before it is validated:
+
+    - Files that don't exist yet are written in place.
+    - Files that exist are staged next to their target and renamed over it, which is atomic and doesn't copy.
+    - Only when the target filesystem has no room for that second copy, small files are staged in /tmp while the RAM
+      budget allows it. They are copied into place, as a rename can't cross filesystems."""
+
+    def __init__(self, config, file_system, ram_budget=None):
         self._config = config
         self._file_system = file_system
+        self._ram_budget = ram_budget or RamStagingBudget()
         self._registry = {}
         self._tempfiles = {}
         self._file_mister = None
@@ -41,17 +73,25 @@ class TargetPathRepository:
         return target_path
 
     def _calculate_target_path(self, path, description):
+        if self._file_system.is_file(path + downloader_in_progress_postfix):
+            return path + downloader_in_progress_postfix
+
         if not self._file_system.is_file(path):
             return path
 
-        if description['size'] <= 5000000:
+        size = description['size']
+        if not self._fits_next_to_target(path, size) and size <= ram_staging_max_file_size and self._ram_budget.try_reserve(size):
             unique_temp_filename = self._file_system.unique_temp_filename()
             target_path = unique_temp_filename.value
-            self._tempfiles[target_path] = unique_temp_filename
+            self._tempfiles[target_path] = (unique_temp_filename, size)
             return target_path
 
         return path + downloader_in_progress_postfix
 
+    def _fits_next_to_target(self, path, size):
+        free_space = self._file_system.free_space(path)
+        return free_space is None or free_space >= size
+
     def access_target(self, path):
         path, skips_registry = self._fix_path(path)
         if skips_registry:
@@ -69,8 +109,7 @@ class TargetPathRepository:
         self._file_system.unlink(target_path)
         self._registry.pop(path)
         if target_path in self._tempfiles:
-            self._tempfiles[target_path].close()
-            self._tempfiles.pop(target_path)
+            self._release_tempfile(target_path)
 
     def finish_target(self, path):
         path, skips_registry = self._fix_path(path)
@@ -78,11 +117,49 @@ class TargetPathRepository:
             return
 
         target_path = self._registry[path]
-        if target_path != path:
+        if target_path in self._tempfiles:
             self._file_system.copy(target_path, path)
             self._file_system.unlink(target_path)
+            self._release_tempfile(target_path)
+        elif target_path != path:
+            self._file_system.move(target_path, path)
         self._registry.pop(path)
 
+    def keep_partial_target(self, path, validator=None):
+        path, skips_registry = self._fix_path(path)
+        if skips_registry:
+            self._file_system.unlink(path)
+            return
+
+        target_path = self._registry.pop(path)
+        if target_path in self._tempfiles:
+            self._file_system.unlink(target_path)
+            self._release_tempfile(target_path)
+            return
+
+        partial_path = path + downloader_in_progress_postfix
+        if target_path != partial_path and self._file_system.is_file(target_path, use_cache=False):
+            self._file_system.move(target_path, partial_path)
+        if validator is not None and self._file_system.is_file(partial_path, use_cache=False):
+            self._file_system.write_file_contents(path + downloader_in_progress_validator_postfix, validator)
+
+    def take_resume_validator(self, path):
+        """ETag or Last-Modified of the response that the partial target came from. It is removed once taken, and
+        kept again only if the download gets interrupted again."""
+        path, skips_registry = self._fix_path(path)
+        validator_path = path + downloader_in_progress_validator_postfix
+        if skips_registry or not self._file_system.is_file(validator_path, use_cache=False):
+            return None
+
+        validator = self._file_system.read_file_contents(validator_path)
+        self._file_system.unlink(validator_path, verbose=False)
+        return validator
+
+    def _release_tempfile(self, target_path):
+        unique_temp_filename, size = self._tempfiles.pop(target_path)
+        unique_temp_filename.close()
+        self._ram_budget.release(size)
+
     def _fix_path(self, path):
         fixed_path = path if path != FILE_MiSTer else FILE_MiSTer_new
         target_path = self._file_system.download_target_path(fixed_path)
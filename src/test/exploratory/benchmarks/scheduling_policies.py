@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+# Simulates the download phase under each scheduling policy with synthetic file size distributions.
+# Run it from the src folder: python3 -m test.exploratory.benchmarks.scheduling_policies
+
+import heapq
+import posixpath
+import random
+import statistics
+import sys
+from typing import List, Tuple, Dict, Any
+
+from downloader.jobs.scheduling import scheduling_policies, QueuedFile
+
+slots = 8
+total_bandwidth = 10 * 1024 * 1024
+connection_bandwidth = 2 * 1024 * 1024
+request_latency = 0.15
+directory_switch_cost = 0.01
+
+
+def main(seed: int = 0, files: int = 2000, repetitions: int = 5):
+    for name, distribution in distributions.items():
+        print(f'\n{name} ({files} files, {repetitions} repetitions)')
+        print(f'{"policy":<26}{"makespan":>10}{"mean done":>11}{"worst db":>10}{"done at 1/2":>13}')
+        rows = {policy: [] for policy in scheduling_policies}
+        for repetition in range(repetitions):
+            rng = random.Random(seed + repetition)
+            queue = synthetic_queue(rng, distribution, files)
+            baseline = None
+            for policy_name, policy in scheduling_policies.items():
+                ordered = [entry for entry in policy().order(queue) if 'db' not in entry[1]]
+                completions = simulate(ordered)
+                makespan = max(completions.values())
+                baseline = makespan if baseline is None else baseline
+                rows[policy_name].append((
+                    makespan,
+                    statistics.mean(completions.values()),
+                    max(statistics.median(completions[path] for path, description in ordered if description['db_id'] == db) for db in {d['db_id'] for _, d in ordered}),
+                    sum(1 for t in completions.values() if t <= baseline / 2) / len(completions)
+                ))
+
+        for policy_name, results in rows.items():
+            makespan, mean_done, worst_db, half = (statistics.mean(column) for column in zip(*results))
+            print(f'{policy_name:<26}{makespan:>9.1f}s{mean_done:>10.1f}s{worst_db:>9.1f}s{half:>12.0%}')
+
+
+def simulate(ordered: List[QueuedFile]) -> Dict[str, float]:
+    """Processor-sharing model: every transfer waits its latency, then shares the total bandwidth with a cap per connection."""
+    now, completions, pending = 0.0, {}, list(ordered)
+    waiting: List[Tuple[float, str, int]] = []
+    transferring: Dict[str, float] = {}
+    last_directory = None
+
+    while len(pending) > 0 or len(waiting) > 0 or len(transferring) > 0:
+        while len(pending) > 0 and len(waiting) + len(transferring) < slots:
+            path, description = pending.pop(0)
+            directory = posixpath.dirname(path)
+            latency = request_latency + (directory_switch_cost if directory != last_directory else 0)
+            last_directory = directory
+            heapq.heappush(waiting, (now + latency, path, description['size']))
+
+        rate = min(connection_bandwidth, total_bandwidth / len(transferring)) if len(transferring) > 0 else 0
+        next_completion = min(transferring.values()) / rate if len(transferring) > 0 else float('inf')
+        next_start = waiting[0][0] - now if len(waiting) > 0 else float('inf')
+        step = min(next_completion, next_start)
+
+        now += step
+        for path in list(transferring):
+            transferring[path] -= rate * step
+            if transferring[path] <= 1e-6:
+                del transferring[path]
+                completions[path] = now
+        while len(waiting) > 0 and waiting[0][0] <= now + 1e-9:
+            _, path, size = heapq.heappop(waiting)
+            transferring[path] = max(size, 1)
+
+    return completions
+
+
+def synthetic_queue(rng: random.Random, distribution, files: int) -> List[QueuedFile]:
+    queue: List[QueuedFile] = []
+    for db_id, share in (('big_db', 0.7), ('medium_db', 0.2), ('small_db', 0.1)):
+        queue.append((f'[{db_id}]', {'db': db_id}))
+        for i in range(int(files * share)):
+            path = f'{db_id}/folder_{rng.randrange(40)}/file_{i}'
+            queue.append((path, {'size': int(distribution(rng)), 'db_id': db_id}))
+    return queue
+
+
+def mister_like(rng: random.Random) -> float:
+    roll = rng.random()
+    if roll < 0.85: return rng.lognormvariate(10.3, 1.0)  # docs, mra, small roms: ~30KB median
+    if roll < 0.98: return rng.uniform(500 * 1024, 3 * 1024 * 1024)  # core rbfs
+    return rng.uniform(20 * 1024 * 1024, 200 * 1024 * 1024)  # big roms, images
+
+
+distributions = {
+    'mister-like': mister_like,
+    'uniform 10KB-5MB': lambda rng: rng.uniform(10 * 1024, 5 * 1024 * 1024),
+    'pareto heavy tail': lambda rng: min(10 * 1024 * rng.paretovariate(1.2), 500 * 1024 * 1024),
+}
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -29,7 +29,7 @@ from test.fake_waiter import NoWaiter
 
 
 class FileDownloaderFactory(ProductionFileDownloaderFactory):
-    def __init__(self, file_system_factory=None, state=None, config=None, network_state=None, file_download_reporter=None, job_system=None, http_gateway=None):
+    def __init__(self, file_system_factory=None, state=None, config=None, network_state=None, file_download_reporter=None, job_system=None, http_gateway=None, scheduling_policy=None):
         state = state if state is not None else FileSystemState(config=config)
         file_system_factory = file_system_factory if file_system_factory is not None else FileSystemFactory(state=state, config=state.config)
         network_state = NetworkState() if network_state is None else network_state
@@ -42,7 +42,8 @@ class FileDownloaderFactory(ProductionFileDownloaderFactory):
             logger=NoLogger(),
             job_system=job_system,
             file_download_reporter=file_download_reporter,
-            http_gateway=http_gateway
+            http_gateway=http_gateway,
+            scheduling_policy=scheduling_policy
         )
 
     @staticmethod
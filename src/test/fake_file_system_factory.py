@@ -22,7 +22,9 @@ from typing import Any
 from downloader.constants import K_BASE_PATH, STORAGE_PATHS_PRIORITY_SEQUENCE
 from downloader.jobs.fetch_file_job import FetchFileJob
 from downloader.file_system import FileSystemFactory as ProductionFileSystemFactory, FileSystem as ProductionFileSystem, \
-    absolute_parent_folder, is_windows, FolderCreationError, FsCache, FileCopyError
+    absolute_parent_folder, is_windows, FolderCreationError, FsCache, FileCopyError, StreamWriteResult, \
+    StreamSizeExceededError, zip_members
+from downloader.archive_stream import ArchiveStreamHashError
 from downloader.other import ClosableValue, UnreachableException
 from test.fake_importer_implicit_inputs import FileSystemState
 from downloader.logger import NoLogger
@@ -55,6 +57,9 @@ class FileSystemFactory:
     def set_copy_will_error(self):
         self._fake_failures['copy_error'] = True
 
+    def set_free_space(self, free_space):
+        self._fake_failures['free_space'] = free_space
+
     def create_for_config(self, config):
         return FakeFileSystem(self._state, config, self._fake_failures, self._write_records, self._fs_cache)
 
@@ -111,6 +116,9 @@ class FakeFileSystem(ProductionFileSystem):
     def hash(self, path):
         return self.state.files[self._path(path)]['hash']
 
+    def hash_many(self, paths):
+        return {path: self.hash(path) for path in paths}
+
     def resolve(self, path):
         return self._path(path)
 
@@ -239,13 +247,51 @@ class FakeFileSystem(ProductionFileSystem):
     def download_target_path(self, path):
         return self._path(path)
 
-    def write_incoming_stream(self, in_stream: Any, target_path: str):
+    def write_incoming_stream(self, in_stream: Any, target_path: str, cancellation_token=None, append=False, max_size=None):
         if in_stream.storing_problems:
-            return
+            return StreamWriteResult(size=0, write_seconds=0.0)
+
+        size = in_stream.description.get('size', 0)
+        if max_size is not None and size > max_size:
+            raise StreamSizeExceededError(f'{target_path} is bigger than {max_size} bytes')
 
         self._write_records.append(_Record('write_incoming_stream', target_path))
         self.state.files[target_path] = in_stream.description
         self._fs_cache.add_file(target_path)
+        return StreamWriteResult(size=size, write_seconds=0.0, md5=None if append else in_stream.description.get('hash', None))
+
+    def extract_incoming_stream(self, in_stream, archive_format, files, cancellation_token=None, max_size=None, expected_md5=None):
+        size = in_stream.description.get('size', 0)
+        if max_size is not None and size > max_size:
+            raise StreamSizeExceededError(f'Archive is bigger than {max_size} bytes')
+        md5 = in_stream.description.get('hash', None)
+        if expected_md5 is not None and md5 != expected_md5:
+            raise ArchiveStreamHashError(f'Bad archive hash ({expected_md5} != {md5})')
+
+        contents = in_stream.description['zipped_files']
+        failed = []
+        for path, member in files.items():
+            description = contents['files'].get(member, contents['files'].get(path, None))
+            if in_stream.storing_problems or 'copy_error' in self._fake_failures or description is None:
+                failed.append(path)
+                continue
+
+            self.state.files[self._path(path)] = {'hash': description['hash'], 'size': description['size']}
+            self._write_records.append(_Record('extract_incoming_stream', self._path(path)))
+            self._fs_cache.add_file(self._path(path))
+        for folder in contents['folders']:
+            if self._is_folder_unziped(files, folder):
+                self.state.folders[self._path(folder)] = {}
+        return StreamWriteResult(size=size, write_seconds=0.0, md5=in_stream.description.get('hash', None), failed_files=failed)
+
+    def size(self, path):
+        full_path = self._path(path)
+        if full_path in self.state.files:
+            return self.state.files[full_path].get('size', 0)
+        return 0
+
+    def free_space(self, path):
+        return self._fake_failures.get('free_space', None)
 
     def unlink(self, path, verbose=True):
         full_path = self._path(path)
@@ -282,7 +328,12 @@ class FakeFileSystem(ProductionFileSystem):
 
     def unzip_contents(self, file_path, zip_target_path, contained_files):
         contents = self.state.files[self._path(file_path)]['zipped_files']
+        members = zip_members(zip_target_path, contained_files)
+        prefix = zip_target_path if zip_target_path.endswith('/') else zip_target_path + '/'
         for file, description in contents['files'].items():
+            if members is not None and file[len(prefix):] not in members:
+                continue
+
             self.state.files[self._path(file)] = {'hash': description['hash'], 'size': description['size']}
         for folder in contents['folders']:
             if not self._is_folder_unziped(contained_files, folder):
@@ -290,6 +341,20 @@ class FakeFileSystem(ProductionFileSystem):
 
             self.state.folders[self._path(folder)] = {}
 
+    def unzip_files(self, file_path, files):
+        contents = self.state.files[self._path(file_path)]['zipped_files']
+        failed = []
+        for path, member in files.items():
+            if 'copy_error' in self._fake_failures or member not in contents['files']:
+                failed.append(path)
+                continue
+
+            description = contents['files'][member]
+            self.state.files[self._path(path)] = {'hash': description['hash'], 'size': description['size']}
+            self._write_records.append(_Record('unzip_files', (self._path(file_path), self._path(path))))
+            self._fs_cache.add_file(self._path(path))
+        return failed
+
     def turn_off_logs(self) -> None:
         pass
 
@@ -30,7 +30,7 @@ class FakeHttpGateway:
         self._network_state = network_state
 
     @contextmanager
-    def open(self, url: str, _method: str = None, _body: Any = None, _headers: Any = None) -> Generator[Tuple[str, 'FakeHTTPResponse'], None, None]:
+    def open(self, url: str, _method: str = None, _body: Any = None, headers: Any = None) -> Generator[Tuple[str, 'FakeHTTPResponse'], None, None]:
         parent_package = getattr(_thread_local_storage, 'current_package', None)
         job = None if parent_package is None else parent_package.job
 
@@ -46,13 +46,14 @@ class FakeHttpGateway:
         self._network_state.remote_failures[match_path] = self._network_state.remote_failures.get(match_path, 0)
         self._network_state.remote_failures[match_path] -= 1
         if self._network_state.remote_failures[match_path] > 0:
-            status = 404
+            status = 503
 
         description = {**self._network_state.remote_files[match_path]} if match_path in self._network_state.remote_files else description
         if description is None:
             description = {'hash': match_path, 'size': 1}
-        if 'url' in description:
-            del description['url']
+        for download_only_key in ('url', 'reboot'):
+            if download_only_key in description:
+                del description[download_only_key]
 
         yield url, FakeHTTPResponse(
             url=url,
@@ -73,6 +74,7 @@ class FakeHTTPResponse:
         self.storing_problems = storing_problems
         self.description = description
         self.file_path = file_path
+        self.headers = {}
         self._position = 0
 
     def read(self, size: int = -1) -> bytes:
@@ -21,7 +21,7 @@ from test.fake_file_system_factory import FileSystemFactory
 
 
 class TargetPathRepository(ProductionTargetPathRepository):
-    def __init__(self, config=None, file_system=None):
+    def __init__(self, config=None, file_system=None, ram_budget=None):
         config = config or default_config()
         file_system = file_system or FileSystemFactory().create_for_config(config)
-        super().__init__(config, file_system)
+        super().__init__(config, file_system, ram_budget)
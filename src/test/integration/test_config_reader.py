@@ -22,7 +22,7 @@ from downloader.config import AllowDelete, AllowReboot, InvalidConfigParameter
 from downloader.constants import K_BASE_PATH, K_BASE_SYSTEM_PATH, K_UPDATE_LINUX, K_ALLOW_REBOOT, K_ALLOW_DELETE, \
     K_DOWNLOADER_TIMEOUT, K_DOWNLOADER_RETRIES, K_VERBOSE, K_DATABASES, \
     K_DB_URL, K_SECTION, K_OPTIONS, MEDIA_USB2, MEDIA_USB1, K_DOWNLOADER_THREADS_LIMIT, KENV_DEFAULT_DB_ID, \
-    KENV_DEFAULT_DB_URL
+    KENV_DEFAULT_DB_URL, K_RAM_STAGING_BUDGET_MB
 from test.objects import not_found_ini, db_options, default_base_path, default_env
 from test.fake_config_reader import ConfigReader
 
@@ -42,6 +42,7 @@ class TestConfigReader(unittest.TestCase):
             K_DOWNLOADER_TIMEOUT: 300,
             K_DOWNLOADER_RETRIES: 3,
             K_VERBOSE: False,
+            K_RAM_STAGING_BUDGET_MB: 32,
             K_DATABASES: {'distribution_mister': {
                 K_DB_URL: 'https://raw.githubusercontent.com/MiSTer-devel/Distribution_MiSTer/main/db.json.zip',
                 K_SECTION: 'distribution_mister',
@@ -90,6 +91,7 @@ class TestConfigReader(unittest.TestCase):
             K_BASE_PATH: '/media/usb0',
             K_BASE_SYSTEM_PATH: '/media/cifs',
             K_VERBOSE: True,
+            K_RAM_STAGING_BUDGET_MB: 8,
             K_DATABASES: {'distribution_mister': {
                 K_DB_URL: 'https://raw.githubusercontent.com/MiSTer-devel/Distribution_MiSTer/main/db.json.zip',
                 K_SECTION: 'distribution_mister',
@@ -0,0 +1,100 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+import os
+import tempfile
+import unittest
+from pathlib import Path
+
+from downloader.config import default_config
+from downloader.constants import K_BASE_PATH
+from downloader.directory_snapshot import FileDirectorySnapshot
+from downloader.file_system import FileSystemFactory
+from downloader.logger import NoLogger
+
+
+class TestFileDirectorySnapshot(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.snapshot_path = os.path.join(self.tempdir.name, 'config', 'downloader.dirs.json')
+        self.folder = os.path.join(self.tempdir.name, 'games')
+        os.makedirs(self.folder)
+        Path(self.folder, 'foo.rbf').touch()
+        make_old(self.folder)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_get___after_saved_put___returns_listing_on_next_run(self):
+        snapshot = FileDirectorySnapshot(self.snapshot_path, NoLogger())
+        snapshot.put(self.folder, os.stat(self.folder), ['foo.rbf'], ['docs'])
+        snapshot.save()
+        self.assertEqual((['foo.rbf'], ['docs']), FileDirectorySnapshot(self.snapshot_path, NoLogger()).get(self.folder, os.stat(self.folder)))
+
+    def test_get___when_folder_changed___returns_none(self):
+        snapshot = FileDirectorySnapshot(self.snapshot_path, NoLogger())
+        snapshot.put(self.folder, os.stat(self.folder), ['foo.rbf'], [])
+        Path(self.folder, 'bar.rbf').touch()
+        self.assertIsNone(snapshot.get(self.folder, os.stat(self.folder)))
+
+    def test_put___on_just_modified_folder___is_not_stored(self):
+        Path(self.folder, 'bar.rbf').touch()
+        snapshot = FileDirectorySnapshot(self.snapshot_path, NoLogger())
+        snapshot.put(self.folder, os.stat(self.folder), ['foo.rbf', 'bar.rbf'], [])
+        self.assertIsNone(snapshot.get(self.folder, os.stat(self.folder)))
+
+    def test_precache_is_file_with_folders___with_snapshot___skips_rescanning_unchanged_folders(self):
+        os.makedirs(os.path.join(self.tempdir.name, 'docs'))
+        Path(self.tempdir.name, 'docs', 'readme.txt').touch()
+        make_old(os.path.join(self.tempdir.name, 'docs'))
+        snapshot = FileDirectorySnapshot(self.snapshot_path, NoLogger())
+        self.file_system(snapshot).precache_is_file_with_folders(['games', 'docs'])
+        snapshot.save()
+
+        os.rename(os.path.join(self.folder, 'foo.rbf'), os.path.join(self.folder, 'bar.rbf'))
+        make_old(self.folder, 1_600_000_100)
+        os.remove(os.path.join(self.tempdir.name, 'docs', 'readme.txt'))
+        make_old(os.path.join(self.tempdir.name, 'docs'))
+        second_run = self.file_system(FileDirectorySnapshot(self.snapshot_path, NoLogger()))
+        second_run.precache_is_file_with_folders(['games', 'docs'])
+
+        self.assertFalse(second_run.is_file('games/foo.rbf'))
+        self.assertTrue(second_run.is_file('games/bar.rbf'))
+        self.assertTrue(second_run.is_file('docs/readme.txt'))
+
+    def test_is_file___when_file_was_added_without_updating_the_folder_mtime___returns_true(self):
+        snapshot = FileDirectorySnapshot(self.snapshot_path, NoLogger())
+        self.file_system(snapshot).precache_is_file_with_folders(['games'])
+        snapshot.save()
+
+        Path(self.folder, 'bar.rbf').touch()
+        make_old(self.folder)
+        second_run = self.file_system(FileDirectorySnapshot(self.snapshot_path, NoLogger()))
+        second_run.precache_is_file_with_folders(['games'])
+
+        self.assertTrue(second_run.is_file('games/foo.rbf'))
+        self.assertTrue(second_run.is_file('games/bar.rbf'))
+
+    def file_system(self, snapshot):
+        config = default_config()
+        config[K_BASE_PATH] = self.tempdir.name
+        return FileSystemFactory(config, {}, NoLogger(), directory_snapshot=snapshot).create_for_system_scope()
+
+
+def make_old(path, seconds=1_600_000_000):
+    os.utime(path, (seconds, seconds))
@@ -15,15 +15,21 @@
 
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
+import hashlib
+import io
 import json
 import sys
+import tarfile
 import tempfile
 import unittest
 import os
+import zipfile
 from pathlib import Path
 
+from downloader.archive_stream import UnsupportedArchiveStreamError, ArchiveStreamError, ArchiveStreamHashError
 from downloader.constants import FILE_MiSTer, K_BASE_PATH, K_BASE_SYSTEM_PATH, K_ALLOW_DELETE
-from downloader.file_system import FileSystemFactory
+from downloader.file_system import FileSystemFactory, StreamSizeExceededError, FileCopyError, copy_chunk_size, UnzipJob, write_threads_for_device, sd_card_unzip_threads, is_windows
+from downloader.job_system import CancellationToken, JobCancelledException
 from downloader.logger import NoLogger
 from test.objects import temp_name
 from test.fake_file_system_factory import make_production_filesystem_factory
@@ -65,6 +71,14 @@ class TestFileSystem(unittest.TestCase):
     def test_hash___on_bigger_file__returns_different_string(self):
         self.assertNotEqual(self.sut({K_BASE_PATH: '..'}).hash('downloader.sh'), empty_file_hash)
 
+    def test_hash_many___on_several_files___returns_same_hashes_as_hash(self):
+        sut = self.sut()
+        files = ['a', 'b', 'c', 'missing']
+        for i, file in enumerate(files[:-1]):
+            sut.write_file_contents(file, str(i) * (i * 1000))
+
+        self.assertEqual({file: sut.hash(file) for file in files}, sut.hash_many(files))
+
     def test_move___on_existing_file__works_fine(self):
         self.sut().move(empty_file, not_created_file)
         self.assertTrue(self.sut().is_file(not_created_file))
@@ -75,6 +89,26 @@ class TestFileSystem(unittest.TestCase):
         self.assertTrue(self.sut().is_file(not_created_file))
         self.assertTrue(self.sut().is_file(empty_file))
 
+    def test_copy___on_file_bigger_than_a_copy_chunk___copies_all_its_bytes(self):
+        sut = self.sut()
+        content = os.urandom(copy_chunk_size + 12345)
+        Path(self.tempdir.name, 'source').write_bytes(content)
+        sut.copy('source', 'target')
+        self.assertEqual(content, Path(self.tempdir.name, 'target').read_bytes())
+
+    def test_copy_fast___on_existing_file___copies_its_bytes(self):
+        sut = self.sut()
+        Path(self.tempdir.name, 'source').write_bytes(b'abc')
+        sut.copy_fast('source', 'target')
+        self.assertEqual(b'abc', Path(self.tempdir.name, 'target').read_bytes())
+        self.assertTrue(sut.is_file('target'))
+
+    def test_copy___on_same_file___raises_and_keeps_its_content(self):
+        sut = self.sut()
+        Path(self.tempdir.name, 'source').write_bytes(b'abc')
+        self.assertRaises(FileCopyError, lambda: sut.copy('source', 'source'))
+        self.assertEqual(b'abc', Path(self.tempdir.name, 'source').read_bytes())
+
     def test_unlink_mister___when_allow_delete_only_rbf___keeps_it(self):
         sut = self.sut(self.default_test_config(allow_delete=AllowDelete.OLD_RBF))
 
@@ -151,6 +185,250 @@ class TestFileSystem(unittest.TestCase):
     def test_folder_has_items___on_non_existing_folder___returns_false(self):
         self.assertFalse(self.sut().folder_has_items('foo'))
 
+    def test_is_file___on_precached_folder_missing_the_file___returns_false_without_checking_disk(self):
+        sut = self.sut()
+        sut.make_dirs('foo')
+        sut.precache_is_file_with_folders(['foo'])
+        Path(self.tempdir.name, 'foo', 'bar').touch()
+
+        self.assertFalse(sut.is_file('foo/bar'))
+        self.assertTrue(sut.is_file('foo/bar', use_cache=False))
+
+    def test_is_file___on_precached_folder_with_file_in_other_case___checks_disk(self):
+        sut = self.sut()
+        sut.make_dirs('foo')
+        sut.touch('foo/BAR')
+        sut.precache_is_file_with_folders(['foo'])
+
+        self.assertEqual(os.path.isfile(os.path.join(self.tempdir.name, 'foo', 'bar')), sut.is_file('foo/bar'))
+
+    def test_is_file___on_precached_folder_after_touch_and_unlink___follows_the_changes(self):
+        sut = self.sut()
+        sut.make_dirs('foo')
+        sut.precache_is_file_with_folders(['foo'])
+
+        sut.touch('foo/bar')
+        self.assertTrue(sut.is_file('foo/bar'))
+        self.assertTrue(sut.folder_has_items('foo'))
+
+        sut.unlink('foo/bar')
+        self.assertFalse(sut.is_file('foo/bar'))
+        self.assertFalse(sut.folder_has_items('foo'))
+
+    def test_is_folder___on_precached_folder_after_make_dirs_and_remove_folder___follows_the_changes(self):
+        sut = self.sut()
+        sut.make_dirs('foo')
+        sut.precache_is_file_with_folders(['foo'])
+
+        sut.make_dirs('foo/bar/baz')
+        self.assertTrue(sut.is_folder('foo/bar'))
+        self.assertTrue(sut.folder_has_items('foo'))
+
+        sut.remove_folder('foo/bar/baz')
+        sut.remove_folder('foo/bar')
+        self.assertFalse(sut.is_folder('foo/bar'))
+        self.assertFalse(sut.folder_has_items('foo'))
+
+    def test_is_file___on_precached_folder_after_remove_non_empty_folder___forgets_nested_files(self):
+        sut = self.sut()
+        sut.make_dirs('foo/bar/baz')
+        sut.touch('foo/bar/baz/qux')
+        sut.precache_is_file_with_folders(['foo', 'foo/bar', 'foo/bar/baz'])
+
+        sut.remove_non_empty_folder('foo/bar')
+        self.assertFalse(sut.is_file('foo/bar/baz/qux'))
+        self.assertFalse(sut.is_folder('foo/bar'))
+        self.assertFalse(sut.folder_has_items('foo'))
+
+    def test_is_file___on_precached_folder_after_unlinking_one_of_two_names_differing_in_case___checks_disk(self):
+        sut = self.sut()
+        sut.make_dirs('foo')
+        sut.precache_is_file_with_folders(['foo'])
+        sut.touch('foo/bar')
+        sut.touch('foo/BAR')
+
+        sut.unlink('foo/BAR')
+        self.assertEqual(os.path.isfile(os.path.join(self.tempdir.name, 'foo', 'BAR')), sut.is_file('foo/BAR'))
+
+    @unittest.skipIf(is_windows, 'Block devices are only classified on Linux')
+    def test_write_threads_for_device___on_mmc_block_device___returns_sd_card_threads(self):
+        self.assertEqual(sd_card_unzip_threads, write_threads_for_device(os.makedev(179, 0)))
+
+    def test_precache_is_file_with_folders___on_many_folders_across_two_drives___indexes_all_of_them(self):
+        with tempfile.TemporaryDirectory() as other_drive:
+            sut = make_production_filesystem_factory(self.default_test_config(), {path: other_drive for path in ['games/nes', 'games/nes/present', 'games/nes/missing']}).create_for_system_scope()
+            folders = ['folder_%d' % i for i in range(20)] + ['games/nes']
+            for folder in folders:
+                sut.make_dirs(folder)
+                sut.touch(folder + '/present')
+
+            sut.precache_is_file_with_folders(folders)
+            for folder in folders:
+                Path(sut.download_target_path(folder + '/missing')).touch()
+
+            for folder in folders:
+                self.assertTrue(sut.is_file(folder + '/present'))
+                self.assertFalse(sut.is_file(folder + '/missing'))
+
+    def test_unzip_contents___with_contained_files___extracts_only_those(self):
+        sut = self.sut()
+        self.make_zip('contents.zip', {'NES/a.zip': b'a', 'NES/b.zip': b'b', 'SMS/c.zip': b'c'})
+
+        sut.unzip_contents('contents.zip', 'Cheats', {'Cheats/NES/a.zip': {}, 'Cheats/SMS/c.zip': {}})
+
+        self.assertTrue(sut.is_file('Cheats/NES/a.zip'))
+        self.assertFalse(sut.is_file('Cheats/NES/b.zip'))
+        self.assertTrue(sut.is_file('Cheats/SMS/c.zip'))
+        self.assertFalse(sut.is_file('contents.zip'))
+
+    def test_unzip_contents___with_contained_file_missing_in_zip___extracts_everything(self):
+        sut = self.sut()
+        self.make_zip('contents.zip', {'NES/a.zip': b'a', 'NES/b.zip': b'b'})
+
+        sut.unzip_contents('contents.zip', 'Cheats', {'Cheats/NES/a.zip': {}, 'Cheats/NES/other.zip': {}})
+
+        self.assertTrue(sut.is_file('Cheats/NES/a.zip'))
+        self.assertTrue(sut.is_file('Cheats/NES/b.zip'))
+
+    def test_unzip_contents___with_single_files_on_a_temporary_folder___extracts_them_by_zip_path(self):
+        sut = self.sut()
+        self.make_zip('contents.zip', {'uni-bios.rom': b'a', 'other.rom': b'b'})
+
+        sut.unzip_contents('contents.zip', 'tmp/', {'games/NeoGeo/uni-bios.rom': {'zip_path': 'uni-bios.rom'}})
+
+        self.assertTrue(sut.is_file('tmp/uni-bios.rom'))
+        self.assertFalse(sut.is_file('tmp/other.rom'))
+
+    def test_unzip_files___with_members_and_targets___writes_them_straight_to_their_targets(self):
+        sut = self.sut()
+        self.make_zip('contents.zip', {'uni-bios.rom': b'bios', 'other.rom': b'other'})
+        self.make_old_file('games/NeoGeo/missing.rom', b'kept')
+
+        failed = sut.unzip_files('contents.zip', {'games/NeoGeo/uni-bios.rom': 'uni-bios.rom', 'games/NeoGeo/missing.rom': 'missing.rom'})
+
+        self.assertEqual(['games/NeoGeo/missing.rom'], failed)
+        self.assertEqual(b'bios', Path(self.tempdir.name, 'games/NeoGeo/uni-bios.rom').read_bytes())
+        self.assertEqual(b'kept', Path(self.tempdir.name, 'games/NeoGeo/missing.rom').read_bytes())
+        self.assertFalse(sut.is_file('games/NeoGeo/other.rom'))
+
+    def test_extract_incoming_stream___with_zip_with_data_descriptors___extracts_only_requested_members(self):
+        archive = zip_bytes({'Cheats/NES/a.zip': b'a' * 5000, 'Cheats/NES/b.zip': os.urandom(3000), 'other.txt': b'other'}, seekable=False)
+        sut = self.sut()
+
+        result = sut.extract_incoming_stream(io.BytesIO(archive), 'zip', {'Cheats/NES/a.zip': 'Cheats/NES/a.zip', 'Cheats/NES/c.zip': 'Cheats/NES/c.zip'})
+
+        self.assertEqual((len(archive), hashlib.md5(archive).hexdigest(), ['Cheats/NES/c.zip']), (result.size, result.md5, result.failed_files))
+        self.assertEqual(b'a' * 5000, Path(self.tempdir.name, 'Cheats/NES/a.zip').read_bytes())
+        self.assertTrue(sut.is_file('Cheats/NES/a.zip'))
+        self.assertFalse(sut.is_file('Cheats/NES/b.zip'))
+        self.assertFalse(sut.is_file('other.txt'))
+
+    def test_extract_incoming_stream___with_zip_and_unchanged_member___leaves_it_untouched(self):
+        self.make_old_file('games/NeoGeo/uni-bios.rom', b'bios')
+        sut = self.sut()
+
+        result = sut.extract_incoming_stream(io.BytesIO(zip_bytes({'uni-bios.rom': b'bios', 'new.rom': b'new'})), 'zip', {'games/NeoGeo/uni-bios.rom': 'uni-bios.rom', 'games/NeoGeo/new.rom': 'new.rom'})
+
+        self.assertEqual([], result.failed_files)
+        self.assertEqual(1_600_000_000, os.path.getmtime(os.path.join(self.tempdir.name, 'games/NeoGeo/uni-bios.rom')))
+        self.assertEqual(b'new', Path(self.tempdir.name, 'games/NeoGeo/new.rom').read_bytes())
+
+    def test_extract_incoming_stream___with_tar_archives___extracts_only_requested_members(self):
+        for archive_format, mode in [('tar.gz', 'w:gz'), ('tar.xz', 'w:xz')]:
+            with self.subTest(archive_format):
+                archive = tar_bytes(mode, {'./docs/a.txt': b'a', 'docs/b.txt': b'b'})
+
+                result = self.sut().extract_incoming_stream(io.BytesIO(archive), archive_format, {archive_format + '/a.txt': 'docs/a.txt'})
+
+                self.assertEqual((len(archive), hashlib.md5(archive).hexdigest(), []), (result.size, result.md5, result.failed_files))
+                self.assertEqual(b'a', Path(self.tempdir.name, archive_format, 'a.txt').read_bytes())
+
+    def test_extract_incoming_stream___with_unsupported_zip_compression___raises_unsupported_archive_stream_error(self):
+        archive = zip_bytes({'a.txt': b'a' * 100}, compression=zipfile.ZIP_BZIP2)
+        self.assertRaises(UnsupportedArchiveStreamError, lambda: self.sut().extract_incoming_stream(io.BytesIO(archive), 'zip', {'a.txt': 'a.txt'}))
+
+    def test_extract_incoming_stream___when_archive_is_bigger_than_max_size___raises_stream_size_exceeded_error(self):
+        archive = zip_bytes({'a.txt': os.urandom(200000)})
+        self.assertRaises(StreamSizeExceededError, lambda: self.sut().extract_incoming_stream(io.BytesIO(archive), 'zip', {'a.txt': 'a.txt'}, max_size=1000))
+
+    def test_extract_incoming_stream___with_truncated_archive___keeps_the_installed_files(self):
+        for archive_format, archive in [('zip', zip_bytes({'a.txt': os.urandom(300000)})), ('tar.gz', tar_bytes('w:gz', {'a.txt': os.urandom(300000)})), ('tar.xz', tar_bytes('w:xz', {'a.txt': os.urandom(300000)}))]:
+            with self.subTest(archive_format):
+                self.make_old_file('a.txt', b'old')
+
+                with self.assertRaises(ArchiveStreamError):
+                    self.sut().extract_incoming_stream(io.BytesIO(archive[:len(archive) // 2]), archive_format, {'a.txt': 'a.txt'})
+
+                self.assertEqual(['a.txt'], os.listdir(self.tempdir.name))
+                self.assertEqual(b'old', Path(self.tempdir.name, 'a.txt').read_bytes())
+
+    def test_extract_incoming_stream___with_matching_expected_md5___installs_the_members(self):
+        archive = zip_bytes({'a.txt': b'a', 'b.txt': b'b'})
+
+        result = self.sut().extract_incoming_stream(io.BytesIO(archive), 'zip', {'a.txt': 'a.txt', 'b.txt': 'b.txt'}, expected_md5=hashlib.md5(archive).hexdigest())
+
+        self.assertEqual([], result.failed_files)
+        self.assertEqual(['a.txt', 'b.txt'], sorted(os.listdir(self.tempdir.name)))
+
+    def test_extract_incoming_stream___with_wrong_expected_md5___discards_every_member(self):
+        for archive_format, archive in [('zip', zip_bytes({'a.txt': b'new', 'b.txt': b'b'})), ('tar.gz', tar_bytes('w:gz', {'a.txt': b'new', 'b.txt': b'b'}))]:
+            with self.subTest(archive_format):
+                self.make_old_file('a.txt', b'old')
+
+                with self.assertRaises(ArchiveStreamHashError):
+                    self.sut().extract_incoming_stream(io.BytesIO(archive), archive_format, {'a.txt': 'a.txt', 'b.txt': 'b.txt'}, expected_md5='wrong')
+
+                self.assertEqual(['a.txt'], os.listdir(self.tempdir.name))
+                self.assertEqual(b'old', Path(self.tempdir.name, 'a.txt').read_bytes())
+
+    def test_extract_incoming_stream___when_cancelled_mid_member___keeps_the_installed_file(self):
+        self.make_old_file('a.txt', b'old')
+        archive = zip_bytes({'a.txt': os.urandom(300000)})
+        token = CancellationToken()
+        in_stream = CancellingStream([archive[:100000], archive[100000:]], token)
+
+        with self.assertRaises(JobCancelledException):
+            self.sut().extract_incoming_stream(in_stream, 'zip', {'a.txt': 'a.txt'}, token)
+
+        self.assertEqual(['a.txt'], os.listdir(self.tempdir.name))
+        self.assertEqual(b'old', Path(self.tempdir.name, 'a.txt').read_bytes())
+
+    def test_unzip_job___with_several_threads___extracts_every_member(self):
+        members = {f'folder_{i % 3}/file_{i}.txt': os.urandom(i * 100) for i in range(20)}
+        self.make_zip('contents.zip', {'empty_folder/': b'', **members})
+
+        skipped = UnzipJob(os.path.join(self.tempdir.name, 'contents.zip'), os.path.join(self.tempdir.name, 'target'), threads=4).run()
+
+        self.assertEqual(0, skipped)
+        self.assertTrue(os.path.isdir(os.path.join(self.tempdir.name, 'target', 'empty_folder')))
+        for member, content in members.items():
+            self.assertEqual(content, Path(self.tempdir.name, 'target', member).read_bytes())
+
+    def test_unzip_contents___with_described_file_matching_its_crc___does_not_rewrite_it(self):
+        sut = self.sut()
+        self.make_zip('contents.zip', {'NES/a.zip': b'a', 'NES/b.zip': b'b'})
+        self.make_old_file('Cheats/NES/a.zip', b'a')
+        self.make_old_file('Cheats/NES/b.zip', b'x')
+
+        sut.unzip_contents('contents.zip', 'Cheats', {
+            'Cheats/NES/a.zip': {'hash': '0cc175b9c0f1b6a831c399e269772661', 'size': 1},
+            'Cheats/NES/b.zip': {'hash': '92eb5ffee6ae2fec3ad71c777531578f', 'size': 1},
+        })
+
+        self.assertEqual(1_600_000_000, os.path.getmtime(os.path.join(self.tempdir.name, 'Cheats/NES/a.zip')))
+        self.assertEqual(b'b', Path(self.tempdir.name, 'Cheats/NES/b.zip').read_bytes())
+
+    def test_unzip_contents___with_existing_file_matching_its_crc___does_not_rewrite_it(self):
+        sut = self.sut()
+        self.make_zip('contents.zip', {'NES/a.zip': b'a', 'NES/b.zip': b'b'})
+        self.make_old_file('Cheats/NES/a.zip', b'a')
+        self.make_old_file('Cheats/NES/b.zip', b'x')
+
+        sut.unzip_contents('contents.zip', 'Cheats', ['Cheats/NES/a.zip', 'Cheats/NES/b.zip'])
+
+        self.assertEqual(1_600_000_000, os.path.getmtime(os.path.join(self.tempdir.name, 'Cheats/NES/a.zip')))
+        self.assertEqual(b'b', Path(self.tempdir.name, 'Cheats/NES/b.zip').read_bytes())
+
     def test_load_dict_from_file___on_plain_json___returns_json_dict(self):
         json_file = 'foo.json'
         self.sut().write_file_contents(json_file, json.dumps(foo_bar_json))
@@ -161,6 +439,38 @@ class TestFileSystem(unittest.TestCase):
         self.sut().save_json_on_zip(foo_bar_json.copy(), zip_file)
         self.assertEqual(foo_bar_json.copy(), self.sut().load_dict_from_file(zip_file))
 
+    def test_write_incoming_stream___with_append___continues_existing_file(self):
+        target = os.path.join(self.tempdir.name, 'foo')
+        self.sut().write_incoming_stream(io.BytesIO(b'abc'), target)
+        result = self.sut().write_incoming_stream(io.BytesIO(b'def'), target, append=True)
+        self.assertEqual(3, result.size)
+        self.assertEqual('abcdef', self.sut().read_file_contents(target))
+
+    def test_write_incoming_stream___on_new_file___returns_md5_of_written_content(self):
+        target = os.path.join(self.tempdir.name, 'foo')
+        result = self.sut().write_incoming_stream(io.BytesIO(b'abc'), target)
+        self.assertEqual((3, self.sut().hash(target)), (result.size, result.md5))
+
+    def test_write_incoming_stream___with_append___returns_no_md5(self):
+        target = os.path.join(self.tempdir.name, 'foo')
+        self.sut().write_incoming_stream(io.BytesIO(b'abc'), target)
+        self.assertIsNone(self.sut().write_incoming_stream(io.BytesIO(b'def'), target, append=True).md5)
+
+    def test_write_incoming_stream___bigger_than_max_size___raises(self):
+        target = os.path.join(self.tempdir.name, 'foo')
+        with self.assertRaises(StreamSizeExceededError):
+            self.sut().write_incoming_stream(io.BytesIO(b'abcdef'), target, max_size=5)
+
+    def test_write_incoming_stream___with_cancelled_token___raises_and_keeps_what_was_written(self):
+        target = os.path.join(self.tempdir.name, 'foo')
+        token = CancellationToken()
+        in_stream = CancellingStream([b'abc', b'def'], token)
+
+        with self.assertRaises(JobCancelledException):
+            self.sut().write_incoming_stream(in_stream, target, token)
+
+        self.assertEqual('abc', self.sut().read_file_contents(target))
+
     def sut(self, config=None):
         return make_production_filesystem_factory(self.default_test_config() if config is None else config).create_for_system_scope()
 
@@ -171,6 +481,17 @@ class TestFileSystem(unittest.TestCase):
         factory = self.factory({K_BASE_PATH: K_BASE_PATH, K_BASE_SYSTEM_PATH: K_BASE_SYSTEM_PATH})
         return factory.create_for_system_scope(), factory.create_for_system_scope()
 
+    def make_zip(self, name, members):
+        with zipfile.ZipFile(os.path.join(self.tempdir.name, name), 'w') as zipf:
+            for member, content in members.items():
+                zipf.writestr(member, content)
+
+    def make_old_file(self, name, content):
+        path = os.path.join(self.tempdir.name, name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        Path(path).write_bytes(content)
+        os.utime(path, (1_600_000_000, 1_600_000_000))
+
     def default_test_config(self, allow_delete=None):
         actual_config = default_config()
         actual_config[K_BASE_PATH] = self.tempdir.name
@@ -179,6 +500,48 @@ class TestFileSystem(unittest.TestCase):
         return actual_config
 
 
+class UnseekableStream:
+    def __init__(self):
+        self.buffer = io.BytesIO()
+
+    def write(self, data):
+        return self.buffer.write(data)
+
+    def flush(self):
+        pass
+
+
+def zip_bytes(members, seekable=True, compression=zipfile.ZIP_DEFLATED):
+    stream = io.BytesIO() if seekable else UnseekableStream()
+    with zipfile.ZipFile(stream, 'w', compression=compression) as zipf:
+        for member, content in members.items():
+            zipf.writestr(member, content)
+    return stream.getvalue() if seekable else stream.buffer.getvalue()
+
+
+def tar_bytes(mode, members):
+    stream = io.BytesIO()
+    with tarfile.open(fileobj=stream, mode=mode) as tar:
+        for member, content in members.items():
+            info = tarfile.TarInfo(member)
+            info.size = len(content)
+            tar.addfile(info, io.BytesIO(content))
+    return stream.getvalue()
+
+
+class CancellingStream:
+    def __init__(self, chunks, token):
+        self._chunks = chunks
+        self._token = token
+
+    def read(self, _size):
+        if len(self._chunks) == 0:
+            return b''
+        chunk = self._chunks.pop(0)
+        self._token.cancel()
+        return chunk
+
+
 def unlink(file):
     try:
         Path(file).unlink()
@@ -0,0 +1,88 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import os
+import tempfile
+import unittest
+
+from downloader.config import default_config
+from downloader.constants import K_BASE_PATH
+from downloader.file_system import FileSystemFactory
+from downloader.hash_cache import FileHashCache
+from downloader.logger import NoLogger
+
+
+class TestFileHashCache(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.cache_path = os.path.join(self.tempdir.name, 'config', 'downloader.hashes.json')
+        self.file = os.path.join(self.tempdir.name, 'foo.rbf')
+        write(self.file, b'abc', old=True)
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_get___after_saved_put___returns_hash_on_next_run(self):
+        cache = FileHashCache(self.cache_path, NoLogger())
+        cache.put(self.file, os.stat(self.file), 'cached')
+        cache.save()
+        self.assertEqual('cached', FileHashCache(self.cache_path, NoLogger()).get(self.file, os.stat(self.file)))
+
+    def test_get___when_file_changed___returns_none(self):
+        cache = FileHashCache(self.cache_path, NoLogger())
+        cache.put(self.file, os.stat(self.file), 'cached')
+        write(self.file, b'abcd', old=True)
+        self.assertIsNone(cache.get(self.file, os.stat(self.file)))
+
+    def test_get___when_file_got_a_new_inode_but_same_stat___returns_hash(self):
+        cache = FileHashCache(self.cache_path, NoLogger())
+        cache.put(self.file, os.stat(self.file), 'cached')
+        os.replace(self.file, self.file + '.old')
+        write(self.file, b'abc', old=True)
+        self.assertEqual('cached', cache.get(self.file, os.stat(self.file)))
+
+    def test_put___on_just_modified_file___is_not_cached(self):
+        write(self.file, b'abc', old=False)
+        cache = FileHashCache(self.cache_path, NoLogger())
+        cache.put(self.file, os.stat(self.file), 'cached')
+        self.assertIsNone(cache.get(self.file, os.stat(self.file)))
+
+    def test_get___with_corrupt_cache_file___returns_none(self):
+        write(self.cache_path, b'{"broken', old=False)
+        self.assertIsNone(FileHashCache(self.cache_path, NoLogger()).get(self.file, os.stat(self.file)))
+
+    def test_file_system_hash___with_cache___returns_cached_hash_until_file_changes(self):
+        cache = FileHashCache(self.cache_path, NoLogger())
+        config = default_config()
+        config[K_BASE_PATH] = self.tempdir.name
+        file_system = FileSystemFactory(config, {}, NoLogger(), hash_cache=cache).create_for_system_scope()
+
+        cache.put(self.file, os.stat(self.file), 'cached')
+        self.assertEqual('cached', file_system.hash(self.file))
+
+        write(self.file, b'', old=True)
+        self.assertEqual('d41d8cd98f00b204e9800998ecf8427e', file_system.hash(self.file))
+
+
+def write(path, content, old):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(content)
+    if old:
+        os.utime(path, (1_600_000_000, 1_600_000_000))
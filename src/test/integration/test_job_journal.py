@@ -0,0 +1,85 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+from downloader.job_journal import FileJobJournal
+from downloader.logger import NoLogger
+
+
+class TestFileJobJournal(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.tempdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tempdir.name, 'journal', 'downloader.journal')
+        self.foo = os.path.join(self.tempdir.name, 'foo.rbf')
+        with open(self.foo, 'wb') as f:
+            f.write(b'0123456789')
+
+    def tearDown(self) -> None:
+        self.tempdir.cleanup()
+
+    def test_was_validated___after_flushed_validated_entry___is_known_by_next_run(self):
+        self.journal().record_validated(self.foo, 'abc')
+        self.assertTrue(self.next_run().was_validated(self.foo, 'abc'))
+
+    def test_was_validated___with_different_hash___returns_false(self):
+        self.journal().record_validated(self.foo, 'abc')
+        self.assertFalse(self.next_run().was_validated(self.foo, 'other'))
+
+    def test_was_validated___when_file_was_rewritten_with_same_size___returns_false(self):
+        self.journal().record_validated(self.foo, 'abc')
+        os.utime(self.foo, ns=(1_600_000_000_000_000_000, 1_600_000_000_000_000_000))
+        self.assertFalse(self.next_run().was_validated(self.foo, 'abc'))
+
+    def test_record_validated___on_missing_file___records_nothing(self):
+        self.journal().record_validated(os.path.join(self.tempdir.name, 'missing.rbf'), 'abc')
+        self.assertFalse(self.next_run().was_validated(os.path.join(self.tempdir.name, 'missing.rbf'), 'abc'))
+
+    def test_load___with_truncated_last_line___keeps_previous_entries(self):
+        self.journal().record_validated(self.foo, 'abc')
+        with open(self.path, 'a') as f:
+            f.write('{"state": "vali')
+        self.assertTrue(self.next_run().was_validated(self.foo, 'abc'))
+
+    def test_clear___removes_the_journal_file(self):
+        self.journal().record_validated(self.foo, 'abc')
+        journal = self.next_run()
+        journal.clear()
+        self.assertFalse(os.path.exists(self.path))
+        self.assertFalse(journal.was_validated(self.foo, 'abc'))
+
+    def test_flush___after_several_validated_files___syncs_the_disk_once(self):
+        journal = FileJobJournal(self.path, NoLogger(), flush_interval=3600)
+        with patch('downloader.job_journal.os.sync', create=True) as sync:
+            for _ in range(3):
+                journal.record_validated(self.foo, 'abc')
+            journal.flush()
+        sync.assert_called_once_with()
+        self.assertTrue(self.next_run().was_validated(self.foo, 'abc'))
+
+    def journal(self):
+        return FileJobJournal(self.path, NoLogger(), flush_interval=0)
+
+    def next_run(self):
+        journal = FileJobJournal(self.path, NoLogger())
+        journal.load()
+        return journal
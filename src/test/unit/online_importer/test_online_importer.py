@@ -411,6 +411,10 @@ class TestOnlineImporter(OnlineImporterTestBase):
         sut = self.download_reboot_file(empty_test_store(), fs())
         self.assertReports(sut, [file_reboot], needs_reboot=True)
 
+    def test_download_reboot_file___queued_after_a_regular_file___is_installed_first(self):
+        sut = self._download_db(db_entity(files={file_a: file_a_descr(), file_reboot: file_reboot_descr()}), empty_test_store(), fs())
+        self.assertEqual([file_reboot, file_a], sut.correctly_installed_files())
+
     def test_download_reboot_file___system_already_containing_it___needs_no_reboot(self):
         sut = self.download_reboot_file(store_reboot_descr(), fs(files={file_reboot: file_reboot_descr()}))
         self.assertReportsNothing(sut)
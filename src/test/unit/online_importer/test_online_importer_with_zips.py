@@ -298,7 +298,7 @@ def db_with_unibios_from_official_url():
                     "url": "http://unibios.free.fr/download/uni-bios-40.zip",
                     "zipped_files": {
                         "files": {
-                            "/tmp/unique_temp_filename_1_neogeo_unibios/uni-bios.rom": {
+                            "uni-bios.rom": {
                                 "hash": "4f0aeda8d2d145f596826b62d563c4ef", "size": 131072}
                         },
                         "folders": {}
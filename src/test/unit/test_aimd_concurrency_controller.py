@@ -0,0 +1,69 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import unittest
+
+from downloader.jobs.concurrency import AimdConcurrencyController
+from downloader.jobs.errors import BadHttpStatusException
+from downloader.jobs.fetch_file_job import FetchFileJob
+
+
+class TestAimdConcurrencyController(unittest.TestCase):
+
+    def setUp(self):
+        self.now = 0.0
+        self.sut = AimdConcurrencyController(min_limit=2, max_limit=8, initial_limit=4, window_seconds=1.0, clock=lambda: self.now)
+
+    def test_limit___before_window_ends___stays_at_initial_limit(self):
+        self.sut.notify_transfer(1000, 1.0, 0.0)
+        self.now = 0.5
+        self.assertEqual(4, self.sut.limit())
+
+    def test_limit___while_throughput_improves___grows_one_by_one_until_max_limit(self):
+        for i in range(10):
+            self.transfer_window(1000 * (i + 1))
+        self.assertEqual(8, self.sut.limit())
+
+    def test_limit___when_throughput_stalls___holds(self):
+        self.transfer_window(1000)
+        self.transfer_window(1000)
+        self.assertEqual(5, self.sut.limit())
+
+    def test_limit___on_server_errors___halves(self):
+        self.sut.notify_job_errored(fetch_job(), BadHttpStatusException('Bad http status!', 503))
+        self.transfer_window(1000)
+        self.assertEqual(2, self.sut.limit())
+
+    def test_limit___on_not_found_errors___ignores_them(self):
+        self.sut.notify_job_errored(fetch_job(), BadHttpStatusException('Bad http status!', 404))
+        self.transfer_window(1000)
+        self.assertEqual(5, self.sut.limit())
+
+    def test_limit___when_writing_dominates_transfer_time___halves(self):
+        self.sut.notify_transfer(1000, 1.0, 0.9)
+        self.now += 1.0
+        self.assertEqual(2, self.sut.limit())
+
+    def transfer_window(self, size):
+        self.sut.notify_transfer(size, 1.0, 0.0)
+        self.now += 1.0
+        self.sut.limit()
+
+
+def fetch_job():
+    return FetchFileJob(path='a', description={}, hash_check=True)
@@ -0,0 +1,46 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import unittest
+
+from downloader.chrome_trace import ChromeTraceRecorder
+from downloader.job_system import TraceEvent
+from downloader.logger import NoLogger
+
+
+class TestChromeTraceRecorder(unittest.TestCase):
+
+    def test_trace_events___for_started_and_finished_job___returns_duration_pair_relative_to_first_event(self):
+        sut = ChromeTraceRecorder(NoLogger())
+        sut.record(TraceEvent('started', 'FakeJob', 'games/a.rbf', 'thread', 10.0, 7))
+        sut.record(TraceEvent('finished', 'FakeJob', 'games/a.rbf', 'thread', 10.5, 7))
+
+        events = sut.trace_events()
+        self.assertEqual([('FakeJob', 'B', 0, 7), ('FakeJob', 'E', 500000, 7)], [(e['name'], e['ph'], e['ts'], e['tid']) for e in events])
+        self.assertEqual({'path': 'games/a.rbf'}, events[0]['args'])
+
+    def test_trace_events___for_transferred_bytes___returns_instant_event_with_byte_count(self):
+        sut = ChromeTraceRecorder(NoLogger())
+        sut.record(TraceEvent('transferred', 'FakeJob', 'games/a.rbf', 'thread', 1.0, 7, size=1024))
+
+        event = sut.trace_events()[0]
+        self.assertEqual(('transferred', 'i', 't'), (event['name'], event['ph'], event['s']))
+        self.assertEqual({'path': 'games/a.rbf', 'job': 'FakeJob', 'bytes': 1024}, event['args'])
+
+    def test_trace_events___without_events___returns_empty_list(self):
+        self.assertEqual([], ChromeTraceRecorder(NoLogger()).trace_events())
@@ -20,7 +20,10 @@ import unittest
 
 from downloader.constants import FILE_MiSTer, FILE_MiSTer_new, FILE_MiSTer_old
 from downloader.local_repository import LocalRepository as ProductionLocalRepository
-from downloader.target_path_repository import downloader_in_progress_postfix
+from downloader.jobs.fetch_file_job import ArchiveExtraction
+from downloader.jobs.scheduling import LargestFirstPolicy
+from downloader.jobs.unzip_contents_job import UnzipContentsJob
+from downloader.target_path_repository import downloader_in_progress_postfix, downloader_in_progress_validator_postfix
 from test.fake_store_migrator import StoreMigrator
 from test.fake_external_drives_repository import ExternalDrivesRepository
 from test.fake_importer_implicit_inputs import NetworkState, FileSystemState
@@ -55,9 +58,10 @@ class TestFileDownloader(unittest.TestCase):
         self.file_system_state.set_non_base_path(self.installed_system_path, FILE_MiSTer)
         self.file_system_state.set_non_base_path(self.installed_system_path, FILE_MiSTer_new)
         self.file_system_state.set_non_base_path(self.installed_system_path, FILE_MiSTer_old)
-        file_system_factory = FileSystemFactory(state=self.file_system_state)
-        self.file_downloader_factory = FileDownloaderFactory(file_system_factory=file_system_factory, network_state=self.network_state, state=self.file_system_state)
-        self.file_system = file_system_factory.create_for_config(config)
+        self.config = config
+        self.file_system_factory = FileSystemFactory(state=self.file_system_state)
+        self.file_downloader_factory = FileDownloaderFactory(file_system_factory=self.file_system_factory, network_state=self.network_state, state=self.file_system_state)
+        self.file_system = self.file_system_factory.create_for_config(config)
         external_drives_repository = ExternalDrivesRepository(file_system=self.file_system)
         self.local_repository = ProductionLocalRepository(config, NoLogger(), self.file_system, StoreMigrator(), external_drives_repository)
         self.sut = self.file_downloader_factory.create(config, True)
@@ -88,11 +92,38 @@ class TestFileDownloader(unittest.TestCase):
             ),
             self.file_system.data
         )
-        self.assertEqual([
+        self.assertEqual(fs_records([
+            {"scope": "write_incoming_stream", "data": on_installed(downloader_in_progress_file)},
+            {"scope": "move", "data": (on_installed(downloader_in_progress_file), on_installed(file_big))},
+        ]), self.file_system.write_records)
+
+    def test_download_file___when_partial_download_from_previous_run_is_present___continues_on_the_downloader_in_progress_file(self):
+        downloader_in_progress_file = file_one + downloader_in_progress_postfix
+        self.file_system_state.add_file(self.installed_path, downloader_in_progress_file, {'hash': 'partial', 'size': 0})
+
+        self.download_one()
+        self.assertDownloaded([file_one], [file_one])
+        self.assertEqual(fs_data(files={file_one: {'hash': hash_one, 'size': 1}}, base_path='/installed'), self.file_system.data)
+        self.assertEqual(fs_records([
             {"scope": "write_incoming_stream", "data": on_installed(downloader_in_progress_file)},
-            {"scope": "copy", "data": [on_installed(downloader_in_progress_file), on_installed(file_big)]},
-            {"scope": "unlink", "data": on_installed(downloader_in_progress_file)},
-        ], self.file_system.write_records)
+            {"scope": "move", "data": (on_installed(downloader_in_progress_file), on_installed(file_one))},
+        ]), self.file_system.write_records)
+
+    def test_download_file___when_partial_download_has_a_validator_but_server_sends_whole_file___starts_over_and_drops_the_validator(self):
+        downloader_in_progress_file = file_one + downloader_in_progress_postfix
+        self.file_system_state.add_file(self.installed_path, downloader_in_progress_file, {'hash': 'partial', 'size': 1})
+        self.file_system_state.add_file(self.installed_path, file_one + downloader_in_progress_validator_postfix, {'hash': 'validator', 'size': 1, 'content': '"etag"'})
+        self.network_state.remote_files[file_one] = {'hash': hash_one, 'size': 2}
+
+        self.sut.queue_file({'url': 'https://fake.com/bar', 'hash': hash_one, 'size': 2}, file_one)
+        self.sut.download_files(False)
+        self.assertDownloaded([file_one], [file_one])
+        self.assertEqual(fs_data(files={file_one: {'hash': hash_one, 'size': 2}}, base_path='/installed'), self.file_system.data)
+
+    def test_download_files_one___without_url___returns_error_without_running_it(self):
+        self.sut.queue_file({'hash': hash_one, 'size': 1}, file_one)
+        self.sut.download_files(False)
+        self.assertDownloaded([], run=[], errors=[file_one])
 
     def test_download_files_one___from_scratch_could_not_download___return_errors(self):
         self.network_state.remote_failures[file_one] = 99
@@ -102,7 +133,13 @@ class TestFileDownloader(unittest.TestCase):
     def test_download_files_one___from_scratch_no_matching_hash___return_errors(self):
         self.network_state.remote_files[file_one] = {'hash': 'wrong',  'size': 1}
         self.download_one()
-        self.assertDownloaded([], run=[file_one, file_one, file_one, file_one], errors=[file_one])
+        self.assertDownloaded([], run=[file_one, file_one], errors=[file_one])
+
+    def test_download_files_one___when_remote_file_is_bigger_than_expected___return_errors_without_leaving_files(self):
+        self.network_state.remote_files[file_one] = {'hash': hash_one, 'size': 2}
+        self.download_one()
+        self.assertDownloaded([], run=[file_one, file_one], errors=[file_one])
+        self.assertFalse(self.file_system.is_file(on_installed(file_one)))
 
     def test_download_files_one___from_scratch_no_file_exists___return_errors(self):
         self.network_state.storing_problems.add(file_one)
@@ -133,6 +170,56 @@ class TestFileDownloader(unittest.TestCase):
             {'scope': 'move', 'data': (on_installed_system(FILE_MiSTer_new), on_installed_system(FILE_MiSTer))},
         ]), self.file_system.write_records)
 
+    def test_download_archive___with_extraction___extracts_its_members_without_storing_the_archive(self):
+        extraction = ArchiveExtraction(files={file_one: file_one, 'missing': 'missing'}, archive_format='zip')
+        self.sut.queue_file({'url': 'https://fake.com/contents.zip', 'hash': 'contents', 'size': 10, 'zipped_files': {'files': {file_one: {'hash': hash_one, 'size': 1}}, 'folders': {}}}, 'contents.zip', extraction)
+        self.sut.download_files(False)
+        self.assertDownloaded(['contents.zip'], ['contents.zip'])
+        self.assertFalse(self.file_system.is_file('contents.zip'))
+        self.assertEqual(['missing'], extraction.failed_files)
+        self.assertEqual(fs_records([
+            {'scope': 'extract_incoming_stream', 'data': on_installed(file_one)},
+        ]), self.file_system.write_records)
+
+    def test_download_archive___with_extraction_that_could_not_be_streamed___unzips_it_after_validation_and_removes_it(self):
+        extraction = ArchiveExtraction(files={file_one: file_one}, archive_format='zip', streamed=False)
+        self.sut.queue_file({'url': 'https://fake.com/contents.zip', 'hash': 'contents', 'size': 10, 'zipped_files': {'files': {file_one: {'hash': hash_one, 'size': 1}}, 'folders': {}}}, 'contents.zip', extraction, UnzipContentsJob(zip_path='contents.zip', extraction=extraction))
+        self.sut.download_files(False)
+        self.assertDownloaded(['contents.zip'], ['contents.zip'])
+        self.assertEqual(fs_records([
+            {'scope': 'write_incoming_stream', 'data': on_installed('contents.zip')},
+            {'scope': 'unzip_files', 'data': (on_installed('contents.zip'), on_installed(file_one))},
+            {'scope': 'unlink', 'data': on_installed('contents.zip')},
+        ]), self.file_system.write_records)
+
+    def test_download_archive___with_extraction_that_could_not_be_streamed_when_unzip_fails___removes_it_anyway(self):
+        extraction = ArchiveExtraction(files={}, archive_format='zip', streamed=False)
+        self.sut.queue_file({'url': 'https://fake.com/contents.zip', 'hash': 'contents', 'size': 10}, 'contents.zip', extraction, UnzipContentsJob(zip_path='contents.zip', extraction=extraction, target_folder_path='games'))
+        self.sut.download_files(False)
+        self.assertDownloaded([], run=['contents.zip'], errors=['contents.zip'])
+        self.assertFalse(self.file_system.is_file('contents.zip'))
+
+    def test_download_archive___with_extraction_that_could_not_be_streamed_nor_downloaded___does_not_unzip_it(self):
+        self.network_state.remote_failures['contents.zip'] = 99
+        extraction = ArchiveExtraction(files={file_one: file_one}, archive_format='zip', streamed=False)
+        self.sut.queue_file({'url': 'https://fake.com/contents.zip', 'hash': 'contents', 'size': 10}, 'contents.zip', extraction, UnzipContentsJob(zip_path='contents.zip', extraction=extraction))
+        self.sut.download_files(False)
+        self.assertDownloaded([], run=['contents.zip'] * 4, errors=['contents.zip'])
+        self.assertNotIn('unzip_files', [record['scope'] for record in self.file_system.write_records])
+
+    def test_download_files___with_boot_critical_files_queued_last___downloads_them_first(self):
+        self.sut.queue_file({'url': 'https://fake.com/bar', 'hash': hash_one, 'size': 1}, file_one)
+        self.sut.queue_file(file_mister_descr(), FILE_MiSTer)
+        self.sut.queue_file({'url': 'https://fake.com/bar', 'hash': hash_menu_rbf, 'reboot': True, 'path': 'system', 'size': 23}, file_menu_rbf)
+        self.sut.download_files(False)
+        self.assertEqual([FILE_MiSTer, file_menu_rbf, file_one], self.sut.run_files())
+
+    def test_download_files___with_largest_first_policy___downloads_big_file_before_small_one(self):
+        self.sut = FileDownloaderFactory(file_system_factory=self.file_system_factory, network_state=self.network_state, state=self.file_system_state, scheduling_policy=LargestFirstPolicy()).create(self.config, True)
+        self.sut.queue_file({'url': 'https://fake.com/bar', 'hash': hash_one, 'size': 1}, file_one)
+        self.download_big_file(hash_big)
+        self.assertEqual([file_big, file_one], self.sut.run_files())
+
     def assertDownloaded(self, oks, run=None, errors=None):
         self.assertEqual(oks, self.sut.correctly_downloaded_files())
         self.assertEqual(errors if errors is not None else [], self.sut.errors())
@@ -16,9 +16,10 @@
 # You can download the latest version of this tool from:
 # https://github.com/MiSTer-devel/Downloader_MiSTer
 
-from downloader.job_system import Job, JobSystem, Worker, CycleDetectedException, ProgressReporter, NoWorkerException, CantRegisterWorkerException
+from downloader.job_system import Job, JobSystem, Worker, CycleDetectedException, ProgressReporter, NoWorkerException, CantRegisterWorkerException, ProcessJob, ProcessLane, DependencyFailedException, Backoff, FixedConcurrencyController, JobCancelledException, JobTracer, TraceEvent
 import logging
-from typing import Dict, Optional
+import os
+from typing import Dict, List, Optional
 import unittest
 
 
@@ -67,16 +68,31 @@ class TestJobSystem(unittest.TestCase):
         self.assertReports(started={1: 1}, in_progress={1: 1}, pending=1)
 
     def test_cycle_detection___throws(self):
-        self.system.register_worker(1, TestWorker(self.system))
-        self.system.register_worker(2, TestWorker(self.system))
+        system = JobSystem(reporter=self.reporter, max_threads=1)
+        system.register_worker(1, TestWorker(system))
+        system.register_worker(2, TestWorker(system))
 
-        self.system.push_job(TestJob(1, TestJob(2, TestJob(1, TestJob(2)))))
+        system.push_job(TestJob(1, TestJob(2, TestJob(1, TestJob(2)))))
 
         with self.assertRaises(Exception) as context:
-            self.system.accomplish_pending_jobs()
+            system.accomplish_pending_jobs()
 
         self.assertIsInstance(context.exception, CycleDetectedException)
-        self.assertReports(completed={1: 1, 2: 1}, started={1: 1, 2: 1}, in_progress={}, pending=2)
+        self.assertReports(completed={1: 1, 2: 1}, started={1: 1, 2: 1}, in_progress={})
+
+    def test_cycle_detection___when_job_pushes_its_own_type___throws(self):
+        self.system.register_worker(1, TestWorker(self.system))
+        self.system.push_job(TestJob(1, TestJob(1)))
+        self.assertRaises(CycleDetectedException, self.system.accomplish_pending_jobs)
+
+    def test_cycle_detection___when_retried_job_pushes_an_ancestor_type___throws(self):
+        system = JobSystem(reporter=self.reporter, max_threads=1)
+        system.register_worker(1, TestWorker(system))
+        system.register_worker(2, TestWorker(system))
+
+        system.push_job(TestJob(1, TestJob(2, TestJob(1), fails=1)))
+
+        self.assertRaises(CycleDetectedException, system.accomplish_pending_jobs)
 
     def test_register_worker_during_accomplish_pending_jobs___throws(self):
         self.system.register_worker(1, TestWorker(self.system))
@@ -138,6 +154,18 @@ class TestJobSystem(unittest.TestCase):
         self.system.accomplish_pending_jobs()
         self.assertReports(completed={1: 1, 2: 1, 3: 1, 4: 1})
 
+    def test_cancellation_token___when_job_gets_cancelled_while_running___keeps_it_pending_until_next_accomplish(self):
+        self.system.register_worker(1, TestWorker(self.system))
+        self.system.register_worker(2, TestWorker(self.system))
+
+        self.system.push_job(TestJob(1, cancel_in_flight_jobs=True, next_job=TestJob(2)))
+
+        self.system.accomplish_pending_jobs()
+        self.assertReports(started={1: 1}, retried={1: 1}, pending=1)
+
+        self.system.accomplish_pending_jobs()
+        self.assertReports(completed={1: 1, 2: 1}, started={1: 2, 2: 1}, retried={1: 1})
+
     def test_throwing_reporter_during_retries___does_not_incur_in_infinite_loop(self):
         class TestThrowingReporter(TestProgressReporter):
             def notify_job_retried(self, job: 'Job', exception: Exception):
@@ -178,6 +206,180 @@ class TestJobSystem(unittest.TestCase):
         self.assertEqual({}, reporter.failed_jobs)
         self.assertEqual(0, system.pending_jobs_amount())
 
+    def test_push_job_depending_on_another___runs_after_it_and_the_jobs_it_pushed(self):
+        order = []
+        self.system.register_worker(1, TestWorker(self.system, order))
+        self.system.register_worker(2, TestWorker(self.system, order))
+        self.system.register_worker(3, TestWorker(self.system, order))
+
+        first = self.system.push_job(TestJob(1, next_job=TestJob(2)))
+        self.system.push_job(TestJob(3), priority=-1, depends_on=[first])
+        self.system.accomplish_pending_jobs()
+
+        self.assertEqual([1, 2, 3], order)
+        self.assertReports(completed={1: 1, 2: 1, 3: 1})
+
+    def test_push_job_depending_on_retried_job___runs_once_the_retry_succeeds(self):
+        order = []
+        self.system.register_worker(1, TestWorker(self.system, order))
+        self.system.register_worker(2, TestWorker(self.system, order))
+
+        first = self.system.push_job(TestJob(1, fails=2))
+        self.system.push_job(TestJob(2), priority=-1, depends_on=[first])
+        self.system.accomplish_pending_jobs()
+
+        self.assertEqual([1, 2], order)
+        self.assertReports(completed={1: 1, 2: 1}, started={1: 3, 2: 1}, retried={1: 2})
+
+    def test_push_job_depending_on_failed_job___fails_without_running(self):
+        self.system.register_worker(1, TestWorker(self.system))
+        self.system.register_worker(2, TestWorker(self.system))
+        self.system.register_worker(3, TestWorker(self.system))
+
+        first = self.system.push_job(TestJob(1, next_job=TestJob(2, fails=99)))
+        self.system.push_job(TestJob(3), depends_on=[first])
+        self.system.accomplish_pending_jobs()
+
+        self.assertTrue(first.failed)
+        self.assertIsInstance(self.reporter.exceptions[3], DependencyFailedException)
+        self.assertReports(completed={1: 1}, started={1: 1, 2: 4}, retried={2: 3}, failed={2: 1, 3: 1})
+
+    def test_retries___when_worker_backoff_is_none___fails_without_retrying(self):
+        self.system.register_worker(1, TestWorker(self.system, backoff=None))
+        self.system.push_job(TestJob(1, fails=1))
+        self.system.accomplish_pending_jobs()
+        self.assertReports(started={1: 1}, failed={1: 1})
+        self.assertEqual(1, self.system.retry_stats().fatal_failures)
+
+    def test_retries___when_worker_backoff_has_max_tries___fails_after_those_tries(self):
+        self.system.register_worker(1, TestWorker(self.system, backoff=Backoff(max_tries=1)))
+        self.system.push_job(TestJob(1, fails=3))
+        self.system.accomplish_pending_jobs()
+        self.assertReports(started={1: 2}, retried={1: 1}, failed={1: 1})
+
+    def test_retries___with_retry_delay___waits_before_retrying_and_reports_it_in_stats(self):
+        for system in [JobSystem(reporter=self.reporter, max_retry_delay=0.05), JobSystem(reporter=TestProgressReporter(), max_threads=1, max_retry_delay=0.05)]:
+            system.register_worker(1, TestWorker(system, backoff=Backoff(base_delay=0.05, max_delay=0.05)))
+            system.push_job(TestJob(1, fails=2))
+            system.accomplish_pending_jobs()
+
+            self.assertEqual(0, system.pending_jobs_amount())
+            self.assertEqual(2, system.retry_stats().retries)
+            self.assertGreater(system.retry_stats().total_delay, 0)
+            self.assertLessEqual(system.retry_stats().longest_delay, 0.05)
+        self.assertReports(completed={1: 1}, started={1: 3}, retried={1: 2})
+
+    def test_accomplish_pending_jobs___with_in_flight_limit_of_one___runs_jobs_by_priority(self):
+        class OneInFlight(FixedConcurrencyController):
+            def max_limit(self): return 4
+
+        order = []
+        system = JobSystem(reporter=self.reporter, concurrency_controller=OneInFlight(1))
+        system.register_worker(1, TestWorker(system, order))
+        system.register_worker(2, TestWorker(system, order))
+        system.register_worker(3, TestWorker(system, order))
+
+        system.push_job(TestJob(3), priority=30)
+        system.push_job(TestJob(1), priority=10)
+        system.push_job(TestJob(2), priority=20)
+        system.accomplish_pending_jobs()
+
+        self.assertEqual([1, 2, 3], order)
+
+    def test_push_jobs___with_priority_fn___runs_the_batch_by_priority(self):
+        order = []
+        system = JobSystem(reporter=self.reporter, max_threads=1)
+        system.register_worker(1, TestWorker(system, order))
+        system.register_worker(2, TestWorker(system, order))
+        system.register_worker(3, TestWorker(system, order))
+
+        handles = system.push_jobs([TestJob(3), TestJob(1), TestJob(2)], lambda job: job.type_id)
+        self.assertEqual(3, len(handles))
+        self.assertEqual(3, system.pending_jobs_amount())
+
+        system.accomplish_pending_jobs()
+        self.assertEqual([1, 2, 3], order)
+        self.assertTrue(all(handle.done for handle in handles))
+
+    def test_push_job_depending_on_jobs_pushed_in_bulk___runs_after_all_of_them(self):
+        order = []
+        self.system.register_worker(1, TestWorker(self.system, order))
+        self.system.register_worker(2, TestWorker(self.system, order))
+        self.system.register_worker(3, TestWorker(self.system, order))
+
+        handles = self.system.push_jobs([TestJob(1), TestJob(1, next_job=TestJob(3))])
+        self.system.push_job(TestJob(2), priority=-1, depends_on=handles)
+        self.system.accomplish_pending_jobs()
+
+        self.assertEqual([1, 1, 3, 2], order)
+
+    def test_push_job_source___with_small_queue___takes_jobs_lazily_and_runs_them_all(self):
+        taken = []
+        system = JobSystem(reporter=self.reporter, max_threads=1, max_queued_jobs=2)
+        system.register_worker(1, TestWorker(system, taken))
+
+        def jobs():
+            for _ in range(5):
+                taken.append(0)
+                yield TestJob(1)
+
+        system.push_job_source(jobs())
+        self.assertEqual([], taken)
+
+        system.accomplish_pending_jobs()
+        self.assertEqual([0, 0, 1, 0, 1, 0, 1, 0, 1, 1], taken)
+        self.assertReports(completed={1: 5})
+
+    def test_push_job___after_completion___handle_releases_its_package(self):
+        self.system.register_worker(1, TestWorker(self.system))
+        self.system.register_worker(2, TestWorker(self.system))
+        handle = self.system.push_job(TestJob(1, next_job=TestJob(2)))
+        self.system.accomplish_pending_jobs()
+
+        self.assertTrue(handle.done)
+        self.assertIsNone(handle.package)
+
+    def test_tracer___when_job_fails_once___records_its_whole_lifecycle(self):
+        tracer = TestTracer()
+        system = JobSystem(reporter=self.reporter, max_threads=1, tracer=tracer)
+        system.register_worker(1, TestWorker(system))
+
+        system.push_job(TestJob(1, fails=1))
+        system.accomplish_pending_jobs()
+
+        self.assertEqual(['queued', 'started', 'finished', 'retried', 'started', 'finished'], [e.event for e in tracer.events])
+        self.assertEqual({'main'}, {e.lane for e in tracer.events})
+        self.assertEqual({'TestJob'}, {e.job_type for e in tracer.events})
+
+    def test_tracer___with_threads___records_failures_on_thread_lane(self):
+        tracer = TestTracer()
+        system = JobSystem(reporter=self.reporter, tracer=tracer)
+        system.register_worker(1, TestWorker(system, backoff=None))
+
+        system.push_job(TestJob(1, fails=1))
+        system.accomplish_pending_jobs()
+
+        self.assertEqual(['queued', 'started', 'finished', 'failed'], [e.event for e in tracer.events])
+        self.assertEqual('thread', tracer.events[-1].lane)
+
+    def test_offload___without_processes___runs_job_in_current_process(self):
+        self.assertEqual(os.getpid(), ProcessLane(max_processes=0).offload(TestProcessJob()))
+
+    def test_offload___with_processes___runs_job_in_another_process(self):
+        lane = ProcessLane(max_processes=1)
+        try:
+            self.assertNotEqual(os.getpid(), lane.offload(TestProcessJob()))
+        finally:
+            lane.shutdown()
+
+    def test_offload___when_process_job_throws___raises_same_exception(self):
+        lane = ProcessLane(max_processes=1)
+        try:
+            with self.assertRaises(FileNotFoundError):
+                lane.offload(TestProcessJob(fails=True))
+        finally:
+            lane.shutdown()
+
     def assertReports(self, completed: Optional[Dict[int, int]] = None, started: Optional[Dict[int, int]] = None, in_progress: Optional[Dict[int, int]] = None, failed: Optional[Dict[int, int]] = None, retried: Optional[Dict[int, int]] = None, pending: int = 0):
         self.assertEqual({
             'completed_jobs': completed or {},
@@ -197,13 +399,14 @@ class TestJobSystem(unittest.TestCase):
 
 
 class TestJob(Job):
-    def __init__(self, type_id: int, next_job: Optional['TestJob'] = None, retry_job: Optional['TestJob'] = None, fails: int = 0, register_worker: Optional[Worker] = None, cancel_pending_jobs: bool = False):
+    def __init__(self, type_id: int, next_job: Optional['TestJob'] = None, retry_job: Optional['TestJob'] = None, fails: int = 0, register_worker: Optional[Worker] = None, cancel_pending_jobs: bool = False, cancel_in_flight_jobs: bool = False):
         self._type_id = type_id
         self._retry_job = retry_job
         self.next_job = next_job
         self.fails = fails
         self.register_worker = register_worker
         self.cancel_pending_jobs = cancel_pending_jobs
+        self.cancel_in_flight_jobs = cancel_in_flight_jobs
 
     @property
     def type_id(self) -> int:
@@ -216,15 +419,39 @@ class TestJob(Job):
         return super().retry_job()
 
 
+class TestProcessJob(ProcessJob):
+    def __init__(self, fails: bool = False):
+        self.fails = fails
+
+    def run(self) -> int:
+        if self.fails:
+            raise FileNotFoundError('Fails!')
+        return os.getpid()
+
+
 class TestWorker(Worker):
-    def __init__(self, system: JobSystem):
+    def __init__(self, system: JobSystem, order: Optional[List[int]] = None, backoff: Optional[Backoff] = Backoff()):
         self.system = system
+        self.order = order
+        self._backoff = backoff
+
+    def backoff(self, job: Job, exception: BaseException) -> Optional[Backoff]:
+        return self._backoff
 
     def operate_on(self, job: TestJob) -> None:
         if job.fails > 0:
             job.fails -= 1
             raise Exception('Fails!')
 
+        if job.cancel_in_flight_jobs:
+            job.cancel_in_flight_jobs = False
+            self.system.cancel_pending_jobs()
+            self.system.cancellation_token().cancel()
+            self.system.cancellation_token().raise_if_cancelled()
+
+        if self.order is not None:
+            self.order.append(job.type_id)
+
         if job.next_job is not None:
             self.system.push_job(job.next_job)
 
@@ -235,6 +462,14 @@ class TestWorker(Worker):
             self.system.register_worker(99, job.register_worker)
 
 
+class TestTracer(JobTracer):
+    def __init__(self):
+        self.events: List[TraceEvent] = []
+
+    def record(self, event: TraceEvent) -> None:
+        self.events.append(event)
+
+
 class TestProgressReporter(ProgressReporter):
 
     def __init__(self):
@@ -243,6 +478,7 @@ class TestProgressReporter(ProgressReporter):
         self.completed_jobs = {}
         self.failed_jobs = {}
         self.retried_jobs = {}
+        self.exceptions = {}
 
     def notify_work_in_progress(self):
         pass
@@ -257,6 +493,7 @@ class TestProgressReporter(ProgressReporter):
 
     def notify_job_failed(self, job: 'Job', exception: BaseException):
         self.failed_jobs[job.type_id] = self.failed_jobs.get(job.type_id, 0) + 1
+        self.exceptions[job.type_id] = exception
         self._remove_in_progress(job)
 
     def notify_job_retried(self, job: 'Job', exception: BaseException):
@@ -0,0 +1,59 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+
+import unittest
+
+from downloader.jobs.scheduling import QueueOrderPolicy, LargestFirstPolicy, SmallestFirstPolicy, RoundRobinByDatabasePolicy, GroupedByDirectoryPolicy
+
+
+class TestSchedulingPolicies(unittest.TestCase):
+
+    def test_queue_order___returns_same_order(self):
+        self.assertEqual(paths(queue()), paths(QueueOrderPolicy().order(queue())))
+
+    def test_largest_first___returns_headers_and_then_files_by_descending_size(self):
+        self.assertEqual(['[a]', '[b]', 'a/y/3', 'b/x/4', 'a/x/1', 'a/y/2', 'a/x/5'], paths(LargestFirstPolicy().order(queue())))
+
+    def test_smallest_first___returns_headers_and_then_files_by_ascending_size(self):
+        self.assertEqual(['[a]', '[b]', 'a/x/5', 'a/y/2', 'a/x/1', 'b/x/4', 'a/y/3'], paths(SmallestFirstPolicy().order(queue())))
+
+    def test_round_robin_by_database___alternates_databases_keeping_each_header_before_its_files(self):
+        self.assertEqual(['[a]', '[b]', 'a/x/1', 'b/x/4', 'a/y/2', 'a/y/3', 'a/x/5'], paths(RoundRobinByDatabasePolicy().order(queue())))
+
+    def test_grouped_by_directory___keeps_files_of_the_same_directory_together(self):
+        self.assertEqual(['[a]', '[b]', 'a/x/1', 'a/x/5', 'a/y/2', 'a/y/3', 'b/x/4'], paths(GroupedByDirectoryPolicy().order(queue())))
+
+    def test_every_policy___with_nothing_queued___returns_nothing(self):
+        for policy in [QueueOrderPolicy(), LargestFirstPolicy(), SmallestFirstPolicy(), RoundRobinByDatabasePolicy(), GroupedByDirectoryPolicy()]:
+            self.assertEqual([], policy.order([]))
+
+
+def queue():
+    return [
+        ('[a]', {'db': 'a'}),
+        ('a/x/1', {'size': 30}),
+        ('a/y/2', {'size': 20}),
+        ('a/y/3', {'size': 50}),
+        ('a/x/5', {'size': 10}),
+        ('[b]', {'db': 'b'}),
+        ('b/x/4', {'size': 40}),
+    ]
+
+
+def paths(files):
+    return [path for path, _ in files]
@@ -0,0 +1,89 @@
+# Copyright (c) 2021-2022 José Manuel Barroso Galindo <theypsilon@gmail.com>
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# You can download the latest version of this tool from:
+# https://github.com/MiSTer-devel/Downloader_MiSTer
+import unittest
+
+from downloader.target_path_repository import RamStagingBudget, downloader_in_progress_postfix
+from test.fake_file_system_factory import FileSystemFactory, first_fake_temp_file
+from test.fake_importer_implicit_inputs import FileSystemState
+from test.fake_target_path_repository import TargetPathRepository
+from test.objects import file_one, file_big, big_size, file_a
+
+
+class TestTargetPathRepository(unittest.TestCase):
+
+    def setUp(self) -> None:
+        self.state = FileSystemState()
+        self.file_system_factory = FileSystemFactory(state=self.state)
+        self.file_system = self.file_system_factory.create_for_config(self.state.config)
+        self.sut = TargetPathRepository(self.state.config, self.file_system, RamStagingBudget(10))
+
+    def test_create_target___on_missing_file___writes_in_place(self):
+        self.assertEqual(self.full(file_one), self.sut.create_target(file_one, {'size': 1}))
+
+    def test_create_target___on_existing_small_file___stages_it_next_to_the_target(self):
+        self.add_files(file_one)
+        self.assertEqual(self.full(file_one) + downloader_in_progress_postfix, self.sut.create_target(file_one, {'size': 1}))
+
+    def test_create_target___on_existing_small_file_without_room_next_to_the_target___stages_it_in_ram(self):
+        self.add_files(file_one)
+        self.file_system_factory.set_free_space(0)
+        self.assertEqual(first_fake_temp_file, self.sut.create_target(file_one, {'size': 1}))
+
+    def test_create_target___on_existing_big_file_without_room_next_to_the_target___stages_it_next_to_the_target(self):
+        self.add_files(file_big)
+        self.file_system_factory.set_free_space(0)
+        self.assertEqual(self.full(file_big) + downloader_in_progress_postfix, self.sut.create_target(file_big, {'size': big_size}))
+
+    def test_create_target___when_ram_budget_is_spent___stages_it_next_to_the_target(self):
+        self.add_files(file_one, file_a)
+        self.file_system_factory.set_free_space(0)
+        self.sut.create_target(file_one, {'size': 8})
+        self.assertEqual(self.full(file_a) + downloader_in_progress_postfix, self.sut.create_target(file_a, {'size': 8}))
+
+    def test_create_target___after_ram_staged_file_is_finished___stages_next_one_in_ram_again(self):
+        self.add_files(file_one, file_a)
+        self.file_system_factory.set_free_space(0)
+        self.file_system.touch(self.sut.create_target(file_one, {'size': 8}))
+        self.sut.finish_target(file_one)
+        self.assertTrue(self.sut.create_target(file_a, {'size': 8}).startswith('/tmp/'))
+
+    def test_finish_target___on_file_staged_next_to_the_target___moves_it_without_copying(self):
+        self.add_files(file_big)
+        self.file_system.touch(self.sut.create_target(file_big, {'size': big_size}))
+        self.sut.finish_target(file_big)
+        self.assertEqual(['touch', 'move'], [record['scope'] for record in self.file_system.write_records])
+
+    def test_take_resume_validator___after_keeping_partial_target_with_validator___returns_it_only_once(self):
+        self.file_system.touch(self.sut.create_target(file_big, {'size': big_size}))
+        self.sut.keep_partial_target(file_big, '"etag"')
+
+        self.assertEqual('"etag"', self.sut.take_resume_validator(file_big))
+        self.assertIsNone(self.sut.take_resume_validator(file_big))
+
+    def test_take_resume_validator___after_keeping_partial_target_that_was_never_written___returns_none(self):
+        self.sut.create_target(file_big, {'size': big_size})
+        self.sut.keep_partial_target(file_big, '"etag"')
+
+        self.assertIsNone(self.sut.take_resume_validator(file_big))
+
+    def add_files(self, *files):
+        for file in files:
+            self.state.add_file(None, file, {'hash': file, 'size': 1})
+
+    def full(self, file):
+        return self.file_system.download_target_path(file)